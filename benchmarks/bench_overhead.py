@@ -0,0 +1,219 @@
+"""
+框架侧开销基准测试：Predict vs ChainOfThought
+
+在离线桩 LM（examples/stub_lm.py，零延迟）上逐个运行示例中的 Signature，
+分别统计每次调用的:
+- 总耗时 p50/p95、其中 LM 本身的耗时与框架耗时（总耗时 - LM 耗时）
+- 适配器格式化（format）与输出解析（parse）耗时
+- prompt / completion token 数
+- 内存分配峰值（tracemalloc，单独一轮测量，避免影响计时）
+
+结果写入 JSON，可以与之前的结果对比发现性能回退:
+    python benchmarks/bench_overhead.py -n 200
+    python benchmarks/bench_overhead.py --baseline benchmarks/results/overhead.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "examples"))
+
+import dspy  # noqa: E402
+from dspy.utils.callback import BaseCallback  # noqa: E402
+
+from signatures import CASES  # noqa: E402
+from stub_lm import StubLM  # noqa: E402
+
+DEFAULT_OUTPUT = ROOT / "benchmarks" / "results" / "overhead.json"
+MODULES = {"Predict": dspy.Predict, "ChainOfThought": dspy.ChainOfThought}
+
+
+class PhaseTimer(BaseCallback):
+    """通过 DSPy 回调累计适配器 format / parse 以及 LM 调用的耗时"""
+
+    def __init__(self):
+        self.totals = {"format": 0.0, "parse": 0.0, "lm": 0.0}
+        self._starts = {}
+
+    def reset(self):
+        for key in self.totals:
+            self.totals[key] = 0.0
+
+    def _start(self, call_id):
+        self._starts[call_id] = time.perf_counter()
+
+    def _end(self, call_id, phase):
+        self.totals[phase] += time.perf_counter() - self._starts.pop(call_id)
+
+    def on_adapter_format_start(self, call_id, instance, inputs):
+        self._start(call_id)
+
+    def on_adapter_format_end(self, call_id, outputs, exception=None):
+        self._end(call_id, "format")
+
+    def on_adapter_parse_start(self, call_id, instance, inputs):
+        self._start(call_id)
+
+    def on_adapter_parse_end(self, call_id, outputs, exception=None):
+        self._end(call_id, "parse")
+
+    def on_lm_start(self, call_id, instance, inputs):
+        self._start(call_id)
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        self._end(call_id, "lm")
+
+    # 只有 dspy.LM 会触发 on_lm_*，其他 BaseLM 子类（如 StubLM）按模块回调处理
+    def on_module_start(self, call_id, instance, inputs):
+        if isinstance(instance, dspy.BaseLM):
+            self._start(call_id)
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        if call_id in self._starts:
+            self._end(call_id, "lm")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def bench_case(module, inputs, lm, timer, iterations, warmup):
+    for _ in range(warmup):
+        module(**inputs)
+
+    total, framework, fmt, parse = [], [], [], []
+    for _ in range(iterations):
+        timer.reset()
+        start = time.perf_counter()
+        module(**inputs)
+        elapsed = time.perf_counter() - start
+        total.append(elapsed * 1000)
+        framework.append((elapsed - timer.totals["lm"]) * 1000)
+        fmt.append(timer.totals["format"] * 1000)
+        parse.append(timer.totals["parse"] * 1000)
+
+    usage = lm.history[-1]["usage"]
+
+    # 单独一轮测量内存分配，tracemalloc 会显著拖慢计时
+    tracemalloc.start()
+    peaks = []
+    for _ in range(max(1, iterations // 10)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        module(**inputs)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append((peak - baseline) / 1024)
+    tracemalloc.stop()
+
+    return {
+        "latency_ms": summarize(total),
+        "framework_ms": summarize(framework),
+        "format_ms": summarize(fmt),
+        "parse_ms": summarize(parse),
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "alloc_peak_kib": statistics.fmean(peaks),
+    }
+
+
+def run(iterations, warmup):
+    lm = StubLM()
+    timer = PhaseTimer()
+    dspy.configure(lm=lm, callbacks=[timer])
+
+    results = {}
+    for name, signature, inputs in CASES:
+        for module_name, module_cls in MODULES.items():
+            key = f"{name}/{module_name}"
+            results[key] = bench_case(module_cls(signature), inputs, lm, timer, iterations, warmup)
+            # 只保留最近的历史，避免历史记录本身成为开销
+            lm.history.clear()
+    return results
+
+
+def print_table(results):
+    header = f"{'用例':<34}{'p50(ms)':>9}{'p95(ms)':>9}{'框架p50':>9}{'format':>8}{'parse':>8}{'prompt':>8}{'compl':>7}{'KiB':>8}"
+    print(header)
+    print("-" * len(header))
+    for key, r in results.items():
+        print(
+            f"{key:<34}{r['latency_ms']['p50']:>9.3f}{r['latency_ms']['p95']:>9.3f}"
+            f"{r['framework_ms']['p50']:>9.3f}{r['format_ms']['p50']:>8.3f}{r['parse_ms']['p50']:>8.3f}"
+            f"{r['prompt_tokens']:>8}{r['completion_tokens']:>7}{r['alloc_peak_kib']:>8.1f}"
+        )
+
+
+def compare(results, baseline_path, threshold):
+    """与基线结果对比 p50 框架耗时和 token 数，返回发生回退的用例"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))["results"]
+    regressions = []
+    print(f"\n与基线对比（{baseline_path}）:")
+    for key, r in results.items():
+        if key not in baseline:
+            continue
+        old, new = baseline[key]["framework_ms"]["p50"], r["framework_ms"]["p50"]
+        change = (new - old) / old if old else 0.0
+        tokens_changed = r["prompt_tokens"] != baseline[key]["prompt_tokens"]
+        flag = ""
+        if change > threshold or tokens_changed:
+            regressions.append(key)
+            flag = "  ⚠ 回退"
+        print(f"  {key:<34}{old:>9.3f} → {new:>9.3f} ms ({change:+.1%}){flag}")
+        if tokens_changed:
+            print(f"    prompt tokens: {baseline[key]['prompt_tokens']} → {r['prompt_tokens']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict vs ChainOfThought 框架开销基准测试")
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="每个用例的计时调用次数")
+    parser.add_argument("--warmup", type=int, default=20, help="预热调用次数")
+    parser.add_argument("-o", "--output", default=str(DEFAULT_OUTPUT), help="结果 JSON 的输出路径")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON")
+    parser.add_argument("--threshold", type=float, default=0.20, help="判定回退的 p50 增幅（默认 20%%）")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.warmup)
+    print_table(results)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "dspy": dspy.__version__,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n结果已写入 {output}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
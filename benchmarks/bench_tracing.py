@@ -0,0 +1,130 @@
+"""
+追踪开销基准测试
+
+在离线桩 LM 上交替运行三组调用，开销占比都相对于实际测得的「不追踪」耗时:
+- 不追踪：没有任何回调
+- 空回调：只注册一个什么都不做的 BaseCallback，测出 DSPy 自身的回调分发开销
+  （有回调时每个被装饰的调用都要 inspect.getcallargs），任何回调（包括 PhaseTimer）都要付出
+- 追踪：注册 tracing.Tracer
+
+分两条路径测量：
+- miss：每次都调用桩 LM（零延迟，只剩框架侧耗时）
+- hit：经过 SQLiteResponseCache，全部命中本地响应缓存（重复运行示例时的常见情况）
+
+桩 LM 没有网络延迟，这两条路径都是追踪开销占比最高的情况。
+「估算@Nms」一列把增量换算到假定的 LM 往返延迟上，只作参考：它是假设值，不用于判定。
+--budget 按实测占比判定（默认不判定）
+
+    python benchmarks/bench_tracing.py
+    python benchmarks/bench_tracing.py --budget 0.5
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "examples"))
+
+import dspy  # noqa: E402
+from dspy.utils.callback import BaseCallback  # noqa: E402
+
+from response_cache import SQLiteResponseCache  # noqa: E402
+from signatures import CASES  # noqa: E402
+from stub_lm import StubLM  # noqa: E402
+from tracing import Tracer  # noqa: E402
+
+MODULES = {"Predict": dspy.Predict, "ChainOfThought": dspy.ChainOfThought}
+
+
+def time_calls(module, inputs, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        module(**inputs)
+    return (time.perf_counter() - start) / iterations
+
+
+def measure(module, inputs, iterations, repeats):
+    """三组交替测量多轮，各取最快的一轮（秒/次），避免机器负载变化造成的偏差"""
+    variants = {"plain": [], "callbacks": [BaseCallback()], "traced": [Tracer(max_spans=1000)]}
+    best = dict.fromkeys(variants, float("inf"))
+    for _ in range(repeats):
+        for name, callbacks in variants.items():
+            with dspy.context(callbacks=callbacks):
+                best[name] = min(best[name], time_calls(module, inputs, iterations))
+    return best
+
+
+def run(iterations, repeats, warmup):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {
+            "miss": StubLM(cache=False),
+            "hit": StubLM(cache=True),
+        }
+        original_cache = dspy.cache
+        dspy.cache = SQLiteResponseCache(Path(tmp) / "responses.sqlite3")
+        try:
+            for path, lm in paths.items():
+                dspy.configure(lm=lm, callbacks=[])
+                for name, signature, inputs in CASES:
+                    for module_name, module_cls in MODULES.items():
+                        module = module_cls(signature)
+                        # 预热（hit 路径同时把响应写入缓存）
+                        for _ in range(warmup):
+                            module(**inputs)
+                        results[f"{name}/{module_name}/{path}"] = measure(module, inputs, iterations, repeats)
+        finally:
+            dspy.cache = original_cache
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="追踪开销基准测试")
+    parser.add_argument("-n", "--iterations", type=int, default=50, help="每轮调用次数")
+    parser.add_argument("--repeats", type=int, default=5, help="测量轮数（取最快的一轮）")
+    parser.add_argument("--warmup", type=int, default=10, help="预热调用次数")
+    parser.add_argument("--assumed-latency-ms", type=float, default=300.0, help="参考列使用的假定 LM 往返延迟")
+    parser.add_argument("--budget", type=float, help="实测开销占比上限（如 0.5 表示 50%%），超过时以非零状态退出")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.repeats, args.warmup)
+
+    assumed_us = args.assumed_latency_ms * 1000
+    header = (
+        f"{'用例':<38}{'不追踪(us)':>11}{'空回调(us)':>11}{'追踪(us)':>10}"
+        f"{'总开销':>9}{'Tracer':>9}{f'估算@{args.assumed_latency_ms:g}ms':>14}"
+    )
+    print(header)
+    print("-" * len(header))
+    over_budget, totals = [], {"miss": [], "hit": []}
+    for key, r in results.items():
+        plain, callbacks, traced = r["plain"] * 1e6, r["callbacks"] * 1e6, r["traced"] * 1e6
+        overhead = (traced - plain) / plain
+        own = (traced - callbacks) / plain
+        totals[key.rsplit("/", 1)[1]].append(overhead)
+        if args.budget is not None and overhead > args.budget:
+            over_budget.append(key)
+        print(
+            f"{key:<38}{plain:>11.1f}{callbacks:>11.1f}{traced:>10.1f}"
+            f"{overhead:>9.1%}{own:>9.1%}{(traced - plain) / (plain + assumed_us):>14.3%}"
+        )
+
+    print()
+    for path, values in totals.items():
+        if values:
+            print(f"{path}: 实测开销 {min(values):.1%} ~ {max(values):.1%}（相对不追踪耗时）")
+    print(
+        "「总开销」与「Tracer」（扣除 DSPy 回调分发之后）都相对于实测的不追踪耗时；"
+        f"「估算」列假定 LM 往返 {args.assumed_latency_ms:g}ms，仅供参考"
+    )
+
+    if over_budget:
+        print(f"\n实测开销超过 {args.budget:.0%} 的用例: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+基准测试用到的 Signature
+与 examples/ 中各示例定义的 Signature 保持一致（示例里它们定义在 main() 内部，无法直接导入）
+"""
+
+import dspy
+
+
+class BasicQA(dspy.Signature):
+    """回答问题"""
+    question = dspy.InputField(desc="用户的问题")
+    answer = dspy.OutputField(desc="问题的答案")
+
+
+class Translation(dspy.Signature):
+    """翻译文本"""
+    text = dspy.InputField(desc="要翻译的文本")
+    source_lang = dspy.InputField(desc="源语言")
+    target_lang = dspy.InputField(desc="目标语言")
+    translation = dspy.OutputField(desc="翻译后的文本")
+
+
+class MathProblem(dspy.Signature):
+    """解决数学问题"""
+    problem = dspy.InputField(desc="数学问题")
+    solution = dspy.OutputField(desc="问题的解答")
+
+
+class LogicReasoning(dspy.Signature):
+    """进行逻辑推理"""
+    premises = dspy.InputField(desc="前提条件")
+    conclusion = dspy.OutputField(desc="逻辑结论")
+
+
+class ContextQA(dspy.Signature):
+    """基于给定上下文回答问题"""
+    context = dspy.InputField(desc="背景知识")
+    question = dspy.InputField(desc="问题")
+    answer = dspy.OutputField(desc="基于上下文的答案")
+
+
+class MultiHopQA(dspy.Signature):
+    """需要综合多个信息源的问答"""
+    context = dspy.InputField(desc="多个相关文档")
+    question = dspy.InputField(desc="需要综合分析的问题")
+    answer = dspy.OutputField(desc="综合答案")
+    supporting_facts = dspy.OutputField(desc="支持答案的关键事实")
+
+
+class EmotionClassifier(dspy.Signature):
+    """分析文本的情感倾向"""
+    text = dspy.InputField(desc="要分析的文本")
+    sentiment = dspy.OutputField(desc="情感分类：积极、消极或中性")
+
+
+class ShortSummary(dspy.Signature):
+    """生成简短摘要"""
+    text = dspy.InputField(desc="原文")
+    summary = dspy.OutputField(desc="简短摘要（不超过50字）")
+
+
+class ProductReview(dspy.Signature):
+    """分析产品评论"""
+    review = dspy.InputField(desc="产品评论")
+    sentiment = dspy.OutputField(desc="情感分析")
+    confidence = dspy.OutputField(desc="置信度百分比")
+
+
+class GenerateCode(dspy.Signature):
+    """
+    生成Python代码来解决数学问题
+    代码应该定义一个变量 'result' 存储答案
+    """
+    problem = dspy.InputField(desc="数学问题描述")
+    code = dspy.OutputField(desc="Python代码（必须定义result变量）")
+
+
+DOCUMENTS = """
+文档1: 机器学习是人工智能的一个子领域，专注于让计算机从数据中学习。
+文档2: DSPy 是一个用于编程语言模型的框架，它使用机器学习来优化提示。
+文档3: 语言模型可以通过 DSPy 进行系统化的优化和改进。
+"""
+
+# (名称, Signature, 输入)
+CASES = [
+    ("BasicQA", BasicQA, {"question": "什么是 DSPy？"}),
+    ("Translation", Translation, {"text": "Hello, how are you?", "source_lang": "英语", "target_lang": "中文"}),
+    ("MathProblem", MathProblem, {"problem": "如果一个商店有 15 个苹果，卖出了 7 个，又进货 12 个，现在有多少个苹果？"}),
+    ("LogicReasoning", LogicReasoning, {"premises": "1. 所有的猫都是哺乳动物\n2. 所有的哺乳动物都需要氧气\n3. 加菲是一只猫"}),
+    ("ContextQA", ContextQA, {"context": DOCUMENTS, "question": "DSPy 的核心思想是什么？"}),
+    ("MultiHopQA", MultiHopQA, {"context": DOCUMENTS, "question": "DSPy 和机器学习之间有什么关系？"}),
+    ("EmotionClassifier", EmotionClassifier, {"text": "这家餐厅的食物很美味，环境也不错。"}),
+    ("ShortSummary", ShortSummary, {"text": "人工智能是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。"}),
+    ("ProductReview", ProductReview, {"review": "这个产品质量很好，非常满意！"}),
+    ("GenerateCode", GenerateCode, {"problem": "一个商店原价100元的商品打8折，然后用20元优惠券，最后支付多少？"}),
+]
@@ -4,19 +4,11 @@ DSPy 基础示例
 """
 
 import dspy
-import os
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
+from lm_factory import configure_lm
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     # 示例 1: 基本的 Signature
     # Signature 定义了任务的输入和输出
@@ -4,19 +4,14 @@ DSPy RAG (Retrieval Augmented Generation) 示例
 """
 
 import dspy
-import os
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
+from bm25 import BM25Index, BM25Retriever
+from context_packing import ContextPacker
+from lm_factory import configure_lm
+from vector_store import VectorRetriever, VectorStore
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     # 示例 1: 简单的上下文增强回答
     print("=" * 60)
@@ -56,20 +51,26 @@ def main():
     print("=" * 60)
 
     class SimpleRAG(dspy.Module):
-        def __init__(self):
+        def __init__(self, num_passages=3, budget_tokens=60):
             super().__init__()
+            # 从 dspy.settings.rm 配置的检索器中取最相关的 num_passages 段
+            self.retrieve = dspy.Retrieve(k=num_passages)
+            # 在 token 预算内排序、去重、打包检索结果
+            self.packer = ContextPacker(budget_tokens=budget_tokens)
             # 使用 ChainOfThought 进行推理
             self.generate_answer = dspy.ChainOfThought(ContextQA)
 
-        def forward(self, question, documents):
-            # 将文档组合成上下文
-            context = "\n\n".join(documents)
+        def forward(self, question):
+            # 只把检索到的文档组合成上下文，提示词长度不随知识库增长
+            packed = self.packer(self.retrieve(question).passages, query=question)
 
             # 生成答案
-            result = self.generate_answer(context=context, question=question)
+            result = self.generate_answer(context=packed.context, question=question)
 
             return dspy.Prediction(
-                context=context,
+                context=packed.context,
+                passages=packed.passages,
+                saved_tokens=packed.saved_tokens,
                 answer=result.answer,
                 reasoning=result.reasoning
             )
@@ -78,23 +79,42 @@ def main():
     knowledge_base = [
         "Python 是一种高级编程语言，由 Guido van Rossum 在 1991 年发布。它强调代码可读性。",
         "Python 广泛用于数据科学、机器学习、Web 开发和自动化任务。",
+        "Python 被广泛用于数据科学、机器学习、Web 开发以及自动化任务。",  # 近似重复
         "Python 有丰富的标准库和第三方包生态系统，如 NumPy、Pandas 和 Django。",
+        "DSPy 是斯坦福大学开发的一个框架，用于编程语言模型。",
+        "Rust 是一种注重内存安全和性能的系统编程语言。",
+        "JavaScript 主要用于网页前端开发，也可以通过 Node.js 运行在服务端。",
     ]
 
-    rag = SimpleRAG()
+    # 构建本地向量索引（完全离线），并注册为 DSPy 的检索器
+    store = VectorStore()
+    store.add(knowledge_base)
+    dspy.configure(rm=VectorRetriever(store))
 
-    result = rag(
-        question="Python 的主要应用领域有哪些？",
-        documents=knowledge_base
-    )
+    rag = SimpleRAG(num_passages=3, budget_tokens=60)
 
-    print("\n问题: Python 的主要应用领域有哪些？")
-    print("\n检索到的文档:")
-    for i, doc in enumerate(knowledge_base, 1):
+    question_text = "Python 主要用于哪些领域？"
+    result = rag(question=question_text)
+
+    print(f"\n问题: {question_text}")
+    print(f"\n检索到的文档（知识库共 {len(store)} 条，打包后保留 {len(result.passages)} 条，节省 {result.saved_tokens} tokens）:")
+    for i, doc in enumerate(result.passages, 1):
         print(f"{i}. {doc}")
     print("\n推理过程:", result.reasoning)
     print("\n答案:", result.answer)
 
+    # 同一个 RAG 模块换成 BM25 关键词检索：只需切换 rm
+    bm25_index = BM25Index()
+    for doc in knowledge_base:
+        bm25_index.add(doc)
+
+    with dspy.context(rm=BM25Retriever(bm25_index)):
+        result = rag(question=question_text)
+
+    print("\nBM25 检索到的文档:")
+    for i, doc in enumerate(result.passages, 1):
+        print(f"{i}. {doc}")
+
     # 示例 3: 多跳推理 RAG
     print("\n" + "=" * 60)
     print("示例 3: 多跳推理（需要综合多个文档）")
@@ -116,12 +136,16 @@ def main():
     """
 
     question_text2 = "DSPy 和机器学习之间有什么关系？"
+
+    # 按行拆成段落，在预算内只保留与问题最相关的部分
+    packed = ContextPacker(budget_tokens=70)(documents.strip().splitlines(), query=question_text2)
     result = multi_hop_qa(
-        context=documents,
+        context=packed.context,
         question=question_text2
     )
 
-    print("\n文档:", documents.strip())
+    print("\n文档:", packed.context)
+    print(f"（上下文 {packed.original_tokens} → {packed.tokens} tokens，节省 {packed.saved_tokens}）")
     print("\n问题:", question_text2)
     print("\n推理:", result.reasoning)
     print("\n答案:", result.answer)
@@ -138,6 +162,8 @@ def main():
 
     2. 配置 DSPy 的 Retriever
        - dspy.Retrieve() 可以与各种检索后端集成
+       - 本项目的 vector_store.py 提供了离线的 NumPy 向量索引（暴力 / IVF 检索）
+       - bm25.py 提供了支持中文的 BM25 倒排索引（关键词检索）
 
     3. 优化检索和生成
        - 使用 DSPy 的优化器（如 BootstrapFewShot）
@@ -3,20 +3,21 @@ DSPy 优化器 (Optimizer) 示例
 演示如何使用优化器自动改进提示词
 """
 
-import dspy
 import os
-from dotenv import load_dotenv
+import time
+from typing import Literal
 
-# 加载环境变量
-load_dotenv()
+import dspy
+from batch_inference import batch
+from classify import Classify
+from compile_cache import cached_compile
+from lm_factory import configure_lm
+from parallel_bootstrap import ParallelBootstrapFewShot
+from tracing import trace
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     print("=" * 70)
     print("DSPy 优化器示例：自动优化提示词")
@@ -26,7 +27,7 @@ def main():
     class EmotionClassifier(dspy.Signature):
         """分析文本的情感倾向"""
         text = dspy.InputField(desc="要分析的文本")
-        sentiment = dspy.OutputField(desc="情感分类：积极、消极或中性")
+        sentiment: Literal["积极", "消极", "中性"] = dspy.OutputField(desc="情感分类：积极、消极或中性")
 
     # 步骤 2: 准备训练数据
     print("\n📚 准备训练数据...")
@@ -57,7 +58,8 @@ def main():
 
     # 步骤 3: 创建未优化的模型
     print("\n🔧 创建未优化的基础模型...")
-    unoptimized_model = dspy.Predict(EmotionClassifier)
+    # Classify: 只回答标签本身，max_tokens 按标签长度收紧（见 classify.py）
+    unoptimized_model = Classify(EmotionClassifier)
 
     # 测试未优化的模型
     test_text = "这家餐厅的食物很美味，环境也不错。"
@@ -88,24 +90,25 @@ def main():
     print("\n" + "=" * 70)
     print("🚀 开始优化...")
     print("=" * 70)
-    print("使用 BootstrapFewShot 优化器自动生成示例和优化提示词\n")
-
-    # 创建优化器
-    from dspy.teleprompt import BootstrapFewShot
+    print("使用 BootstrapFewShot 优化器（并行版本）自动生成示例和优化提示词\n")
 
-    optimizer = BootstrapFewShot(
+    # 创建优化器：ParallelBootstrapFewShot 并发运行 teacher，选出的示例与 BootstrapFewShot 相同
+    optimizer = ParallelBootstrapFewShot(
         metric=validate_sentiment,
         max_bootstrapped_demos=3,  # 最多生成3个示例
         max_labeled_demos=3,        # 最多使用3个标注示例
+        num_threads=8,              # 同时运行的样本数，凑够示例后提前结束
     )
 
-    # 优化模型
+    # 优化模型：训练集、模块、优化器配置和模型都没变时直接加载上次的编译结果（见 compile_cache.py）
     print("正在优化...")
-    optimized_model = optimizer.compile(
-        dspy.Predict(EmotionClassifier),
+    start = time.perf_counter()
+    optimized_model = cached_compile(
+        optimizer,
+        Classify(EmotionClassifier),
         trainset=trainset
     )
-    print("✓ 优化完成！")
+    print(f"✓ 优化完成！（{(time.perf_counter() - start) * 1000:.1f}ms）")
 
     # 步骤 6: 测试优化后的模型
     print("\n" + "=" * 70)
@@ -118,10 +121,24 @@ def main():
         "普通的产品，没什么特别的。",
     ]
 
-    for i, test_text in enumerate(test_cases, 1):
+    # 并发调用，结果顺序与输入一致；trace() 记录每个模块、每次 LM 调用的耗时和 token（见 tracing.py）
+    with trace() as tracer:
+        results = batch(optimized_model, [{"text": text} for text in test_cases], concurrency=8)
+    for i, (test_text, result) in enumerate(zip(test_cases, results), 1):
         print(f"\n测试 {i}: {test_text}")
-        result = optimized_model(text=test_text)
-        print(f"优化后预测: {result.sentiment}")
+        if isinstance(result, Exception):
+            print(f"预测失败: {result}")
+        else:
+            print(f"优化后预测: {result.sentiment}")
+
+    print("\n调用追踪:")
+    print(tracer.format_table())
+    # 设置 TRACE_DIR 时导出 JSONL 和 Chrome trace（用 chrome://tracing 或 ui.perfetto.dev 打开）
+    trace_dir = os.getenv("TRACE_DIR")
+    if trace_dir:
+        tracer.to_jsonl(os.path.join(trace_dir, "04_optimization.jsonl"))
+        path = tracer.to_chrome_trace(os.path.join(trace_dir, "04_optimization.trace.json"))
+        print(f"追踪已导出: {path}")
 
     # 步骤 7: 打印优化后的提示词
     print("\n" + "=" * 70)
@@ -5,19 +5,15 @@ ReAct 结合了推理和行动，让模型能够逐步思考并采取行动
 """
 
 import dspy
-import os
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
+from bm25 import BM25Index
+from calculator import CalculationError, evaluate, evaluate_many
+from lm_factory import configure_lm
+from parallel_react import ParallelReAct
+from tool_cache import ToolCache, memoize_tool
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     print("=" * 70)
     print("DSPy ReAct 模式：推理 + 行动")
@@ -31,36 +27,50 @@ def main():
     def calculate(expression: str) -> str:
         """计算数学表达式"""
         try:
-            # 安全的计算（只允许基本运算）
-            result = eval(expression, {"__builtins__": {}}, {})
+            # 安全的计算：AST 白名单 + 指数/量级上限，编译结果按表达式缓存
+            result = evaluate(expression)
             return f"计算结果: {result}"
-        except Exception as e:
+        except CalculationError as e:
             return f"计算错误: {str(e)}"
 
+    # 模拟知识库：预先建好 BM25 倒排索引，每次工具调用只查询命中词的倒排表
+    knowledge_index = BM25Index()
+    for doc in [
+        "Python是一种高级编程语言，由Guido van Rossum创建于1991年",
+        "DSPy是斯坦福大学开发的语言模型编程框架，用于优化提示词",
+        "ReAct是一种结合推理(Reasoning)和行动(Acting)的AI范式",
+    ]:
+        knowledge_index.add(doc)
+
     def search_info(query: str) -> str:
         """搜索信息（模拟知识库）"""
-        knowledge = {
-            "python": "Python是一种高级编程语言，由Guido van Rossum创建于1991年",
-            "dspy": "DSPy是斯坦福大学开发的语言模型编程框架，用于优化提示词",
-            "react": "ReAct是一种结合推理(Reasoning)和行动(Acting)的AI范式",
-        }
-        query_lower = query.lower()
-        for key, value in knowledge.items():
-            if key in query_lower:
-                return value
-        return "未找到相关信息"
+        # 忽略中文单字；只命中常见词（如「语言」）的文档相关性不够，视为没有找到
+        hits = knowledge_index.search(query, k=1, min_term_len=2, min_relevance=0.7)
+        if not hits:
+            return "未找到相关信息"
+        return knowledge_index.docs[hits[0][0]]
 
     # 将工具转换为 DSPy 工具格式
+    # 两个工具都是纯函数：相同参数的重复调用（跨步骤、跨问题）直接复用缓存结果
+    tool_cache = ToolCache(max_entries=256)
     tools = [
-        dspy.Tool(
-            func=calculate,
-            name="calculate",
-            desc="计算数学表达式，输入格式如: 100*0.8-20"
+        memoize_tool(
+            dspy.Tool(
+                func=calculate,
+                name="calculate",
+                desc="计算数学表达式，输入格式如: 100*0.8-20"
+            ),
+            pure=True,
+            cache=tool_cache,
         ),
-        dspy.Tool(
-            func=search_info,
-            name="search_info",
-            desc="搜索知识库获取信息"
+        memoize_tool(
+            dspy.Tool(
+                func=search_info,
+                name="search_info",
+                desc="搜索知识库获取信息"
+            ),
+            pure=True,
+            cache=tool_cache,
         ),
     ]
 
@@ -78,6 +88,7 @@ def main():
         "计算 100 * 0.8 - 20 等于多少？",
         "告诉我关于Python的信息",
         "DSPy是什么？",
+        "计算 100 * 0.8 - 20 等于多少？",
     ]
 
     for i, q in enumerate(questions, 1):
@@ -89,6 +100,38 @@ def main():
             print(f"错误: {e}")
         print("-" * 70)
 
+    # 并行工具调用：一步中发起多个互不依赖的查询，并发执行
+    print("\n并行 ReAct：一步中同时调用多个工具")
+    parallel_agent = ParallelReAct(
+        Question,
+        tools=tools,
+        max_parallel_calls=4,
+        tool_timeouts={"search_info": 2.0, "calculate": 1.0},
+    )
+
+    q = "Python、DSPy 和 ReAct 分别是什么？"
+    print(f"\n问题: {q}")
+    result = parallel_agent(question=q)
+    for key, value in result.trajectory.items():
+        if key.startswith("tool_calls_"):
+            step = key.split("_")[-1]
+            calls = [f"{call['name']}({', '.join(map(str, call['args'].values()))})" for call in value]
+            print(f"第 {int(step) + 1} 步并发调用: {'; '.join(calls)}")
+            for observation in result.trajectory[f"observation_{step}"]:
+                print(f"  观察: {observation}")
+    print(f"答案: {result.answer}")
+    print("-" * 70)
+
+    print("\n工具结果缓存:")
+    for name, s in tool_cache.stats().items():
+        print(f"  {name}: 命中 {s['hits']} 次，未命中 {s['misses']} 次，命中率 {s['hit_rate']:.0%}")
+
+    # 计算器会拒绝失控的表达式，而不是卡住整个进程
+    print("\n批量计算:")
+    expressions = ["100 * 0.8 - 20", "2 ** 64", "9 ** 9 ** 9", "1 / 0", "__import__('os')"]
+    for expression, value in zip(expressions, evaluate_many(expressions)):
+        print(f"  {expression} → {value if not isinstance(value, CalculationError) else f'错误: {value}'}")
+
     # 示例 2: 自定义 ReAct 风格模块
     print("\n\n📋 示例 2: 模拟 ReAct 推理过程")
     print("-" * 70)
@@ -231,6 +274,7 @@ ReAct (Reasoning + Acting) 模式:
     - 工具功能单一明确
     - 添加错误处理
     - 记录工具调用历史
+    - 纯函数工具用 memoize_tool 缓存结果，避免重复调用
     """)
 
     # 示例 5: 实际建议
@@ -4,20 +4,28 @@ DSPy 输出约束和验证示例
 虽然 DSPy 可能没有内置的 assertions 模块，但我们可以手动实现类似功能
 """
 
-import dspy
-import os
-from dotenv import load_dotenv
+from typing import Annotated
 
-# 加载环境变量
-load_dotenv()
+import dspy
+from batch_inference import batch
+from constraints import (
+    ContainsAny,
+    Constrained,
+    MaxChars,
+    MinChars,
+    NumberRange,
+    OneOf,
+    Predicate,
+    StartsWith,
+    compile_validator,
+)
+from lm_factory import configure_lm
+from speculative import speculate
+from streaming import StreamingConstrained
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     print("=" * 70)
     print("DSPy 输出约束和验证")
@@ -27,34 +35,63 @@ def main():
     print("\n📋 示例 1: 输出长度约束（手动实现）")
     print("-" * 70)
 
+    # 约束直接声明在输出字段上，compile_validator 会把它们编译成一个验证器
     class ShortSummary(dspy.Signature):
         """生成简短摘要"""
         text = dspy.InputField(desc="原文")
-        summary = dspy.OutputField(desc="简短摘要（不超过50字）")
+        summary: Annotated[str, MaxChars(50)] = dspy.OutputField(desc="简短摘要（不超过50字）")
 
     class SummaryWithRetry(dspy.Module):
-        def __init__(self, max_retries=3):
+        """
+        max_parallel > 1 时改为投机模式：同时生成多个候选，取第一个满足长度约束的，
+        尾延迟约为一次往返；max_parallel 同时限制了额外的 token 开销
+        """
+        def __init__(self, max_retries=3, max_parallel=1):
             super().__init__()
             self.generate = dspy.ChainOfThought(ShortSummary)
             self.max_retries = max_retries
+            self.max_parallel = max_parallel
+            self.validator = compile_validator(ShortSummary)
 
         def forward(self, text):
+            if self.max_parallel > 1:
+                speculation = speculate(
+                    self.generate,
+                    validator=self.validator.is_valid,
+                    inputs={"text": text},
+                    k=self.max_retries,
+                    max_parallel=self.max_parallel,
+                )
+                result = speculation.prediction
+                if speculation.passed:
+                    print(f"✓ 并发 {speculation.launched} 个候选，{speculation.elapsed:.2f}s 内得到满足约束的摘要（{len(result.summary)}字）")
+                    return result
+                print(f"✗ {speculation.launched} 个候选都超过50字限制")
+            else:
+                result = self._retry(text)
+                if self.validator.is_valid(result):
+                    return result
+
+            # 如果所有尝试都失败，返回最后一次结果并截断（MaxChars 自带的修复）
+            print(f"⚠ 达到最大重试次数，强制截断到50字")
+            self.validator.repair(result, self.validator(result))
+            return result
+
+        def _retry(self, text):
+            """串行重试：每次失败都在输入中强调长度要求"""
             for attempt in range(self.max_retries):
                 result = self.generate(text=text)
 
                 # 检查长度约束
-                if len(result.summary) <= 50:
+                violations = self.validator(result)
+                if not violations:
                     print(f"✓ 第 {attempt + 1} 次尝试成功（{len(result.summary)}字）")
                     return result
                 else:
-                    print(f"✗ 第 {attempt + 1} 次尝试失败（{len(result.summary)}字，超过50字限制）")
+                    print(f"✗ 第 {attempt + 1} 次尝试失败（{violations[0].message}）")
                     if attempt < self.max_retries - 1:
                         # 修改输入，强调长度要求
                         text = f"{text}\n\n重要：摘要必须控制在50字以内，当前过长，请重新生成更简洁的版本。"
-
-            # 如果所有尝试都失败，返回最后一次结果并截断
-            print(f"⚠ 达到最大重试次数，强制截断到50字")
-            result.summary = result.summary[:50] + "..."
             return result
 
     summary_module = SummaryWithRetry(max_retries=3)
@@ -71,6 +108,29 @@ def main():
     print(f"\n最终摘要: {result.summary}")
     print(f"摘要长度: {len(result.summary)}字")
 
+    # 投机模式：3 个候选同时生成，第一个通过验证的胜出
+    print("\n投机模式（并发 3 个候选）:")
+    result = SummaryWithRetry(max_retries=3, max_parallel=3)(text=long_text)
+    print(f"最终摘要: {result.summary}")
+
+    # 流式模式：边生成边检查，一超过字数限制就中止这次生成并立即重试，不必等整段摘要生成完
+    print("\n流式模式（一句话摘要，不超过20字）:")
+
+    class OneLineSummary(dspy.Signature):
+        """用一句话概括原文"""
+        text = dspy.InputField(desc="原文")
+        summary: Annotated[str, MaxChars(20)] = dspy.OutputField(desc="一句话摘要（不超过20字）")
+
+    streaming_summary = StreamingConstrained(
+        dspy.Predict(OneLineSummary),
+        max_retries=1,
+        on_chunk=lambda field, text: print(text, end="", flush=True),
+        on_abort=lambda violation: print(f"  ✗ 中止（{violation.message}）"),
+    )
+    result = streaming_summary(text=long_text)
+    print(f"最终摘要: {result.summary}")
+    print(f"中止了 {streaming_summary.aborts} 次生成，每次只生成到第 {streaming_summary.aborted_chars // max(streaming_summary.aborts, 1)} 字")
+
     # 示例 2: 格式约束
     print("\n\n📋 示例 2: 格式约束 - 确保特定格式")
     print("-" * 70)
@@ -78,22 +138,45 @@ def main():
     class StructuredResponse(dspy.Signature):
         """生成结构化的响应，必须包含'结论:'前缀"""
         question = dspy.InputField(desc="问题")
-        answer = dspy.OutputField(desc="答案")
+        answer: Annotated[str, StartsWith("结论:", alternatives=("结论",))] = dspy.OutputField(desc="答案")
+
+    has_conclusion = compile_validator(StructuredResponse).is_valid
 
     class StructuredModule(dspy.Module):
-        def __init__(self, max_retries=2):
+        """
+        sample_n > 1 时在一次请求中采样 n 个回答（n>1 采样），取第一个格式正确的
+        """
+        def __init__(self, max_retries=2, sample_n=1):
             super().__init__()
             self.generate = dspy.Predict(StructuredResponse)
             self.max_retries = max_retries
+            self.sample_n = sample_n
 
         def forward(self, question):
             enhanced_question = f"{question}\n\n要求：答案必须以'结论:'开头。"
 
+            if self.sample_n > 1:
+                speculation = speculate(
+                    self.generate,
+                    validator=has_conclusion,
+                    inputs={"question": enhanced_question},
+                    k=self.sample_n,
+                    mode="n",
+                )
+                result = speculation.prediction
+                if speculation.passed:
+                    print(f"✓ 一次请求采样 {self.sample_n} 个回答，找到格式正确的回答")
+                    return result
+                print(f"✗ {self.sample_n} 个采样都缺少'结论:'前缀")
+                result.answer = f"结论: {result.answer}"
+                print(f"⚠ 手动添加'结论:'前缀")
+                return result
+
             for attempt in range(self.max_retries):
                 result = self.generate(question=enhanced_question)
 
                 # 检查格式
-                if "结论:" in result.answer or result.answer.startswith("结论"):
+                if has_conclusion(result):
                     print(f"✓ 格式正确（第 {attempt + 1} 次尝试）")
                     return result
                 else:
@@ -102,7 +185,7 @@ def main():
                         enhanced_question = f"{question}\n\n严格要求：答案必须以'结论:'开头！之前的回答不符合格式要求。"
 
             # 如果都失败，手动添加前缀
-            if not ("结论:" in result.answer or result.answer.startswith("结论")):
+            if not has_conclusion(result):
                 result.answer = f"结论: {result.answer}"
                 print(f"⚠ 手动添加'结论:'前缀")
 
@@ -115,6 +198,10 @@ def main():
     result = structured_module(question=question)
     print(f"答案: {result.answer}")
 
+    print("\nn>1 采样模式:")
+    result = StructuredModule(sample_n=3)(question=question)
+    print(f"答案: {result.answer}")
+
     # 示例 3: 内容约束 - 确保是有效值
     print("\n\n📋 示例 3: 内容约束 - 确保输出是有效值")
     print("-" * 70)
@@ -122,13 +209,19 @@ def main():
     class ProductReview(dspy.Signature):
         """分析产品评论"""
         review = dspy.InputField(desc="产品评论")
-        sentiment = dspy.OutputField(desc="情感分析")
-        confidence = dspy.OutputField(desc="置信度百分比")
+        sentiment: Annotated[str, OneOf(["积极", "消极", "中性"], default="中性")] = dspy.OutputField(desc="情感分析")
+        confidence: Annotated[str, NumberRange(0, 100, default="50%")] = dspy.OutputField(desc="置信度百分比")
 
     class ReviewAnalyzer(dspy.Module):
         def __init__(self):
             super().__init__()
-            self.analyze = dspy.ChainOfThought(ProductReview)
+            # 违反约束时带着违反说明重试一次，仍不满足则用约束的默认值修复
+            self.analyze = Constrained(
+                dspy.ChainOfThought(ProductReview),
+                signature=ProductReview,
+                max_retries=1,
+                feedback_field="review",
+            )
 
         def forward(self, review):
             # 在提示中明确指定有效值
@@ -140,26 +233,7 @@ def main():
 2. confidence 必须是 0-100 之间的数字，格式如: 85%
 """
 
-            result = self.analyze(review=enhanced_review)
-
-            # 验证情感值
-            valid_sentiments = ["积极", "消极", "中性"]
-            if result.sentiment not in valid_sentiments:
-                print(f"⚠ 情感值 '{result.sentiment}' 不在有效范围内，修正为'中性'")
-                result.sentiment = "中性"
-
-            # 验证置信度
-            try:
-                confidence_str = result.confidence.replace("%", "").strip()
-                confidence_val = int(confidence_str)
-                if not (0 <= confidence_val <= 100):
-                    print(f"⚠ 置信度 {confidence_val} 超出范围，修正为 50")
-                    result.confidence = "50%"
-            except ValueError:
-                print(f"⚠ 置信度格式错误，设置为 50%")
-                result.confidence = "50%"
-
-            return result
+            return self.analyze(review=enhanced_review)
 
     review_analyzer = ReviewAnalyzer()
 
@@ -169,9 +243,13 @@ def main():
         "还行吧，没什么特别的。",
     ]
 
-    for i, review in enumerate(reviews, 1):
+    # 并发分析所有评论，结果顺序与输入一致
+    results = batch(review_analyzer, [{"review": review} for review in reviews], concurrency=8)
+    for i, (review, result) in enumerate(zip(reviews, results), 1):
         print(f"\n评论 {i}: {review}")
-        result = review_analyzer(review=review)
+        if isinstance(result, Exception):
+            print(f"分析失败: {result}")
+            continue
         print(f"情感: {result.sentiment}")
         print(f"置信度: {result.confidence}")
         print(f"推理: {result.reasoning[:80]}...")
@@ -184,12 +262,19 @@ def main():
         """生成专业邮件"""
         topic = dspy.InputField(desc="邮件主题")
         recipient = dspy.InputField(desc="收件人")
-        email = dspy.OutputField(desc="邮件内容")
+        email: Annotated[
+            str,
+            Predicate(lambda email, inputs: inputs["recipient"] in email or "您好" in email, "greeting", "缺少称呼"),
+            MinChars(50),
+            MaxChars(300),
+            ContainsAny(["祝好", "谢谢", "期待", "感谢", "此致", "敬礼"], name="closing", hint="缺少礼貌结尾"),
+        ] = dspy.OutputField(desc="邮件内容")
 
     class EmailModule(dspy.Module):
         def __init__(self):
             super().__init__()
             self.generate = dspy.ChainOfThought(EmailGenerator)
+            self.validator = compile_validator(EmailGenerator)
 
         def forward(self, topic, recipient):
             # 详细的提示词，包含所有要求
@@ -205,31 +290,13 @@ def main():
 """
 
             result = self.generate(topic=enhanced_topic, recipient=recipient)
-            email_content = result.email
-
-            # 验证各项约束
-            issues = []
-
-            # 约束1：检查称呼
-            if recipient not in email_content and "您好" not in email_content:
-                issues.append("缺少称呼")
 
-            # 约束2：检查长度
-            length = len(email_content)
-            if length < 50:
-                issues.append(f"长度过短（{length}字）")
-            elif length > 300:
-                issues.append(f"长度过长（{length}字）")
-
-            # 约束3：检查结尾
-            closing_phrases = ["祝好", "谢谢", "期待", "感谢", "此致", "敬礼"]
-            has_closing = any(phrase in email_content for phrase in closing_phrases)
-            if not has_closing:
-                issues.append("缺少礼貌结尾")
+            # 一次调用检查称呼、长度、结尾三类约束
+            issues = self.validator(result, {"recipient": recipient})
 
             # 报告验证结果
             if issues:
-                print(f"⚠ 发现问题: {', '.join(issues)}")
+                print(f"⚠ 发现问题: {', '.join(issue.message for issue in issues)}")
             else:
                 print(f"✓ 所有约束都满足")
 
@@ -281,6 +348,13 @@ def main():
         else:
             print("✗ 未检测到中文字符")
 
+    # 约束统计：每条约束被检查、被违反的次数
+    print("\n\n📊 约束违反统计")
+    print("-" * 70)
+    for signature in [ShortSummary, OneLineSummary, StructuredResponse, ProductReview, EmailGenerator]:
+        for field, name, count, violations in compile_validator(signature).stats():
+            print(f"{signature.__name__}.{field} {name}: 检查 {count} 次，违反 {violations} 次")
+
     # 说明
     print("\n\n" + "=" * 70)
     print("💡 输出约束的实现策略")
@@ -302,6 +376,11 @@ def main():
    - 检测到违反约束时重新生成
    - 在重试时强化约束描述
    - 设置最大重试次数避免无限循环
+   - 投机模式：并发生成多个候选（或 n>1 采样），取第一个通过验证的，尾延迟约一次往返
+
+   - 声明式约束（constraints.py）：在输出字段上声明约束，编译成一个验证器，
+     配合 Constrained 包装器统一重试和修复
+   - 流式增量检查（streaming.py）：边生成边检查，确定违反时立即中止并重试
 
 4. **兜底策略**
    - 达到最大重试次数后的备用方案
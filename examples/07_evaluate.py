@@ -3,21 +3,20 @@ DSPy Evaluate（评估系统）示例
 演示如何系统化地评估模型性能
 """
 
+from typing import Literal
+
 import dspy
-import os
-from dotenv import load_dotenv
 from dspy.evaluate import Evaluate
-
-# 加载环境变量
-load_dotenv()
+from classify import Classify
+from compile_cache import cached_compile
+from lm_factory import configure_lm
+from parallel_bootstrap import ParallelBootstrapFewShot
+from parallel_eval import MultiMetricEvaluate, ParallelEvaluate
+from token_count import estimate_tokens
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     print("=" * 70)
     print("DSPy Evaluate: 系统化评估")
@@ -31,10 +30,10 @@ def main():
     class SentimentClassification(dspy.Signature):
         """分析文本情感"""
         text = dspy.InputField(desc="要分析的文本")
-        sentiment = dspy.OutputField(desc="情感：积极、消极、中性")
+        sentiment: Literal["积极", "消极", "中性"] = dspy.OutputField(desc="情感：积极、消极、中性")
 
-    # 创建模型
-    sentiment_model = dspy.Predict(SentimentClassification)
+    # 创建模型：Classify 只让模型回答标签本身（见 classify.py）
+    sentiment_model = Classify(SentimentClassification)
 
     # 准备测试数据
     test_set = [
@@ -71,7 +70,7 @@ def main():
     evaluator = Evaluate(
         devset=test_set,
         metric=accuracy_metric,
-        num_threads=1,  # 单线程执行
+        num_threads=8,  # 并行执行，每个线程同时发起一个请求
         display_progress=True,
         display_table=5  # 显示前5条结果
     )
@@ -79,7 +78,23 @@ def main():
     # 运行评估
     print("\n开始评估...")
     result = evaluator(sentiment_model)
-    print(f"\n✓ 准确率: {result.score:.1%}")
+    print(f"\n✓ 准确率: {result.score:.1f}%")
+
+    # 与完整的 ChatAdapter 输出对比 completion token 数
+    def completion_tokens(model):
+        calls_before = len(lm.history)
+        ParallelEvaluate(devset=test_set, metrics=accuracy_metric, num_threads=8)(model)
+        calls = lm.history[calls_before:]
+        # 命中请求缓存时 usage 为空，按回答文本估算
+        tokens = [
+            (call.get("usage") or {}).get("completion_tokens") or estimate_tokens(str(call["outputs"][0]))
+            for call in calls
+        ]
+        return sum(tokens) / max(len(tokens), 1)
+
+    free_text_tokens = completion_tokens(dspy.Predict(SentimentClassification))
+    label_tokens = completion_tokens(sentiment_model)
+    print(f"平均 completion tokens: Predict {free_text_tokens:.1f} → Classify {label_tokens:.1f}")
 
     # 示例 2: 多指标评估
     print("\n\n📋 示例 2: 多指标评估")
@@ -123,33 +138,30 @@ def main():
         """答案长度检查（不要太长）"""
         return len(pred.answer) <= 200
 
-    # 分别评估
-    print("\n评估指标 1: 精确匹配")
-    evaluator1 = Evaluate(
+    # 每条样本只运行一次模型，三个指标都基于同一个预测结果打分
+    evaluator = MultiMetricEvaluate(
         devset=qa_test_set,
-        metric=exact_match,
-        num_threads=1,
+        metrics={
+            "精确匹配": exact_match,
+            "关键信息": has_key_info,
+            "长度检查": answer_length_check,
+        },
+        num_threads=8,
+        requests_per_second=10,  # 限速，避免触发 API 限流
     )
-    result1 = evaluator1(qa_model)
-    print(f"精确匹配得分: {result1.score:.1%}")
+    calls_before = len(lm.history)
+    report = evaluator(qa_model)
+    print(report.format_table())
+    print(f"\nLM 调用次数: {len(lm.history) - calls_before}（{len(qa_test_set)} 条样本，3 个指标共用同一次预测）")
 
-    print("\n评估指标 2: 包含关键信息")
-    evaluator2 = Evaluate(
-        devset=qa_test_set,
-        metric=has_key_info,
-        num_threads=1,
-    )
-    result2 = evaluator2(qa_model)
-    print(f"关键信息得分: {result2.score:.1%}")
+    # 预测结果已缓存，追加新指标不会再调用 LM
+    def non_empty(example, pred, trace=None):
+        """答案非空"""
+        return bool(pred.answer.strip())
 
-    print("\n评估指标 3: 答案长度检查")
-    evaluator3 = Evaluate(
-        devset=qa_test_set,
-        metric=answer_length_check,
-        num_threads=1,
-    )
-    result3 = evaluator3(qa_model)
-    print(f"长度检查得分: {result3.score:.1%}")
+    calls_before = len(lm.history)
+    report = evaluator(qa_model, metrics=[non_empty])
+    print(f"\n追加指标 non_empty 得分: {report.scores['non_empty']:.1f}%（新增 LM 调用: {len(lm.history) - calls_before}）")
 
     # 示例 3: 评估优化前后的性能
     print("\n\n📋 示例 3: 对比优化前后的性能")
@@ -180,43 +192,41 @@ def main():
     ]
 
     # 未优化的模型
-    unoptimized = dspy.Predict(SentimentClassification)
-
-    # 使用 BootstrapFewShot 优化
-    from dspy.teleprompt import BootstrapFewShot
+    unoptimized = Classify(SentimentClassification)
 
-    optimizer = BootstrapFewShot(
+    # 使用 BootstrapFewShot 优化（并行版本，结果与串行相同）
+    optimizer = ParallelBootstrapFewShot(
         metric=accuracy_metric,
         max_bootstrapped_demos=2,
+        num_threads=8,
     )
 
     print("\n正在优化模型...")
-    optimized = optimizer.compile(
-        dspy.Predict(SentimentClassification),
+    optimized = cached_compile(
+        optimizer,
+        Classify(SentimentClassification),
         trainset=trainset
     )
     print("✓ 优化完成")
 
     # 评估未优化模型
     print("\n评估未优化模型...")
-    evaluator = Evaluate(
+    evaluator = ParallelEvaluate(
         devset=test_set,
-        metric=accuracy_metric,
-        num_threads=1,
+        metrics=accuracy_metric,
+        num_threads=8,
     )
-    result_before = evaluator(unoptimized)
-    score_before = result_before.score
-    print(f"未优化模型准确率: {score_before:.1%}")
+    score_before = evaluator(unoptimized).scores["accuracy_metric"]
+    print(f"未优化模型准确率: {score_before:.1f}%")
 
     # 评估优化后模型
     print("\n评估优化后模型...")
-    result_after = evaluator(optimized)
-    score_after = result_after.score
-    print(f"优化后模型准确率: {score_after:.1%}")
+    score_after = evaluator(optimized).scores["accuracy_metric"]
+    print(f"优化后模型准确率: {score_after:.1f}%")
 
     # 性能提升
     improvement = score_after - score_before
-    print(f"\n性能提升: {improvement:+.1%}")
+    print(f"\n性能提升: {improvement:+.1f} 个百分点")
 
     # 示例 4: 自定义复杂评估指标
     print("\n\n📋 示例 4: 自定义复杂评估指标")
@@ -269,10 +279,10 @@ def main():
     evaluator = Evaluate(
         devset=translation_test,
         metric=translation_quality,
-        num_threads=1,
+        num_threads=8,
     )
     result = evaluator(translator)
-    print(f"翻译质量得分: {result.score:.1%}")
+    print(f"翻译质量得分: {result.score:.1f}%")
 
     # 说明
     print("\n\n" + "=" * 70)
@@ -307,9 +317,15 @@ DSPy Evaluate 的核心功能:
    - display_table: 显示结果表格
 
    返回值 (EvaluationResult):
-   - score: 平均得分（浮点数 0.0-1.0）
+   - score: 平均得分（百分制 0-100）
    - results: 所有样本的详细结果列表
 
+   ParallelEvaluate / MultiMetricEvaluate（parallel_eval.py）:
+   - 每条样本只运行一次，多个指标共用同一个预测结果
+   - 有界线程池并发执行，可选限速，遇到限流自动退避重试
+   - MultiMetricEvaluate 缓存预测结果，换指标重新评估不再调用 LM
+   - format_table() 输出指标汇总表和逐条样本得分
+
 5. **实际应用场景**
    - 模型性能基准测试
    - 优化前后性能对比
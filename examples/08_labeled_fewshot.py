@@ -5,20 +5,17 @@ LabeledFewShot 是最简单直接的优化器，直接使用标注数据作为
 """
 
 import dspy
-import os
-from dotenv import load_dotenv
 from dspy.teleprompt import LabeledFewShot
-
-# 加载环境变量
-load_dotenv()
+from batch_inference import batch
+from compile_cache import cached_compile
+from knn_fewshot import KNNFewShot
+from lm_factory import configure_lm
+from prefix_cache import PrefixCacheAdapter
+from sweep import run_sweep
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     print("=" * 70)
     print("DSPy LabeledFewShot: 使用标注数据优化")
@@ -73,8 +70,9 @@ def main():
 
     optimizer = LabeledFewShot(k=3)  # k=3 表示使用3个示例
 
-    optimized_model = optimizer.compile(
-        student=dspy.Predict(SentimentAnalysis),
+    optimized_model = cached_compile(
+        optimizer,
+        dspy.Predict(SentimentAnalysis),
         trainset=labeled_examples
     )
 
@@ -98,28 +96,70 @@ def main():
     print("\n\n📋 示例 2: 不同 k 值的影响")
     print("-" * 70)
 
-    test_cases = [
-        "这家餐厅环境很好，菜品也不错。",
-        "价格太高，性价比很低。",
-        "普通水平，没有惊喜。",
+    test_set = [
+        dspy.Example(text="这家餐厅环境很好，菜品也不错。", sentiment="积极").with_inputs("text"),
+        dspy.Example(text="价格太高，性价比很低。", sentiment="消极").with_inputs("text"),
+        dspy.Example(text="普通水平，没有惊喜。", sentiment="中性").with_inputs("text"),
     ]
 
-    for k_value in [0, 2, 5]:
-        print(f"\n使用 k={k_value} 个示例:")
-
-        if k_value == 0:
-            model = dspy.Predict(SentimentAnalysis)
-            print("（未使用 Few-Shot 示例）")
-        else:
-            optimizer = LabeledFewShot(k=k_value)
-            model = optimizer.compile(
-                student=dspy.Predict(SentimentAnalysis),
-                trainset=labeled_examples
-            )
+    def exact_match(example, pred, trace=None):
+        return example.sentiment.strip() == pred.sentiment.strip()
+
+    # 所有 k 值一起编译、并发评估；k=8 超过训练集大小，demos 与 k=5 相同，提示词去重后不会重复调用
+    report = run_sweep(
+        LabeledFewShot,
+        dspy.Predict(SentimentAnalysis),
+        trainset=labeled_examples,
+        devset=test_set,
+        metric=exact_match,
+        grid=[{"k": k_value} for k_value in [0, 2, 5, 8]],
+    )
+
+    for name, rows in report.results.items():
+        print(f"\n使用 {name} 个示例:")
+        for example, prediction, _ in rows:
+            print(f"  '{example.text}' → {prediction.get('sentiment', '失败')}")
 
-        for test_text in test_cases:
-            result = model(text=test_text)
-            print(f"  '{test_text}' → {result.sentiment}")
+    print()
+    print(report.format_table())
+
+    # KNN 动态示例：每个输入只放最相似的 2 个示例，与固定的 5 个示例对比提示词开销
+    print("\n对比 KNN 动态示例（k=2）与固定示例（k=5）:")
+
+    def make_optimizer(optimizer, k):
+        return KNNFewShot(k=k) if optimizer == "knn" else LabeledFewShot(k=k)
+
+    report = run_sweep(
+        make_optimizer,
+        dspy.Predict(SentimentAnalysis),
+        trainset=labeled_examples,
+        devset=test_set,
+        metric=exact_match,
+        grid=[{"optimizer": "labeled", "k": 5}, {"optimizer": "knn", "k": 2}],
+    )
+    print(report.format_table())
+
+    knn_model = report.programs["optimizer=knn, k=2"]
+    print(f"\n'{test_set[1].text}' 选中的示例:")
+    for demo in knn_model.select(**test_set[1].inputs()):
+        print(f"  {demo.text} → {demo.sentiment}")
+
+    # 前缀缓存布局：指令和示例在前、输入在最后，后端可以复用相同前缀的缓存（见 prefix_cache.py）
+    print("\n前缀缓存布局（PrefixCacheAdapter）:")
+    for name, model in [("固定示例 k=3", optimized_model), ("KNN k=2", knn_model)]:
+        adapter = PrefixCacheAdapter()
+        with dspy.context(adapter=adapter):
+            for example in test_set:
+                # 跳过本地响应缓存，才能拿到后端报告的缓存命中数
+                model(**example.inputs(), config={"cache": False})
+        print(f"\n{name}:")
+        for record in adapter.records:
+            print(
+                f"  前缀 {record.prefix_hash[:8]}（约 {record.prefix_tokens} tokens）"
+                f" prompt {record.prompt_tokens}，命中缓存 {record.cached_tokens}"
+            )
+        summary = adapter.summary()
+        print(f"  不同前缀数: {summary['prefixes']}，缓存命中率: {summary['cache_hit_rate']:.0%}")
 
     # 示例 3: 更复杂的任务 - 问答
     print("\n\n📋 示例 3: 问答任务的 LabeledFewShot")
@@ -155,8 +195,9 @@ def main():
     # 优化问答模型
     print("\n优化问答模型...")
     qa_optimizer = LabeledFewShot(k=3)
-    qa_model = qa_optimizer.compile(
-        student=dspy.ChainOfThought(QuestionAnswer),
+    qa_model = cached_compile(
+        qa_optimizer,
+        dspy.ChainOfThought(QuestionAnswer),
         trainset=qa_examples
     )
     print("✓ 优化完成")
@@ -168,10 +209,10 @@ def main():
         "什么是递归？",
     ]
 
-    for question in test_questions:
-        result = qa_model(question=question)
+    results = batch(qa_model, [{"question": question} for question in test_questions], concurrency=8)
+    for question, result in zip(test_questions, results):
         print(f"\n问题: {question}")
-        print(f"答案: {result.answer}")
+        print(f"答案: {result}" if isinstance(result, Exception) else f"答案: {result.answer}")
 
     # 示例 4: LabeledFewShot vs BootstrapFewShot
     print("\n\n📋 示例 4: LabeledFewShot vs BootstrapFewShot 对比")
@@ -5,59 +5,20 @@ ProgramOfThought: 模型生成代码 → 执行代码 → 得到答案
 """
 
 import dspy
-import os
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
+from batch_inference import batch
+from lm_factory import configure_lm
+from sandbox import default_pool
 
 def safe_execute(code: str) -> str:
     """
     安全执行生成的代码
-    只允许基本的数学运算和数据操作
+    交给预启动的沙箱进程池执行：受限的内置函数、墙钟超时、CPU 时间与内存上限
     """
-    try:
-        # 创建受限的命名空间
-        allowed_builtins = {
-            'abs': abs,
-            'max': max,
-            'min': min,
-            'sum': sum,
-            'len': len,
-            'round': round,
-            'sorted': sorted,
-            'list': list,
-            'dict': dict,
-            'set': set,
-            'range': range,
-        }
-
-        # 执行代码
-        local_vars = {}
-        exec(code, {"__builtins__": allowed_builtins}, local_vars)
-
-        # 查找结果变量（通常是 'result' 或 'answer'）
-        if 'result' in local_vars:
-            return str(local_vars['result'])
-        elif 'answer' in local_vars:
-            return str(local_vars['answer'])
-        else:
-            # 返回最后一个变量的值
-            if local_vars:
-                last_var = list(local_vars.values())[-1]
-                return str(last_var)
-            return "代码执行成功，但没有返回结果"
-
-    except Exception as e:
-        return f"执行错误: {str(e)}"
+    return str(default_pool().run(code))
 
 def main():
-    # 配置语言模型 - 使用 DeepSeek
-    lm = dspy.LM(
-        'deepseek/deepseek-chat',
-        api_key=os.getenv('DEEPSEEK_API_KEY')
-    )
-    dspy.configure(lm=lm)
+    # 配置语言模型 - 使用共享的 DeepSeek LM（带连接池）
+    lm = configure_lm()
 
     print("=" * 70)
     print("DSPy ProgramOfThought: 通过代码解决问题")
@@ -149,6 +110,18 @@ def main():
                 result=execution_result
             )
 
+        def solve_many(self, problems):
+            """批量求解：并发生成代码，再把所有代码一次性交给沙箱进程池执行"""
+            generations = batch(self.generate_code, [{"problem": p} for p in problems])
+            codes = [g.code if not isinstance(g, Exception) else "" for g in generations]
+            executions = default_pool().map(codes)
+            return [
+                dspy.Prediction(reasoning=g.reasoning, code=g.code, result=str(e))
+                if not isinstance(g, Exception)
+                else dspy.Prediction(reasoning="", code="", result=f"生成失败: {g}")
+                for g, e in zip(generations, executions)
+            ]
+
     # 使用自定义模块
     pot = ProgramOfThought()
 
@@ -158,9 +131,9 @@ def main():
         "斐波那契数列的第10个数是多少？（第1个是1，第2个是1）",
     ]
 
-    for i, problem in enumerate(problems, 1):
+    # 批量模式：代码生成与执行都并发进行；相同的代码片段只编译一次
+    for i, (problem, result) in enumerate(zip(problems, pot.solve_many(problems)), 1):
         print(f"\n问题 {i}: {problem}")
-        result = pot(problem=problem)
         print(f"\n解题思路: {result.reasoning}")
         print(f"\n生成的代码:")
         print(result.code)
@@ -212,6 +185,18 @@ def main():
     print(result.code)
     print(f"\n结果: {result.result}")
 
+    # 示例 6: 沙箱保护
+    print("\n\n📋 示例 6: 沙箱保护 - 失控的代码不会拖垮进程")
+    print("-" * 70)
+
+    for code in ["while True:\n    pass", "data = [0] * (10 ** 10)", "import os\nresult = os.listdir('/')"]:
+        execution = default_pool().run(code, timeout=1.0)
+        print(f"\n代码: {code.splitlines()[0]} ...")
+        print(f"错误: {execution.error}（耗时 {execution.elapsed:.2f}s）")
+
+    cache = default_pool().code_cache
+    print(f"\n编译缓存: 命中 {cache.hits} 次，编译 {cache.misses} 次")
+
     # 说明
     print("\n\n" + "=" * 70)
     print("💡 ProgramOfThought 的特点和优势")
@@ -260,7 +245,7 @@ ProgramOfThought (程序思维) 的核心思想:
       - 提供代码规范
 
    b) 代码执行
-      - 安全沙箱环境
+      - 安全沙箱环境（本示例使用 sandbox.py 的预启动进程池）
       - 限制危险操作
       - 错误处理
 
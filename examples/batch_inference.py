@@ -0,0 +1,99 @@
+"""
+异步批量推理
+对一批输入并发调用同一个模块，代替逐条调用的 for 循环
+
+- 基于 asyncio：Predict / ChainOfThought 等自带 aforward 的模块走异步 LM 调用，
+  只实现了 forward 的自定义模块放到线程里执行
+- 结果顺序与输入顺序一致
+- concurrency 限制同时在途的调用数
+- 单条失败不影响其他输入：默认在对应位置返回异常对象
+- 同步的 batch() 在进程级常驻的后台事件循环上执行：共享的异步 httpx 客户端绑定在
+  创建它的事件循环上，每次 asyncio.run 新建、关闭事件循环会使其失效
+
+用法:
+    results = batch(classifier, [{"text": t} for t in texts], concurrency=8)
+    for text, result in zip(texts, results):
+        if isinstance(result, Exception):
+            print(f"{text} 失败: {result}")
+        else:
+            print(f"{text} → {result.sentiment}")
+
+    # 已在事件循环中时使用 abatch
+    results = await abatch(classifier, inputs, concurrency=8)
+"""
+
+import asyncio
+import contextvars
+import threading
+
+import dspy
+
+from tracing import mark_queued
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _kwargs(item):
+    """输入可以是关键字参数字典，也可以是 dspy.Example（只取 inputs 部分）"""
+    if isinstance(item, dspy.Example):
+        return item.inputs().toDict()
+    return dict(item)
+
+
+async def abatch(module, inputs, concurrency=8, return_exceptions=True):
+    """
+    并发调用 module，返回与 inputs 等长、同顺序的结果列表
+
+    Args:
+        module: dspy 模块
+        inputs: 关键字参数字典或 dspy.Example 的列表
+        concurrency: 最大在途调用数
+        return_exceptions: True 时失败的输入在对应位置返回异常对象；False 时遇到第一个异常直接抛出
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    is_async = hasattr(module, "aforward")
+
+    async def run_one(item):
+        kwargs = _kwargs(item)
+        # 等待信号量的时间记为排队时间（见 tracing.py）
+        mark_queued()
+        async with semaphore:
+            try:
+                if is_async:
+                    return await module.acall(**kwargs)
+                # to_thread 会复制当前上下文，dspy.context(...) 中的设置在线程里同样生效
+                return await asyncio.to_thread(module, **kwargs)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+    return await asyncio.gather(*(run_one(item) for item in inputs))
+
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="batch-inference", daemon=True).start()
+    return _loop
+
+
+def run_sync(coroutine):
+    """在后台事件循环上执行协程，阻塞直到完成"""
+    # 后台事件循环不继承调用方的上下文，手动带上 dspy.context(...) 等设置
+    context = contextvars.copy_context()
+
+    async def run():
+        for var, value in context.items():
+            var.set(value)
+        return await coroutine
+
+    return asyncio.run_coroutine_threadsafe(run(), _background_loop()).result()
+
+
+def batch(module, inputs, concurrency=8, return_exceptions=True):
+    """abatch 的同步版本，阻塞直到所有输入完成"""
+    return run_sync(abatch(module, inputs, concurrency=concurrency, return_exceptions=return_exceptions))
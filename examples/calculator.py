@@ -0,0 +1,165 @@
+"""
+安全的算术表达式求值
+替代 eval(expression, {"__builtins__": {}}, {})：eval 每次都要重新编译，
+而且无法限制 9**9**9 这类会吃满 CPU 和内存的表达式
+
+- 用 ast 解析，只允许白名单内的节点：数字、+ - * / // % **、一元正负号、
+  常量 pi / e 以及少量函数（abs、round、min、max、sqrt）
+- 解析结果编译成嵌套闭包，按表达式文本 LRU 缓存，重复计算不再解析
+- 乘方先估算结果位数，指数或结果量级超过上限时直接报错，不会真正去算
+- 每一步运算后检查结果量级
+- evaluate_many 批量求值：相同的表达式只计算一次
+
+用法:
+    evaluate("100 * 0.8 - 20")           # 60.0
+    evaluate("9 ** 9 ** 9")              # CalculationError: 指数过大
+    evaluate_many(["1 + 1", "2 ** 10"])  # [2, 1024]
+"""
+
+import ast
+import math
+import operator
+from functools import lru_cache
+
+MAX_EXPRESSION_LENGTH = 500
+MAX_EXPONENT = 10_000
+MAX_DIGITS = 100  # 结果的绝对值不超过 10**MAX_DIGITS
+MAX_MAGNITUDE = 10 ** MAX_DIGITS
+COMPILE_CACHE_SIZE = 4096
+
+
+class CalculationError(ValueError):
+    """表达式不合法或超出计算限制"""
+
+
+def _check(value):
+    if isinstance(value, complex):
+        raise CalculationError("结果不是实数")
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise CalculationError("结果不是有限数")
+    if abs(value) > MAX_MAGNITUDE:
+        raise CalculationError(f"结果过大（超过 1e{MAX_DIGITS}）")
+    return value
+
+
+def _pow(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationError(f"指数过大（超过 {MAX_EXPONENT}）")
+    # 先估算结果的位数，避免真正计算一个巨大的整数
+    if base != 0 and exponent > 0 and math.log10(abs(base)) * exponent > MAX_DIGITS:
+        raise CalculationError(f"结果过大（超过 1e{MAX_DIGITS}）")
+    if base == 0 and exponent < 0:
+        raise CalculationError("除数为零")
+    return operator.pow(base, exponent)
+
+
+def _divide(op):
+    def divide(a, b):
+        if b == 0:
+            raise CalculationError("除数为零")
+        return op(a, b)
+
+    return divide
+
+
+def _sqrt(x):
+    if x < 0:
+        raise CalculationError("负数不能开平方")
+    return math.sqrt(x)
+
+
+def _round(number, ndigits=None):
+    # 内置 round 接受任意 ndigits，round(7, -3000000) 要算好几秒，位数越大越慢
+    if ndigits is None:
+        return round(number)
+    if not isinstance(ndigits, int) or abs(ndigits) > MAX_DIGITS:
+        raise CalculationError(f"round 的位数必须是绝对值不超过 {MAX_DIGITS} 的整数")
+    return round(number, ndigits)
+
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: _divide(operator.truediv),
+    ast.FloorDiv: _divide(operator.floordiv),
+    ast.Mod: _divide(operator.mod),
+    ast.Pow: _pow,
+}
+_UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+_FUNCTIONS = {"abs": abs, "round": _round, "min": min, "max": max, "sqrt": _sqrt}
+
+
+def _compile(node):
+    """把 AST 节点编译成无参闭包；遇到白名单以外的节点时报错"""
+    if isinstance(node, ast.Expression):
+        return _compile(node.body)
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise CalculationError(f"不支持的常量: {node.value!r}")
+        value = _check(node.value)
+        return lambda: value
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op, left, right = _BINARY[type(node.op)], _compile(node.left), _compile(node.right)
+        return lambda: _check(op(left(), right()))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        op, operand = _UNARY[type(node.op)], _compile(node.operand)
+        return lambda: op(operand())
+
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        value = _CONSTANTS[node.id]
+        return lambda: value
+
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in _FUNCTIONS
+        and not node.keywords
+    ):
+        func, args = _FUNCTIONS[node.func.id], [_compile(arg) for arg in node.args]
+        return lambda: _check(func(*(arg() for arg in args)))
+
+    raise CalculationError(f"不支持的语法: {ast.unparse(node)}")
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_expression(expression):
+    """解析并编译表达式，返回无参可调用对象（按表达式文本缓存）"""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError(f"表达式过长（超过 {MAX_EXPRESSION_LENGTH} 个字符）")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise CalculationError(f"语法错误: {e.msg}") from None
+    return _compile(tree)
+
+
+def evaluate(expression):
+    """计算单个表达式；不合法或超出限制时抛出 CalculationError"""
+    try:
+        return compile_expression(expression)()
+    except CalculationError:
+        raise
+    except (ArithmeticError, TypeError, ValueError) as e:
+        raise CalculationError(str(e)) from None
+
+
+def evaluate_many(expressions, return_exceptions=True):
+    """
+    批量求值，结果与输入顺序一致；相同的表达式只计算一次
+    return_exceptions=True 时失败的表达式返回 CalculationError 对象，而不是中断整批
+    """
+    results = {}
+    for expression in dict.fromkeys(expressions):
+        try:
+            results[expression] = evaluate(expression)
+        except CalculationError as e:
+            if not return_exceptions:
+                raise
+            results[expression] = e
+    return [results[expression] for expression in expressions]
@@ -0,0 +1,162 @@
+"""
+枚举约束的分类模式
+情感分类这类任务的输出只能是固定的几个标签（积极 / 消极 / 中性），
+但 ChatAdapter 仍会让模型输出完整的 [[ ## sentiment ## ]] ... [[ ## completed ## ]] 结构，
+解析后再由约束检查、修复——大部分 completion token 都花在了格式标记上
+
+Classify 为只有一个输出字段的分类 Signature 提供最小化输出的模式:
+- 标签来自字段的 Literal 类型，或字段上声明的 OneOf 约束，也可以直接传入
+- 提示词要求只回答标签本身（不带字段标记），few-shot 示例也按同样的格式给出
+- max_tokens 按最长标签的 token 数收紧，模型无法生成多余的内容
+- 解析先做规范化后的字典查找（O(1)），查不到时用 Aho-Corasick 在回答中找第一个标签；
+  都失败时直接报错，不再退回 JSONAdapter 重新生成一次
+- 统计精确命中和兜底匹配的次数
+
+用法:
+    classifier = Classify(EmotionClassifier, labels=["积极", "消极", "中性"])
+    classifier(text="这个产品真的太棒了").sentiment  # "积极"
+"""
+
+import typing
+from collections import Counter
+
+import dspy
+from dspy.adapters.chat_adapter import FieldInfoWithName
+from dspy.adapters.utils import translate_field_type
+from dspy.signatures.signature import ensure_signature
+from dspy.utils.exceptions import AdapterParseError
+
+from constraints import AhoCorasick, OneOf
+from token_count import estimate_tokens
+
+LABEL_ONLY_INSTRUCTION = "Answer with the label only"
+# 标签之外留出的 token 余量（不同分词器对同一个标签的切分不同）
+MAX_TOKENS_MARGIN = 4
+
+_STRIP_CHARS = " \t\r\n\"'`“”‘’「」『』.,。，!！:：;；*"
+
+
+def _normalize(text):
+    return text.strip(_STRIP_CHARS).lower()
+
+
+def labels_of(field):
+    """从字段的 Literal 类型或 OneOf 约束中取标签；都没有时返回 None"""
+    if typing.get_origin(field.annotation) is typing.Literal:
+        return [str(label) for label in typing.get_args(field.annotation)]
+    for constraint in field.metadata:
+        if isinstance(constraint, OneOf):
+            # frozenset 的迭代顺序随进程变化，排序后提示词才稳定（请求缓存才能命中）
+            return sorted(constraint.values)
+    return None
+
+
+def label_max_tokens(labels):
+    """只回答一个标签所需的 max_tokens"""
+    return 2 * max(estimate_tokens(label) for label in labels) + MAX_TOKENS_MARGIN
+
+
+class LabelAdapter(dspy.ChatAdapter):
+    """
+    只输出标签的适配器：输入部分沿用 ChatAdapter 的格式，输出只有标签本身
+
+    Args:
+        field: 分类字段名
+        labels: 有效标签
+    """
+
+    def __init__(self, field, labels):
+        super().__init__()
+        self.field = field
+        self.labels = tuple(labels)
+        self._lookup = {_normalize(label): label for label in self.labels}
+        self._automaton = AhoCorasick([label.lower() for label in self.labels])
+        self.matches = Counter()
+
+    def _label_list(self):
+        return " / ".join(self.labels)
+
+    def format_field_structure(self, signature):
+        parts = ["All interactions will be structured in the following way, with the appropriate values filled in."]
+        parts.append(
+            self.format_field_with_value(
+                {
+                    FieldInfoWithName(name=name, info=info): translate_field_type(name, info)
+                    for name, info in signature.input_fields.items()
+                }
+            )
+        )
+        parts.append(
+            f"{LABEL_ONLY_INSTRUCTION} for `{self.field}`: exactly one of {self._label_list()}, "
+            "without field markers or explanation."
+        )
+        return "\n\n".join(parts).strip()
+
+    def user_message_output_requirements(self, signature):
+        return f"{LABEL_ONLY_INSTRUCTION}: one of {self._label_list()}."
+
+    def format_assistant_message_content(self, signature, outputs, missing_field_message=None):
+        return str(outputs.get(self.field, missing_field_message))
+
+    def parse(self, signature, completion):
+        label = self._lookup.get(_normalize(completion))
+        if label is not None:
+            self.matches["exact"] += 1
+            return {self.field: label}
+
+        # 模型没有严格遵守格式（带了字段标记或解释）：取回答中最先出现的标签
+        match = next(self._automaton.iter_matches(completion.lower()), None)
+        if match is not None:
+            self.matches["fallback"] += 1
+            return {self.field: self.labels[match[1]]}
+
+        self.matches["failed"] += 1
+        raise AdapterParseError(
+            adapter_name="LabelAdapter",
+            signature=signature,
+            lm_response=completion,
+            message=f"回答中没有有效标签（{self._label_list()}）",
+        )
+
+    # 不继承 ChatAdapter 解析失败时退回 JSONAdapter 的行为：
+    # 在收紧的 max_tokens 下重新生成 JSON 也只会再失败一次
+
+    def __call__(self, lm, lm_kwargs, signature, demos, inputs):
+        return dspy.Adapter.__call__(self, lm, lm_kwargs, signature, demos, inputs)
+
+    async def acall(self, lm, lm_kwargs, signature, demos, inputs):
+        return await dspy.Adapter.acall(self, lm, lm_kwargs, signature, demos, inputs)
+
+
+class Classify(dspy.Predict):
+    """
+    枚举约束的分类 Predict
+
+    Args:
+        signature: 分类 Signature（只有一个输出字段）
+        labels: 有效标签（默认从字段的 Literal 类型或 OneOf 约束中取）
+        max_tokens: 默认按最长标签估算
+        **config: 其余传给 dspy.Predict 的 LM 参数
+    """
+
+    def __init__(self, signature, labels=None, max_tokens=None, **config):
+        signature = ensure_signature(signature)
+        if len(signature.output_fields) != 1:
+            raise ValueError(f"Classify 只支持一个输出字段，当前为: {', '.join(signature.output_fields)}")
+        field = next(iter(signature.output_fields))
+        labels = list(labels or labels_of(signature.output_fields[field]) or [])
+        if not labels:
+            raise ValueError(f"字段 {field} 没有声明标签：请使用 Literal 类型、OneOf 约束或传入 labels")
+
+        signature = signature.with_updated_fields(field, type_=typing.Literal[tuple(labels)])
+        config.setdefault("max_tokens", max_tokens or label_max_tokens(labels))
+        super().__init__(signature, **config)
+        self.adapter = LabelAdapter(field, labels)
+
+    def forward(self, **kwargs):
+        with dspy.context(adapter=self.adapter):
+            return super().forward(**kwargs)
+
+    async def aforward(self, **kwargs):
+        with dspy.context(adapter=self.adapter):
+            return await super().aforward(**kwargs)
@@ -0,0 +1,273 @@
+"""
+优化器编译缓存
+BootstrapFewShot.compile / LabeledFewShot.compile 每次运行都从头开始，
+训练集和学生模块都没变时，也要把所有 bootstrap 的 LM 调用再走一遍。
+这里把编译结果（各 Predict 的 demos 和指令）按内容寻址保存到磁盘，之后直接加载
+
+- 键为以下内容的 SHA-256:
+  学生模块（类型、每个 Predict 的 Signature、config、已有 demos）、训练集（含输入字段）、
+  优化器（类型和构造参数，指标函数按源码计算指纹）、compile 的其它参数、当前 LM（模型名和参数）与适配器
+- 任何一项改变都会得到新的键，旧条目不会被误用
+- 文件格式与 program.save("xxx.json") 相同，也可以直接用 program.load() 加载
+- 写入先写临时文件再原子替换，多个进程同时编译不会读到半个文件
+- 编译结果不是学生模块本身的优化器（如 knn_fewshot.KNNFewShot）通过 compiled_skeleton(student)
+  提供加载用的空程序；程序的非 JSON 状态（如向量索引）由 save_sidecar(path) 保存在 JSON 旁边的同名文件中，
+  由程序自己的 load(path) 一并读取
+
+环境变量:
+    COMPILE_CACHE=0        关闭缓存
+    COMPILE_CACHE_DIR=...  缓存目录（默认 ~/.dspy_learning/compiled）
+
+用法:
+    optimized = cached_compile(BootstrapFewShot(metric=metric), Classify(EmotionClassifier), trainset=trainset)
+
+查看或清空缓存:
+    python examples/compile_cache.py
+    python examples/compile_cache.py --clear
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+import dspy
+from dspy.utils.saving import get_dependency_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = os.path.join(Path.home(), ".dspy_learning", "compiled")
+# 缓存条目：<sha256 键>.json，以及程序附带的 <sha256 键>.npz（如 knn_fewshot 的向量索引）
+ENTRY_SUFFIXES = (".json", ".npz")
+_KEY_RE = re.compile(r"[0-9a-f]{64}")
+# 只影响请求怎么发出去、不影响编译结果的 LM 参数
+_LM_TRANSPORT_KWARGS = {"api_key", "api_base", "base_url", "client_session", "aclient_session"}
+
+
+def _callable_fingerprint(fn):
+    """函数按限定名 + 源码哈希区分；拿不到源码（内置函数等）时只用限定名"""
+    name = f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', type(fn).__qualname__)}"
+    try:
+        source = inspect.getsource(fn)
+    except (OSError, TypeError):
+        return name
+    return f"{name}:{hashlib.sha256(source.encode()).hexdigest()[:16]}"
+
+
+def _signature_fingerprint(signature):
+    return {
+        "instructions": signature.instructions,
+        "fields": [
+            {
+                "name": name,
+                "annotation": str(field.annotation),
+                "extra": _fingerprint(field.json_schema_extra),
+                "metadata": [repr(m) for m in field.metadata],
+            }
+            for name, field in signature.fields.items()
+        ],
+    }
+
+
+def _program_fingerprint(program):
+    return {
+        "type": type(program).__qualname__,
+        "predictors": [
+            {
+                "name": name,
+                "type": type(predictor).__qualname__,
+                "signature": _signature_fingerprint(predictor.signature),
+                "config": _fingerprint(predictor.config),
+                "demos": _fingerprint(predictor.demos),
+            }
+            for name, predictor in program.named_predictors()
+        ],
+    }
+
+
+def _fingerprint(value):
+    """把任意对象转换成可稳定序列化的结构（不含内存地址等每次运行都会变化的内容）"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dspy.Example):
+        return {"inputs": sorted(value._input_keys or []), "data": _fingerprint(value.toDict())}
+    if isinstance(value, dict):
+        return {str(k): _fingerprint(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_fingerprint(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(repr(v) for v in value)
+    if isinstance(value, dspy.BaseLM):
+        # 密钥、接入地址和连接池只影响请求怎么发出去，不影响编译结果：轮换密钥、换代理后缓存仍然有效
+        kwargs = {k: v for k, v in value.kwargs.items() if k not in _LM_TRANSPORT_KWARGS}
+        return {"model": value.model, "kwargs": _fingerprint(kwargs)}
+    if isinstance(value, dspy.Module):
+        return _program_fingerprint(value)
+    if callable(getattr(value, "config", None)):
+        # 带 config() 的对象（如 HashingEmbedder）按配置区分
+        return {"type": type(value).__qualname__, "config": _fingerprint(value.config())}
+    if callable(value):
+        return _callable_fingerprint(value)
+    return repr(value)
+
+
+def _optimizer_fingerprint(optimizer):
+    # 只取构造参数：compile 之后优化器上还会挂 trainset、student 等运行时状态
+    params = inspect.signature(type(optimizer).__init__).parameters
+    return {
+        "type": type(optimizer).__qualname__,
+        "config": {name: _fingerprint(getattr(optimizer, name)) for name in params if hasattr(optimizer, name)},
+    }
+
+
+def compile_key(optimizer, student, trainset, **compile_kwargs):
+    """一次编译的内容哈希"""
+    adapter = dspy.settings.adapter
+    payload = {
+        "student": _program_fingerprint(student),
+        "trainset": _fingerprint(list(trainset)),
+        "optimizer": _optimizer_fingerprint(optimizer),
+        "compile_kwargs": _fingerprint(compile_kwargs),
+        "lm": _fingerprint(dspy.settings.lm),
+        "adapter": type(adapter).__qualname__ if adapter is not None else None,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class CompileCache:
+    """
+    按内容寻址的编译结果缓存（每个编译结果一个 JSON 文件）
+
+    Args:
+        directory: 缓存目录
+    """
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return self.directory / f"{key}.json"
+
+    def load(self, key, student, optimizer=None):
+        """加载编译结果到 student 的副本（或优化器提供的空程序）上；不存在时返回 None"""
+        path = self.path(key)
+        if not path.exists():
+            return None
+        skeleton = getattr(optimizer, "compiled_skeleton", None)
+        program = skeleton(student) if skeleton is not None else student.deepcopy()
+        try:
+            program.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"编译缓存 {path.name} 无法加载，重新编译: {e}")
+            return None
+        # 保存时 demos 被序列化成 dict，恢复成 Example 才能继续用属性访问
+        for predictor in program.predictors():
+            predictor.demos = [dspy.Example(**d) if isinstance(d, dict) else d for d in predictor.demos]
+        program._compiled = True
+        return program
+
+    def save(self, key, program, optimizer, elapsed):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        state = program.dump_state()
+        state["metadata"] = {
+            "dependency_versions": get_dependency_versions(),
+            "compile_cache": {"optimizer": type(optimizer).__qualname__, "compile_seconds": elapsed, "created": time.time()},
+        }
+        path = self.path(key)
+        # 先写附属文件：JSON 存在就意味着附属文件已经完整
+        if hasattr(program, "save_sidecar"):
+            program.save_sidecar(path)
+        tmp = path.with_name(f".{path.stem}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def compile(self, optimizer, student, *, trainset, **compile_kwargs):
+        """与 optimizer.compile(student, trainset=..., ...) 等价，命中缓存时直接加载"""
+        start = time.perf_counter()
+        key = compile_key(optimizer, student, trainset, **compile_kwargs)
+        program = self.load(key, student, optimizer)
+        if program is not None:
+            self.hits += 1
+            logger.info(f"编译缓存命中 {key[:12]}，加载耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+            return program
+
+        self.misses += 1
+        program = optimizer.compile(student, trainset=trainset, **compile_kwargs)
+        elapsed = time.perf_counter() - start
+        self.save(key, program, optimizer, elapsed)
+        logger.info(f"编译缓存未命中 {key[:12]}，编译耗时 {elapsed:.2f}s，已保存")
+        return program
+
+    def entries(self):
+        """[(键, 优化器, 原始编译耗时, 文件大小)]，按修改时间从新到旧"""
+        rows = []
+        for path in sorted(self._entry_paths((".json",)), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                meta = json.loads(path.read_text(encoding="utf-8"))["metadata"].get("compile_cache", {})
+            except (OSError, ValueError, KeyError):
+                meta = {}
+            rows.append((path.stem, meta.get("optimizer", "?"), meta.get("compile_seconds", 0.0), path.stat().st_size))
+        return rows
+
+    def _entry_paths(self, suffixes=ENTRY_SUFFIXES):
+        """目录中属于缓存条目的文件：文件名是 64 位十六进制的键，后缀为 .json 或 .npz（目录可能与其他文件共用）"""
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.iterdir():
+            if path.suffix in suffixes and _KEY_RE.fullmatch(path.stem) and path.is_file():
+                yield path
+
+    def clear(self):
+        for path in self._entry_paths():
+            path.unlink(missing_ok=True)
+
+
+_default_cache = None
+
+
+def cache_from_env():
+    """按环境变量创建缓存；COMPILE_CACHE=0 时返回 None"""
+    if os.getenv("COMPILE_CACHE", "1") == "0":
+        return None
+    return CompileCache(os.getenv("COMPILE_CACHE_DIR", DEFAULT_DIR))
+
+
+def cached_compile(optimizer, student, *, trainset, cache=None, **compile_kwargs):
+    """
+    带缓存的 optimizer.compile
+    cache 默认按环境变量创建（进程内共享一个）；缓存关闭时等同于直接调用 compile
+    """
+    global _default_cache
+
+    if cache is None:
+        if _default_cache is None:
+            _default_cache = cache_from_env() or False
+        cache = _default_cache
+    if not cache:
+        return optimizer.compile(student, trainset=trainset, **compile_kwargs)
+    return cache.compile(optimizer, student, trainset=trainset, **compile_kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看或清空优化器编译缓存")
+    parser.add_argument("--dir", default=os.getenv("COMPILE_CACHE_DIR", DEFAULT_DIR))
+    parser.add_argument("--clear", action="store_true", help="清空缓存")
+    args = parser.parse_args()
+
+    cache = CompileCache(args.dir)
+    if args.clear:
+        cache.clear()
+        print(f"已清空 {args.dir}")
+    entries = cache.entries()
+    print(f"缓存目录: {args.dir}")
+    print(f"条目数: {len(entries)}")
+    for key, optimizer, seconds, size in entries:
+        print(f"  {key[:12]}  {optimizer:<20}  编译 {seconds:>7.2f}s  {size / 1024:>6.1f} KiB")
@@ -0,0 +1,389 @@
+"""
+声明式输出约束
+不再在每个模块的 forward 里手写长度、前缀、取值范围、关键词检查，
+而是把约束直接声明在 Signature 的输出字段上，由库统一编译、校验、修复
+
+    class ShortSummary(dspy.Signature):
+        text: str = dspy.InputField(desc="原文")
+        summary: Annotated[str, MaxChars(50)] = dspy.OutputField(desc="简短摘要（不超过50字）")
+
+- 约束写在 Annotated 元数据里，不影响 DSPy 的提示词和解析（字段类型仍是 str）
+- compile_validator(Signature) 把所有字段的约束编译成一个验证器并缓存：
+  正则预编译，短语集合构建成 Aho-Corasick 自动机，一次扫描完成匹配
+- 验证器记录每条约束的检查次数和违反次数
+- Constrained 是通用的重试 + 修复包装器：违反约束时重试，仍不满足时调用约束自带的修复
+- 部分约束支持增量检查（check_partial）：流式生成时只看已生成的前缀就能判定违反，
+  见 streaming.py
+
+可用约束: MaxChars、MinChars、StartsWith、Pattern、OneOf、NumberRange、ContainsAny、Predicate
+"""
+
+import logging
+import re
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+import dspy
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------- Aho-Corasick
+
+
+class AhoCorasick:
+    """多模式串匹配自动机：构建一次，之后每次匹配只需扫描文本一遍"""
+
+    def __init__(self, phrases):
+        self.phrases = list(phrases)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        for i, phrase in enumerate(self.phrases):
+            state = 0
+            for char in phrase:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].add(i)
+
+        # BFS 计算失配指针，并把失配状态的输出合并进来
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def iter_matches(self, text):
+        """依次产出 (结束位置, 短语下标)"""
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for i in self._output[state]:
+                yield pos, i
+
+    def contains_any(self, text):
+        return next(self.iter_matches(text), None) is not None
+
+    def found(self, text):
+        """文本中出现过的短语集合"""
+        return {self.phrases[i] for _, i in self.iter_matches(text)}
+
+
+# ---------------------------------------------------------------- 约束
+
+
+class Constraint:
+    """
+    约束基类
+    子类实现 check(value, inputs) -> bool，可选实现 repair(value, inputs) 返回修复后的值；
+    check_partial(prefix, inputs) 对生成到一半的前缀判断：只有确定已经违反时才返回 False
+    """
+
+    name = "constraint"
+
+    def check(self, value, inputs):
+        raise NotImplementedError
+
+    def check_partial(self, prefix, inputs):
+        return True
+
+    def message(self, value):
+        return f"不满足约束 {self.name}"
+
+    repair = None
+
+    def __repr__(self):
+        return self.name
+
+
+class MaxChars(Constraint):
+    def __init__(self, limit, ellipsis="..."):
+        self.limit = limit
+        self.ellipsis = ellipsis
+        self.name = f"max_chars({limit})"
+
+    def check(self, value, inputs):
+        return len(value) <= self.limit
+
+    check_partial = check
+
+    def message(self, value):
+        return f"长度过长（{len(value)}字，上限{self.limit}字）"
+
+    def repair(self, value, inputs):
+        return value[: self.limit - len(self.ellipsis)] + self.ellipsis
+
+
+class MinChars(Constraint):
+    def __init__(self, limit):
+        self.limit = limit
+        self.name = f"min_chars({limit})"
+
+    def check(self, value, inputs):
+        return len(value) >= self.limit
+
+    def message(self, value):
+        return f"长度过短（{len(value)}字，至少{self.limit}字）"
+
+
+class Pattern(Constraint):
+    """正则约束（预编译），默认 search，fullmatch=True 时要求整体匹配"""
+
+    def __init__(self, pattern, fullmatch=False, name=None, hint=None):
+        self.regex = re.compile(pattern)
+        self._match = self.regex.fullmatch if fullmatch else self.regex.search
+        self.hint = hint
+        self.name = name or f"pattern({pattern})"
+
+    def check(self, value, inputs):
+        return self._match(value) is not None
+
+    def message(self, value):
+        return self.hint or f"不匹配 {self.regex.pattern}"
+
+
+class StartsWith(Pattern):
+    def __init__(self, prefix, alternatives=()):
+        self.prefix = prefix
+        self.choices = (prefix, *alternatives)
+        choices = "|".join(re.escape(p) for p in self.choices)
+        super().__init__(rf"^\s*(?:{choices})", name=f"starts_with({prefix})", hint=f"缺少'{prefix}'前缀")
+
+    def check_partial(self, prefix, inputs):
+        prefix = prefix.lstrip()
+        return any(prefix.startswith(c) or c.startswith(prefix) for c in self.choices)
+
+    def repair(self, value, inputs):
+        return f"{self.prefix} {value}"
+
+
+class OneOf(Constraint):
+    def __init__(self, values, default=None):
+        self.values = frozenset(values)
+        self.default = default
+        self.name = f"one_of({'/'.join(values)})"
+        if default is not None:
+            self.repair = lambda value, inputs: self.default
+
+    def check(self, value, inputs):
+        return value.strip() in self.values
+
+    def check_partial(self, prefix, inputs):
+        prefix = prefix.strip()
+        return any(v.startswith(prefix) for v in self.values)
+
+    def message(self, value):
+        return f"'{value}' 不在有效范围内（{'、'.join(sorted(self.values))}）"
+
+
+class NumberRange(Constraint):
+    """文本中的数字（允许 % 后缀）落在 [low, high] 内"""
+
+    _NUMBER = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*%?\s*$")
+
+    def __init__(self, low, high, default=None):
+        self.low = low
+        self.high = high
+        self.default = default
+        self.name = f"number_range({low}, {high})"
+        if default is not None:
+            self.repair = lambda value, inputs: self.default
+
+    def check(self, value, inputs):
+        match = self._NUMBER.match(value)
+        return match is not None and self.low <= float(match.group(1)) <= self.high
+
+    def message(self, value):
+        if self._NUMBER.match(value) is None:
+            return f"'{value}' 不是数字"
+        return f"{value} 超出范围 [{self.low}, {self.high}]"
+
+
+class ContainsAny(Constraint):
+    """至少包含一个短语（Aho-Corasick 一次扫描）"""
+
+    def __init__(self, phrases, name=None, hint=None):
+        self.automaton = AhoCorasick(phrases)
+        self.hint = hint
+        self.name = name or f"contains_any({'/'.join(phrases)})"
+
+    def check(self, value, inputs):
+        return self.automaton.contains_any(value)
+
+    def message(self, value):
+        return self.hint or f"未包含以下任一短语: {'、'.join(self.automaton.phrases)}"
+
+
+class Predicate(Constraint):
+    """任意判断函数 fn(value, inputs) -> bool，用于依赖输入字段的约束"""
+
+    def __init__(self, fn, name, hint=None):
+        self.fn = fn
+        self.name = name
+        self.hint = hint
+
+    def check(self, value, inputs):
+        return bool(self.fn(value, inputs))
+
+    def message(self, value):
+        return self.hint or f"不满足 {self.name}"
+
+
+# ---------------------------------------------------------------- 验证器
+
+
+@dataclass
+class Violation:
+    field: str
+    constraint: Constraint
+    message: str
+
+    def __str__(self):
+        return f"{self.field}: {self.message}"
+
+
+class SignatureValidator:
+    """一个 Signature 所有输出字段约束的编译结果"""
+
+    def __init__(self, signature):
+        self.signature = signature
+        self.checks = tuple(
+            (name, constraint)
+            for name, field in signature.output_fields.items()
+            for constraint in field.metadata
+            if isinstance(constraint, Constraint)
+        )
+        self.counts = Counter()
+        self.violations = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, prediction, inputs=None):
+        """返回违反的约束列表（空列表表示全部满足）"""
+        inputs = inputs or {}
+        violations = []
+        for name, constraint in self.checks:
+            value = str(prediction.get(name, "") or "")
+            if not constraint.check(value, inputs):
+                violations.append(Violation(name, constraint, constraint.message(value)))
+        with self._lock:
+            self.counts.update((name, constraint.name) for name, constraint in self.checks)
+            self.violations.update((v.field, v.constraint.name) for v in violations)
+        return violations
+
+    def check_partial(self, field, prefix, inputs=None):
+        """流式生成中检查某个字段已生成的前缀，返回第一个确定违反的约束（没有则返回 None）"""
+        for name, constraint in self.checks:
+            if name == field and not constraint.check_partial(prefix, inputs or {}):
+                # 中途判定违反相当于完成了一次（失败的）检查
+                with self._lock:
+                    self.counts[(name, constraint.name)] += 1
+                    self.violations[(name, constraint.name)] += 1
+                return Violation(name, constraint, constraint.message(prefix))
+        return None
+
+    @property
+    def fields(self):
+        """声明了约束的输出字段"""
+        return list(dict.fromkeys(name for name, _ in self.checks))
+
+    def is_valid(self, prediction, inputs=None):
+        return not self(prediction, inputs)
+
+    def repair(self, prediction, violations, inputs=None):
+        """对可修复的违反调用约束的 repair，返回仍未解决的违反"""
+        inputs = inputs or {}
+        remaining = []
+        for violation in violations:
+            if violation.constraint.repair is None:
+                remaining.append(violation)
+                continue
+            value = str(prediction.get(violation.field, "") or "")
+            prediction[violation.field] = violation.constraint.repair(value, inputs)
+        return remaining
+
+    def stats(self):
+        """[(字段, 约束, 检查次数, 违反次数)]"""
+        with self._lock:
+            return [(field, name, count, self.violations[(field, name)]) for (field, name), count in self.counts.items()]
+
+
+@lru_cache(maxsize=128)
+def compile_validator(signature):
+    """按 Signature 缓存编译后的验证器"""
+    return SignatureValidator(signature)
+
+
+# ---------------------------------------------------------------- 重试与修复
+
+
+def _signature_of(module):
+    """只包含一个 Predict 的模块（Predict、ChainOfThought 等）取其 Signature"""
+    predictors = module.predictors()
+    if len(predictors) != 1:
+        raise ValueError("模块包含多个 Predict，请显式传入 signature")
+    return predictors[0].signature
+
+
+class Constrained(dspy.Module):
+    """
+    通用的约束重试 + 修复包装器
+
+    Args:
+        module: 被包装的模块
+        signature: 声明了约束的 Signature（默认取模块中唯一的 Predict 的 Signature）
+        max_retries: 违反约束后的最大重试次数；每次重试使用不同的 rollout_id 以绕过请求缓存
+        feedback_field: 重试时把违反说明追加到这个输入字段（不传则不追加）
+        repair: 重试用完后是否调用约束的修复
+    """
+
+    def __init__(self, module, signature=None, max_retries=2, feedback_field=None, repair=True):
+        super().__init__()
+        self.module = module
+        self.validator = compile_validator(signature or _signature_of(module))
+        self.max_retries = max_retries
+        self.feedback_field = feedback_field
+        self.repair = repair
+
+    @staticmethod
+    def _attempt_lm(attempt):
+        lm = dspy.settings.lm
+        return lm.copy(rollout_id=attempt, temperature=1.0) if attempt else lm
+
+    def _retry_inputs(self, inputs, violations):
+        if not self.feedback_field:
+            return dict(inputs)
+        feedback = "；".join(map(str, violations))
+        return {**inputs, self.feedback_field: f"{inputs[self.feedback_field]}\n\n上一次的输出不符合要求：{feedback}。请修正。"}
+
+    def _finish(self, prediction, violations, inputs):
+        if self.repair:
+            violations = self.validator.repair(prediction, violations, inputs)
+        if violations:
+            logger.warning(f"约束仍未满足: {'；'.join(map(str, violations))}")
+        return prediction
+
+    def forward(self, **inputs):
+        attempt_inputs = dict(inputs)
+        for attempt in range(self.max_retries + 1):
+            with dspy.context(lm=self._attempt_lm(attempt)):
+                prediction = self.module(**attempt_inputs)
+            violations = self.validator(prediction, inputs)
+            if not violations:
+                return prediction
+            logger.info(f"第 {attempt + 1} 次生成违反约束: {'；'.join(map(str, violations))}")
+            attempt_inputs = self._retry_inputs(inputs, violations)
+
+        return self._finish(prediction, violations, inputs)
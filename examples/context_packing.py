@@ -0,0 +1,125 @@
+"""
+按 token 预算打包 RAG 上下文
+检索结果不再原样拼接，而是在固定的 token 预算内挑选最有用的段落
+
+1. 排序：优先使用检索器给出的得分；没有得分时按与问题的 BM25 相关度排序
+2. 去重：与已选段落的字符 3-gram Jaccard 相似度超过阈值的近似重复段落直接丢弃
+3. 填充：按排序依次放入，放不下的段落跳过，继续尝试后面更短的段落
+4. 统计：用 token_count.estimate_tokens 估算长度，报告每次调用节省的 token 数
+
+用法:
+    packer = ContextPacker(budget_tokens=200)
+    packed = packer(passages, query="DSPy 和机器学习之间有什么关系？")
+    print(packed.context)
+    print(f"节省 {packed.saved_tokens} tokens")
+"""
+
+import logging
+
+import dspy
+
+from bm25 import BM25Index
+from token_count import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def shingles(text, n=3):
+    """字符 n-gram 集合（忽略空白），用于近似重复检测"""
+    text = "".join(text.split())
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def rank_passages(passages, query=None, scores=None):
+    """返回按相关度降序排列的段落下标"""
+    if scores is None and query:
+        index = BM25Index()
+        for passage in passages:
+            index.add(passage)
+        hits = dict(index.search(query, k=len(passages)))
+        scores = [hits.get(i, 0.0) for i in range(len(passages))]
+    if scores is None:
+        return list(range(len(passages)))
+    # 得分相同时保持原顺序
+    return sorted(range(len(passages)), key=lambda i: -scores[i])
+
+
+class ContextPacker:
+    """
+    上下文打包器
+
+    Args:
+        budget_tokens: 上下文的 token 预算
+        dedupe_threshold: 近似重复判定阈值（字符 3-gram Jaccard 相似度）
+        separator: 段落之间的分隔符
+    """
+
+    def __init__(self, budget_tokens=512, dedupe_threshold=0.6, separator="\n\n"):
+        self.budget_tokens = budget_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.separator = separator
+        self.calls = 0
+        self.total_saved_tokens = 0
+
+    def __call__(self, passages, query=None, scores=None, budget_tokens=None):
+        """
+        返回 dspy.Prediction:
+        - context: 打包后的上下文
+        - passages: 选中的段落（按相关度排序）
+        - tokens / original_tokens / saved_tokens: 打包后、原始拼接、节省的 token 数
+        - duplicates / dropped: 因近似重复、超出预算被丢弃的段落数
+        """
+        budget = budget_tokens or self.budget_tokens
+        passages = list(passages)
+        if scores is not None:
+            if len(scores) != len(passages):
+                raise ValueError(f"scores 的长度 {len(scores)} 与 passages 的长度 {len(passages)} 不一致")
+            # 得分与段落成对过滤，去掉空段落后得分仍对应原来的段落
+            pairs = [(p.strip(), score) for p, score in zip(passages, scores) if p and p.strip()]
+            passages = [p for p, _ in pairs]
+            scores = [score for _, score in pairs]
+        else:
+            passages = [p.strip() for p in passages if p and p.strip()]
+        separator_tokens = estimate_tokens(self.separator)
+        original_tokens = estimate_tokens(self.separator.join(passages))
+
+        selected, selected_shingles = [], []
+        used = duplicates = dropped = 0
+        for i in rank_passages(passages, query, scores):
+            passage = passages[i]
+            passage_shingles = shingles(passage)
+            if any(jaccard(passage_shingles, s) >= self.dedupe_threshold for s in selected_shingles):
+                duplicates += 1
+                continue
+            cost = estimate_tokens(passage) + (separator_tokens if selected else 0)
+            if used + cost > budget:
+                dropped += 1
+                continue
+            selected.append(passage)
+            selected_shingles.append(passage_shingles)
+            used += cost
+
+        context = self.separator.join(selected)
+        tokens = estimate_tokens(context)
+        saved = original_tokens - tokens
+        self.calls += 1
+        self.total_saved_tokens += saved
+        logger.info(f"上下文打包: {original_tokens} → {tokens} tokens（节省 {saved}，去重 {duplicates}，超预算 {dropped}）")
+
+        return dspy.Prediction(
+            context=context,
+            passages=selected,
+            tokens=tokens,
+            original_tokens=original_tokens,
+            saved_tokens=saved,
+            duplicates=duplicates,
+            dropped=dropped,
+        )
@@ -0,0 +1,139 @@
+"""
+基于相似度的动态示例选择（KNN Few-Shot）
+LabeledFewShot(k=3) 对所有输入使用同一组示例；加大 k 能提高准确率，但每个提示词都会随之变长。
+KNNFewShot 为每个输入挑选训练集中最相似的 k 个示例：用小 k 的提示词开销换取接近大 k 的效果
+
+- 编译时把训练集的输入字段一次性嵌入到 NumPy 矩阵中（vector_store.VectorStore，默认 HashingEmbedder）
+- 推理时一次矩阵乘法算出与全部训练样本的相似度，argpartition 取 top-k；
+  训练集很大时 VectorStore 自动切换到 IVF 近似检索
+- 选中的示例通过 demos= 参数传给 Predict，不修改共享的模块状态，可以并发调用
+- program.save("knn.json") 同时把索引保存到旁边的 knn.npz，program.load() 一并加载；
+  经过 compile_cache 编译时同样如此
+
+用法:
+    knn = KNNFewShot(k=3).compile(dspy.Predict(SentimentAnalysis), trainset=labeled_examples)
+    knn(text="服务态度很好，但价格有点贵。")
+    knn.select(text="服务态度很好，但价格有点贵。")  # 本次选中的示例
+"""
+
+import os
+from pathlib import Path
+
+import dspy
+from dspy.teleprompt import Teleprompter
+
+from vector_store import HashingEmbedder, VectorStore
+
+
+def sidecar_path(path):
+    """程序 JSON 旁边的索引文件"""
+    return Path(path).with_suffix(".npz")
+
+
+class KNNProgram(dspy.Module):
+    """
+    每次调用按输入动态挑选示例的程序
+
+    Args:
+        program: 只包含一个 Predict 的学生模块（Predict、ChainOfThought、Classify 等）
+        k: 每次调用使用的示例数
+        embedder: texts -> 归一化向量矩阵，默认 HashingEmbedder
+    """
+
+    def __init__(self, program, k=3, embedder=None):
+        super().__init__()
+        if len(program.predictors()) != 1:
+            raise ValueError("KNNProgram 只支持包含一个 Predict 的模块")
+        self.program = program
+        self.k = k
+        self.input_fields = list(program.predictors()[0].signature.input_fields)
+        self.store = VectorStore(embedder or HashingEmbedder())
+        self.trainset = []
+
+    def _query_text(self, inputs):
+        # 按 Signature 中输入字段的顺序拼接，训练样本和查询的文本格式一致
+        return " | ".join(f"{name}: {inputs[name]}" for name in self.input_fields if name in inputs)
+
+    def index(self, trainset):
+        """嵌入训练集，重建索引"""
+        self.trainset = list(trainset)
+        self.store = VectorStore(self.store.embedder)
+        self.store.add([self._query_text(example) for example in self.trainset])
+        return self
+
+    def select(self, **inputs):
+        """与输入最相似的 k 个训练样本（相似度降序）"""
+        hits = self.store.search(self._query_text(inputs), k=self.k)
+        return [self.trainset[i] for i, _ in hits]
+
+    def forward(self, **kwargs):
+        return self.program(**kwargs, demos=self.select(**kwargs))
+
+    async def aforward(self, **kwargs):
+        return await self.program.acall(**kwargs, demos=self.select(**kwargs))
+
+    def dump_state(self, json_mode=True):
+        state = super().dump_state(json_mode=json_mode)
+        state["knn"] = {
+            "k": self.k,
+            "trainset": [
+                {"data": example.toDict(), "inputs": sorted(example._input_keys or [])} for example in self.trainset
+            ],
+        }
+        return state
+
+    def load_state(self, state):
+        super().load_state(state)
+        knn = state["knn"]
+        self.k = knn["k"]
+        self.trainset = [dspy.Example(**item["data"]).with_inputs(*item["inputs"]) for item in knn["trainset"]]
+        return self
+
+    def save_sidecar(self, path):
+        """把向量索引保存到 path 旁边的 .npz（先写临时文件再原子替换）"""
+        target = sidecar_path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.stem}.{os.getpid()}.tmp.npz")
+        self.store.save(tmp)
+        tmp.replace(target)
+
+    def load_sidecar(self, path):
+        store = VectorStore.load(sidecar_path(path))
+        if len(store) != len(self.trainset):
+            raise ValueError(f"索引条目数 {len(store)} 与训练集大小 {len(self.trainset)} 不一致")
+        # 保存的只有嵌入器配置，沿用当前的嵌入器对象
+        store.embedder = self.store.embedder
+        self.store = store
+
+    def save(self, path, **kwargs):
+        super().save(path, **kwargs)
+        self.save_sidecar(path)
+
+    def load(self, path):
+        super().load(path)
+        self.load_sidecar(path)
+        return self
+
+
+class KNNFewShot(Teleprompter):
+    """
+    KNN 示例选择优化器
+
+    Args:
+        k: 每次调用使用的示例数
+        embedder: texts -> 归一化向量矩阵，默认 HashingEmbedder
+    """
+
+    def __init__(self, k=3, embedder=None):
+        self.k = k
+        self.embedder = embedder or HashingEmbedder()
+
+    def compiled_skeleton(self, student):
+        """未建索引的 KNNProgram（compile_cache 加载缓存时使用）"""
+        return KNNProgram(student.reset_copy(), k=self.k, embedder=self.embedder)
+
+    def compile(self, student, *, trainset, teacher=None, valset=None):
+        program = self.compiled_skeleton(student).index(trainset)
+        program._compiled = True
+        return program
+
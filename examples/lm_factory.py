@@ -0,0 +1,211 @@
+"""
+共享的语言模型工厂
+所有示例都从这里获取进程级共享的 LM，避免每个脚本各自创建客户端
+
+- 底层使用带连接池的 httpx 客户端，连接保持 keep-alive，长驻进程中可复用 TLS 连接
+- 通过环境变量选择后端:
+    LM_BACKEND=deepseek   （默认）DeepSeek API
+    LM_BACKEND=stub       进程内的离线桩 LM（stub_lm.StubLM），测量框架侧开销
+    LM_BACKEND=stub-http  本地 OpenAI 兼容桩服务，离线测试连接池
+- LM_STUB_LATENCY 为桩后端注入固定延迟（秒），LM_STUB_CHUNK_LATENCY 为流式输出的每一段注入延迟
+- LM_POOL_SIZE 控制连接池大小（默认 16）
+- 自动安装持久化的 SQLite 响应缓存（见 response_cache.py，LM_CACHE=0 关闭）
+
+直接运行本文件会在本地桩服务上做一次连接池基准测试:
+    python examples/lm_factory.py
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import dspy
+import httpx
+import litellm
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_MODEL = "deepseek-chat"
+DEEPSEEK_API_BASE = "https://api.deepseek.com/v1"
+DEFAULT_POOL_SIZE = 16
+KEEPALIVE_EXPIRY = 60.0
+
+_lock = threading.Lock()
+_lm = None
+_stub_backend = None
+_closing = set()  # 正在关闭异步客户端的任务，保持引用直到完成
+
+
+def install_http_pool(pool_size=None):
+    """
+    为 LiteLLM 安装进程级共享的 httpx 客户端（同步 + 异步）
+    必须在第一次请求之前调用：LiteLLM 会缓存基于该客户端创建的 OpenAI 客户端
+    """
+    pool_size = pool_size or int(os.getenv("LM_POOL_SIZE", DEFAULT_POOL_SIZE))
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(600.0, connect=5.0)
+    litellm.client_session = httpx.Client(limits=limits, timeout=timeout)
+    litellm.aclient_session = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return pool_size
+
+
+def install_response_cache():
+    """用跨进程共享的 SQLite 缓存替换 dspy.cache，返回缓存对象（关闭时返回 None）"""
+    from response_cache import cache_from_env
+
+    cache = cache_from_env()
+    if cache is not None:
+        dspy.cache = cache
+    return cache
+
+
+def _build_lm(backend, **kwargs):
+    global _stub_backend
+
+    if backend == "deepseek":
+        # 走 OpenAI 兼容通道，LiteLLM 才会使用上面安装的共享 httpx 客户端
+        return dspy.LM(
+            f"openai/{DEEPSEEK_MODEL}",
+            api_base=DEEPSEEK_API_BASE,
+            api_key=os.getenv("DEEPSEEK_API_KEY"),
+            **kwargs,
+        )
+
+    if backend == "stub":
+        from stub_lm import StubLM
+
+        return StubLM(
+            latency=float(os.getenv("LM_STUB_LATENCY", 0)),
+            chunk_latency=float(os.getenv("LM_STUB_CHUNK_LATENCY", 0)),
+            **kwargs,
+        )
+
+    if backend == "stub-http":
+        from stub_backend import StubBackend
+
+        _stub_backend = StubBackend(
+            latency=float(os.getenv("LM_STUB_LATENCY", 0)),
+            chunk_latency=float(os.getenv("LM_STUB_CHUNK_LATENCY", 0)),
+        ).start()
+        return dspy.LM("openai/stub-chat", api_base=_stub_backend.url, api_key="stub", **kwargs)
+
+    raise ValueError(f"未知的 LM_BACKEND: {backend}")
+
+
+def get_lm(backend=None, pool_size=None, **kwargs):
+    """
+    获取进程级共享的 LM
+    第一次调用时创建并安装连接池，之后的调用直接返回同一个实例（参数被忽略）
+    """
+    global _lm
+
+    with _lock:
+        if _lm is None:
+            backend = backend or os.getenv("LM_BACKEND", "deepseek")
+            install_http_pool(pool_size)
+            kwargs.setdefault("cache", install_response_cache() is not None)
+            _lm = _build_lm(backend, **kwargs)
+        return _lm
+
+
+def configure_lm(**kwargs):
+    """获取共享 LM 并设置为 DSPy 的默认 LM"""
+    lm = get_lm(**kwargs)
+    dspy.configure(lm=lm)
+    return lm
+
+
+def reset_lm():
+    """关闭连接池并丢弃共享 LM（用于基准测试或切换后端）"""
+    global _lm, _stub_backend
+
+    with _lock:
+        if litellm.client_session is not None:
+            litellm.client_session.close()
+        if litellm.aclient_session is not None:
+            _close_async_client(litellm.aclient_session)
+        litellm.client_session = None
+        litellm.aclient_session = None
+        litellm.in_memory_llm_clients_cache.flush_cache()
+        if _stub_backend is not None:
+            _stub_backend.stop()
+        _lm = None
+        _stub_backend = None
+
+
+def _close_async_client(client):
+    """
+    关闭 httpx.AsyncClient
+    在事件循环中调用时交给该循环完成；否则临时起一个事件循环关闭
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop is not None:
+        task = loop.create_task(client.aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return
+    try:
+        asyncio.run(client.aclose())
+    except Exception as e:
+        # 连接可能绑定在已关闭的事件循环上，无法再优雅关闭；客户端仍会被丢弃
+        logger.debug(f"关闭异步连接池失败: {e}")
+
+
+def stub_backend():
+    """返回当前的本地桩服务（仅 stub-http 后端可用）"""
+    return _stub_backend
+
+
+def _benchmark(num_calls=200):
+    """对比「每次新建客户端」与「共享连接池」在本地桩服务上的表现"""
+    from stub_backend import StubBackend
+
+    messages = [{"role": "user", "content": "ping"}]
+    payload = {"model": "stub-chat", "messages": messages}
+    rows = []
+
+    def timed(name, backend, call):
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            call()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / num_calls
+        rows.append((name, backend.stats["requests"], backend.stats["connections"], elapsed_ms))
+
+    def fresh_client_call(url):
+        with httpx.Client() as client:
+            client.post(url, json=payload).raise_for_status()
+
+    with StubBackend() as backend:
+        url = f"{backend.url}/chat/completions"
+        timed("httpx 每次新建", backend, lambda: fresh_client_call(url))
+
+    with StubBackend() as backend, httpx.Client() as client:
+        url = f"{backend.url}/chat/completions"
+        timed("httpx 共享", backend, lambda: client.post(url, json=payload).raise_for_status())
+
+    reset_lm()
+    lm = get_lm(backend="stub-http")
+    timed("dspy.LM 共享", stub_backend(), lambda: lm(messages=messages, cache=False))
+    reset_lm()
+
+    print(f"{'模式':<16}{'请求数':>8}{'新建连接':>10}{'平均耗时(ms)':>16}")
+    for name, requests, connections, elapsed_ms in rows:
+        print(f"{name:<16}{requests:>8}{connections:>10}{elapsed_ms:>16.2f}")
+
+
+if __name__ == "__main__":
+    _benchmark()
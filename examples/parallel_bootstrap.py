@@ -0,0 +1,219 @@
+"""
+并行 Bootstrap
+BootstrapFewShot.compile 在训练集上逐条运行 teacher，训练集有几千条时编译要跑几个小时。
+ParallelBootstrapFewShot 在有界线程池上并发运行 teacher，选出的 demos 与串行版本相同
+
+- 每个工作线程使用自己的 teacher 副本（运行时要临时从 demos 中去掉当前样本，不能共享）
+- 同一个样本的多轮（max_rounds）仍按顺序执行，通过即停止，与串行版本一致
+- 结果按训练集顺序合并：只有排在前面的样本都有了结果，才确定后面的样本是否被采用，
+  因此采用的总是前 max_bootstrapped_demos 个通过的样本，与完成先后无关
+- 提前终止：凑够 max_bootstrapped_demos 个通过的 trace 后不再提交新样本，在途的样本在下一轮之前停止
+- 同时在途的样本数不超过 num_threads；可选的令牌桶限速（每轮调用一次 teacher 取一个令牌），
+  限流错误退避重试，不计入 max_errors
+- max_errors 也按训练集顺序计数：串行版本不会运行到的样本出错不会导致编译失败
+
+用法:
+    optimizer = ParallelBootstrapFewShot(
+        metric=validate_sentiment,
+        max_bootstrapped_demos=3,
+        num_threads=8,
+        requests_per_second=10,
+    )
+    optimized = optimizer.compile(Classify(EmotionClassifier), trainset=trainset)
+"""
+
+import contextvars
+import logging
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import dspy
+import tqdm
+from dspy.teleprompt import BootstrapFewShot
+from dspy.utils.hasher import Hasher
+
+from parallel_eval import RateLimiter, call_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _ExampleResult:
+    """一个样本的 bootstrap 结果：traces 为 None 表示所有轮次都没有通过"""
+
+    attempts: int = 0
+    traces: dict | None = None
+    errors: list = field(default_factory=list)
+
+
+class ParallelBootstrapFewShot(BootstrapFewShot):
+    """
+    Args:
+        metric / metric_threshold / teacher_settings / max_bootstrapped_demos /
+        max_labeled_demos / max_rounds / max_errors: 与 BootstrapFewShot 相同
+        num_threads: 同时运行 teacher 的样本数
+        requests_per_second: teacher 调用的速率上限（None 表示不限速）
+        max_retries: 限流错误的最大重试次数
+    """
+
+    def __init__(
+        self,
+        metric=None,
+        metric_threshold=None,
+        teacher_settings=None,
+        max_bootstrapped_demos=4,
+        max_labeled_demos=16,
+        max_rounds=1,
+        max_errors=None,
+        num_threads=8,
+        requests_per_second=None,
+        max_retries=3,
+    ):
+        super().__init__(
+            metric=metric,
+            metric_threshold=metric_threshold,
+            teacher_settings=teacher_settings,
+            max_bootstrapped_demos=max_bootstrapped_demos,
+            max_labeled_demos=max_labeled_demos,
+            max_rounds=max_rounds,
+            max_errors=max_errors,
+        )
+        self.num_threads = num_threads
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+
+    def _local_teacher(self):
+        """当前线程的 teacher 副本及其 predictor id -> 名称映射"""
+        local = self._local
+        if not hasattr(local, "teacher"):
+            local.teacher = self.teacher.deepcopy()
+            local.predictor2name = {id(predictor): name for name, predictor in local.teacher.named_predictors()}
+        return local.teacher, local.predictor2name
+
+    def _trace_one(self, example, round_idx):
+        """
+        对一个样本运行一轮 teacher（与 BootstrapFewShot._bootstrap_one_example 相同的逻辑），
+        返回 (是否通过, {predictor 名称: [demo]})；运行或打分出错时抛出异常
+        """
+        teacher, predictor2name = self._local_teacher()
+        with dspy.settings.context(trace=[], **self.teacher_settings):
+            lm = dspy.settings.lm
+            # 第 1 轮之后换一个 rollout、temperature=1.0，绕过缓存
+            lm = lm.copy(rollout_id=round_idx, temperature=1.0) if round_idx > 0 else lm
+            new_settings = {"lm": lm} if round_idx > 0 else {}
+
+            with dspy.settings.context(**new_settings):
+                predictor_cache = {}
+                for name, predictor in teacher.named_predictors():
+                    predictor_cache[name] = predictor.demos
+                    predictor.demos = [x for x in predictor.demos if x != example]
+                try:
+                    prediction = teacher(**example.inputs())
+                    trace = dspy.settings.trace
+                finally:
+                    for name, predictor in teacher.named_predictors():
+                        predictor.demos = predictor_cache[name]
+
+            if self.metric:
+                metric_val = self.metric(example, prediction, trace)
+                success = metric_val >= self.metric_threshold if self.metric_threshold else metric_val
+            else:
+                success = True
+
+        if not success:
+            return False, None
+
+        name2traces = {}
+        for predictor, inputs, outputs in trace:
+            name = predictor2name.get(id(predictor))
+            if name is not None:
+                name2traces.setdefault(name, []).append(dspy.Example(augmented=True, **inputs, **outputs))
+        for name, demos in name2traces.items():
+            # 同一个样本对同一个 predictor 有多条 trace 时，与串行版本相同的方式挑一条
+            if len(demos) > 1:
+                rng = random.Random(Hasher.hash(tuple(demos)))
+                name2traces[name] = [rng.choice(demos[:-1]) if rng.random() < 0.5 else demos[-1]]
+        return True, name2traces
+
+    def _run_example(self, example):
+        result = _ExampleResult()
+        for round_idx in range(self.max_rounds):
+            if self._stop.is_set():
+                break
+            result.attempts += 1
+            outcome, error = call_with_retries(
+                lambda ex: self._trace_one(ex, round_idx), example, self._rate_limiter, self.max_retries
+            )
+            if error is not None:
+                result.errors.append(error)
+                continue
+            success, traces = outcome
+            if success:
+                result.traces = traces
+                break
+        return result
+
+    def _merge(self, index, result, bootstrapped):
+        """按训练集顺序合并一个样本的结果（错误计数也在这里，与串行版本一致）"""
+        effective_max_errors = self.max_errors if self.max_errors is not None else dspy.settings.max_errors
+        example = self.trainset[index]
+        for error in result.errors:
+            self.error_count += 1
+            if self.error_count >= effective_max_errors:
+                raise error
+            logger.error(f"Failed to run or to evaluate example {example} with {self.metric} due to {error}.")
+        if result.traces is not None:
+            bootstrapped[index] = True
+            for name, demos in result.traces.items():
+                self.name2traces[name].extend(demos)
+
+    def _bootstrap(self, *, max_bootstraps=None):
+        max_bootstraps = max_bootstraps or self.max_bootstrapped_demos
+        self.name2traces = {name: [] for name in self.name2predictor}
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._rate_limiter = RateLimiter(self.requests_per_second) if self.requests_per_second else None
+
+        trainset = self.trainset
+        bootstrapped, completed, pending = {}, {}, {}
+        bootstrap_attempts = started = merged = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.num_threads)
+
+        def fill():
+            nonlocal started
+            while len(pending) < self.num_threads and started < len(trainset):
+                future = executor.submit(contextvars.copy_context().run, self._run_example, trainset[started])
+                pending[future] = started
+                started += 1
+
+        try:
+            with tqdm.tqdm(total=len(trainset), dynamic_ncols=True) as pbar:
+                fill()
+                while pending and len(bootstrapped) < max_bootstraps:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        completed[pending.pop(future)] = future.result()
+                    while merged in completed and len(bootstrapped) < max_bootstraps:
+                        result = completed.pop(merged)
+                        bootstrap_attempts += result.attempts
+                        self._merge(merged, result, bootstrapped)
+                        merged += 1
+                        pbar.update()
+                    if len(bootstrapped) < max_bootstraps:
+                        fill()
+        finally:
+            # 提前终止：不再开始新的轮次，也不等待在途的样本
+            self._stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        logger.info(
+            f"并行 bootstrap: 按顺序检查了 {merged} 个样本（共运行 {started} 个），"
+            f"得到 {len(bootstrapped)} 条完整 trace，{bootstrap_attempts} 次尝试"
+        )
+
+        # 未被采用的训练样本（与串行版本相同的打乱方式）
+        self.validation = [x for idx, x in enumerate(trainset) if idx not in bootstrapped]
+        random.Random(0).shuffle(self.validation)
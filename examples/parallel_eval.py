@@ -0,0 +1,275 @@
+"""
+并行评估引擎
+代替逐条、单线程的 dspy.Evaluate 运行
+
+- 每条样本只运行一次程序，所有评估指标都基于同一个预测结果打分
+- 在有界线程池上并发执行，线程数即最大并发请求数
+- 可选的令牌桶限速；遇到限流错误（HTTP 429）时退避重试，并临时降低全局速率
+
+用法:
+    evaluator = ParallelEvaluate(
+        devset=test_set,
+        metrics=[exact_match, has_key_info],
+        num_threads=8,
+        requests_per_second=5,
+    )
+    report = evaluator(qa_model)
+    print(report.scores)   # {"exact_match": 66.67, "has_key_info": 100.0}
+
+    # 缓存预测结果：之后换一组指标再评估同一个模型，不会再调用 LM
+    evaluator = MultiMetricEvaluate(devset=test_set, metrics=[exact_match, has_key_info])
+    print(evaluator(qa_model).format_table())
+    evaluator(qa_model, metrics=[answer_length_check])
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import dspy
+import litellm
+import tqdm
+
+from tracing import mark_queued
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶限速器
+    遇到限流时调用 backoff() 降低速率，之后每次成功调用逐步恢复（AIMD）
+    """
+
+    def __init__(self, rate, burst=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self, factor=0.5):
+        with self._lock:
+            self.rate = max(self.max_rate * 0.05, self.rate * factor)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def is_rate_limit_error(error):
+    return isinstance(error, litellm.RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def call_with_retries(function, item, rate_limiter=None, max_retries=3):
+    """
+    调用 function(item)，返回 (结果, 异常)
+    每次调用前先从限速器取令牌；限流错误按指数退避（带抖动）重试，最多 max_retries 次，其他异常直接返回
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            result = function(item)
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries:
+                return None, e
+            if rate_limiter is not None:
+                rate_limiter.backoff()
+            delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"触发限流，{delay:.1f}s 后重试（第 {attempt + 1} 次）")
+            time.sleep(delay)
+        else:
+            if rate_limiter is not None:
+                rate_limiter.recover()
+            return result, None
+
+
+def run_parallel(function, items, num_threads=8, rate_limiter=None, max_retries=3, display_progress=False):
+    """
+    在有界线程池上对 items 逐个调用 function，按输入顺序返回 [(结果, 异常), ...]
+
+    - 每个任务复制提交时的 contextvars，dspy.context(...) 中的设置在工作线程里同样生效
+    - 限流错误按指数退避（带抖动）重试，最多 max_retries 次；其他异常直接记录
+    """
+
+    def call(item, queued_at):
+        # 在线程池和限速器中等待的时间记为排队时间（见 tracing.py）
+        mark_queued(queued_at)
+        return call_with_retries(function, item, rate_limiter, max_retries)
+
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, call, item, time.perf_counter_ns()): index
+            for index, item in enumerate(items)
+        }
+        with tqdm.tqdm(total=len(items), disable=not display_progress, dynamic_ncols=True) as pbar:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                pbar.update()
+    return results
+
+
+class EvaluationReport(dspy.Prediction):
+    """
+    评估结果
+    - scores: {指标名: 平均得分（0-100）}
+    - results: [(example, prediction, {指标名: 得分}), ...]，与 devset 顺序一致
+    - errors: 运行失败的样本数（失败样本各项指标记 0 分）
+    """
+
+    def __init__(self, scores, results, errors):
+        super().__init__(scores=scores, results=results, errors=errors)
+
+    def __repr__(self):
+        return f"EvaluationReport(scores={self.scores}, results=<list of {len(self.results)} results>, errors={self.errors})"
+
+    def rows(self):
+        """每条样本一行: 输入字段 + 各指标得分"""
+        return [{**example.inputs().toDict(), **scores} for example, _, scores in self.results]
+
+    def format_table(self, max_width=24):
+        """指标汇总表 + 逐条样本得分表"""
+        lines = [f"{'指标':<16}{'得分':>8}"]
+        lines += [f"{name:<16}{score:>7.1f}%" for name, score in self.scores.items()]
+
+        rows = self.rows()
+        if rows:
+            columns = list(rows[0])
+            lines.append("")
+            lines.append(" | ".join(columns))
+            for row in rows:
+                cells = []
+                for column in columns:
+                    value = row[column]
+                    cell = f"{value:g}" if isinstance(value, float) else str(value).replace("\n", " ")
+                    cells.append(cell if len(cell) <= max_width else cell[: max_width - 1] + "…")
+                lines.append(" | ".join(cells))
+        return "\n".join(lines)
+
+
+def _metric_table(metrics):
+    if callable(metrics):
+        metrics = [metrics]
+    if isinstance(metrics, dict):
+        return dict(metrics)
+    return {metric.__name__: metric for metric in metrics}
+
+
+class ParallelEvaluate:
+    """
+    并行、多指标的评估器
+
+    Args:
+        devset: 评估数据集（dspy.Example 列表）
+        metrics: 单个指标函数、指标函数列表，或 {名称: 指标函数}
+        num_threads: 最大并发数
+        requests_per_second: 每秒最多启动的样本数（None 表示不限速）
+        display_progress: 是否显示进度条
+    """
+
+    def __init__(self, devset, metrics, num_threads=8, requests_per_second=None, max_retries=3, display_progress=False):
+        self.devset = devset
+        self.metrics = _metric_table(metrics)
+        self.num_threads = num_threads
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.display_progress = display_progress
+
+    def _predict(self, program, example):
+        return program(**example.inputs())
+
+    def __call__(self, program, metrics=None):
+        """metrics 不为空时，本次评估改用这组指标"""
+        metrics = _metric_table(metrics) if metrics else self.metrics
+        rate_limiter = RateLimiter(self.requests_per_second) if self.requests_per_second else None
+
+        def evaluate_one(example):
+            prediction = self._predict(program, example)
+            return prediction, {name: float(metric(example, prediction)) for name, metric in metrics.items()}
+
+        outcomes = run_parallel(
+            evaluate_one,
+            self.devset,
+            num_threads=self.num_threads,
+            rate_limiter=rate_limiter,
+            max_retries=self.max_retries,
+            display_progress=self.display_progress,
+        )
+
+        results = []
+        errors = 0
+        for example, (outcome, error) in zip(self.devset, outcomes):
+            if error is not None:
+                errors += 1
+                logger.error(f"评估样本失败: {example}: {error}")
+                results.append((example, dspy.Prediction(), {name: 0.0 for name in metrics}))
+            else:
+                results.append((example, *outcome))
+
+        total = len(results) or 1
+        scores = {
+            name: round(100 * sum(row[2][name] for row in results) / total, 2)
+            for name in metrics
+        }
+        return EvaluationReport(scores=scores, results=results, errors=errors)
+
+
+def program_key(program):
+    """按程序的状态（指令、demos 等）区分不同的程序，优化前后视为两个程序"""
+    state = json.dumps(program.dump_state(), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{type(program).__name__}:{state}".encode()).hexdigest()
+
+
+class MultiMetricEvaluate(ParallelEvaluate):
+    """
+    缓存预测结果的多指标评估器
+
+    每个 (程序状态, 样本输入) 的预测结果只计算一次：同一个模型用不同的指标反复评估时，
+    只有第一次会调用 LM，之后直接复用缓存的预测结果打分
+    """
+
+    def __init__(self, devset, metrics, **kwargs):
+        super().__init__(devset, metrics, **kwargs)
+        self._predictions = {}
+        self._lock = threading.Lock()
+        self._current_program = None
+        self.cache_hits = 0
+
+    def __call__(self, program, metrics=None):
+        self._current_program = program_key(program)
+        return super().__call__(program, metrics)
+
+    def _predict(self, program, example):
+        key = (self._current_program, repr(sorted(example.inputs().items())))
+        with self._lock:
+            if key in self._predictions:
+                self.cache_hits += 1
+                return self._predictions[key]
+        prediction = super()._predict(program, example)
+        with self._lock:
+            self._predictions[key] = prediction
+        return prediction
+
+    def clear(self):
+        with self._lock:
+            self._predictions.clear()
@@ -0,0 +1,240 @@
+"""
+并行工具调用的 ReAct
+dspy.ReAct 每一步只能调用一个工具；这里让模型在一步中给出多个互不依赖的工具调用，
+这些调用并发执行（线程池 / asyncio），再按请求顺序把观察结果合并回轨迹
+
+- next_tool_calls: [{"name": 工具名, "args": {...}}, ...]
+- 每个工具可单独设置超时（tool_timeouts），超时的调用记为错误观察，不阻塞其他调用
+- 每一步使用自己的线程池，步骤结束后关闭且不等待：超时仍在运行的调用不会占用后续步骤的线程
+- aforward 中同步工具同样在线程池中执行（并发且可超时），异步工具直接在事件循环上 await
+- 同一步中包含 finish 时，先执行其余调用，再结束循环
+- 同一步中重复的调用（工具名和参数都相同）只执行一次，共享结果
+
+用法:
+    agent = ParallelReAct(Question, tools=tools, tool_timeouts={"search_info": 2.0})
+    result = agent(question="Python 和 DSPy 分别是什么？")
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any
+
+import dspy
+from dspy.predict.react import _fmt_exc
+
+from tool_cache import call_key
+
+logger = logging.getLogger(__name__)
+
+# 把 dspy.ReAct 指令中单个 next_tool_name / next_tool_args 的说明改成一组调用
+_INSTRUCTION_REWRITES = [
+    (
+        "To do this, you will interleave next_thought, next_tool_name, and next_tool_args in each turn, "
+        "and also when finishing the task.",
+        "To do this, you will interleave next_thought and next_tool_calls in each turn, and also when finishing "
+        "the task. next_tool_calls is a JSON list of {\"name\": ..., \"args\": {...}} objects: put several "
+        "independent calls in one turn to run them at the same time.",
+    ),
+    (
+        "When selecting the next_tool_name and its next_tool_args, the tool must be one of:",
+        "Each call's name must be one of:",
+    ),
+    (
+        "When providing `next_tool_args`, the value inside the field must be in JSON format",
+        "When providing `next_tool_calls`, the value inside the field must be in JSON format. "
+        "To finish, return a single call to `finish`.",
+    ),
+]
+
+
+class ParallelReAct(dspy.ReAct):
+    """
+    Args:
+        signature: 任务的 Signature
+        tools: 工具列表（函数或 dspy.Tool）
+        max_iters: 最大步数
+        max_parallel_calls: 每一步最多并发执行的工具调用数
+        default_timeout: 工具调用的默认超时（秒）
+        tool_timeouts: {工具名: 超时秒数}，覆盖默认超时
+    """
+
+    def __init__(self, signature, tools, max_iters=10, max_parallel_calls=4, default_timeout=10.0, tool_timeouts=None):
+        super().__init__(signature, tools, max_iters=max_iters)
+        self.max_parallel_calls = max_parallel_calls
+        self.default_timeout = default_timeout
+        self.tool_timeouts = dict(tool_timeouts or {})
+
+        base = self.react.signature
+        instructions = base.instructions
+        for old, new in _INSTRUCTION_REWRITES:
+            # dspy 改了 ReAct 的指令文本时，replace 会悄悄什么都不做，模型仍会按单个工具调用的格式回答
+            if old not in instructions:
+                raise RuntimeError(f"dspy.ReAct 的指令中找不到要替换的文本，可能是 dspy 版本不兼容: {old!r}")
+            instructions = instructions.replace(old, new)
+        react_signature = (
+            base.delete("next_tool_name")
+            .delete("next_tool_args")
+            .append("next_tool_calls", dspy.OutputField(), type_=list[dict[str, Any]])
+            .with_instructions(instructions)
+        )
+        self.react = dspy.Predict(react_signature)
+
+    def _timeout(self, name):
+        return self.tool_timeouts.get(name, self.default_timeout)
+
+    def _parse_calls(self, calls):
+        """规范化模型给出的调用列表，截断到 max_parallel_calls"""
+        parsed = []
+        for call in calls or []:
+            if isinstance(call, dict):
+                parsed.append((str(call.get("name", "")), call.get("args") or {}))
+        if len(parsed) > self.max_parallel_calls:
+            logger.warning(f"一步中请求了 {len(parsed)} 个工具调用，只执行前 {self.max_parallel_calls} 个")
+            parsed = parsed[: self.max_parallel_calls]
+        return parsed
+
+    def _call_error(self, name, args):
+        """调用无法执行（未知的工具、args 不是 JSON 对象）时返回错误观察，否则返回 None"""
+        if name not in self.tools:
+            return f"Execution error in {name}: 未知的工具，可用工具: {', '.join(self.tools)}"
+        if not isinstance(args, dict):
+            return f"Execution error in {name}: args 必须是 JSON 对象，收到的是 {type(args).__name__}: {args!r}"
+        return None
+
+    def _run_calls(self, calls):
+        """在本步骤的线程池上并发执行，按请求顺序返回观察结果"""
+        unique = {call_key(name, args) for name, args in calls if self._call_error(name, args) is None}
+        if not unique:
+            return [self._call_error(name, args) for name, args in calls]
+
+        # 超时的调用无法中止，线程会继续运行；线程池只属于这一步，不会让后续步骤的调用排队等待
+        executor = ThreadPoolExecutor(max_workers=len(unique), thread_name_prefix="react-tool")
+        try:
+            return self._collect(executor, calls)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _collect(self, executor, calls):
+        start = time.monotonic()
+        futures, submitted = [], {}
+        for name, args in calls:
+            if self._call_error(name, args) is not None:
+                futures.append(None)
+                continue
+            key = call_key(name, args)
+            if key not in submitted:
+                context = contextvars.copy_context()
+                submitted[key] = executor.submit(context.run, self.tools[name], **args)
+            futures.append(submitted[key])
+
+        observations = []
+        for (name, args), future in zip(calls, futures):
+            if future is None:
+                observations.append(self._call_error(name, args))
+                continue
+            try:
+                # 超时从提交时算起，而不是从开始等待这个结果时算起
+                remaining = start + self._timeout(name) - time.monotonic()
+                observations.append(future.result(timeout=max(0.0, remaining)))
+            except FutureTimeoutError:
+                observations.append(f"Execution error in {name}: 超时（{self._timeout(name)}s）")
+            except Exception as err:
+                observations.append(f"Execution error in {name}: {_fmt_exc(err)}")
+        return observations
+
+    async def _arun_calls(self, calls):
+        # dspy 的 Tool.acall 会在事件循环上直接调用同步函数：几个调用只能依次执行，wait_for 也无法让它超时。
+        # 同步工具改到本步骤的线程池中执行，只有真正的异步工具才在事件循环上 await
+        sync_keys = {
+            call_key(name, args)
+            for name, args in calls
+            if self._call_error(name, args) is None and not inspect.iscoroutinefunction(self.tools[name].func)
+        }
+        executor = ThreadPoolExecutor(max_workers=len(sync_keys), thread_name_prefix="react-tool") if sync_keys else None
+        loop = asyncio.get_running_loop()
+
+        async def run_one(name, args):
+            error = self._call_error(name, args)
+            if error is not None:
+                return error
+            tool = self.tools[name]
+            try:
+                if inspect.iscoroutinefunction(tool.func):
+                    pending = tool.acall(**args)
+                else:
+                    context = contextvars.copy_context()
+                    pending = loop.run_in_executor(executor, functools.partial(context.run, tool, **args))
+                return await asyncio.wait_for(pending, self._timeout(name))
+            except asyncio.TimeoutError:
+                return f"Execution error in {name}: 超时（{self._timeout(name)}s）"
+            except Exception as err:
+                return f"Execution error in {name}: {_fmt_exc(err)}"
+
+        tasks = {}
+        try:
+            for name, args in calls:
+                key = call_key(name, args)
+                if key not in tasks:
+                    tasks[key] = asyncio.ensure_future(run_one(name, args))
+            return list(await asyncio.gather(*(tasks[call_key(name, args)] for name, args in calls)))
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, trajectory, idx, pred, calls, observations):
+        trajectory[f"thought_{idx}"] = pred.next_thought
+        trajectory[f"tool_calls_{idx}"] = [{"name": name, "args": args} for name, args in calls]
+        trajectory[f"observation_{idx}"] = observations
+        return any(name == "finish" for name, _ in calls) or not calls
+
+    def forward(self, **input_args):
+        trajectory = {}
+        max_iters = input_args.pop("max_iters", self.max_iters)
+        for idx in range(max_iters):
+            try:
+                pred = self._call_with_potential_trajectory_truncation(self.react, trajectory, **input_args)
+            except ValueError as err:
+                logger.warning(f"Ending the trajectory: Agent failed to select valid tool calls: {_fmt_exc(err)}")
+                break
+
+            calls = self._parse_calls(pred.next_tool_calls)
+            if self._record(trajectory, idx, pred, calls, self._run_calls(calls)):
+                break
+
+        extract = self._call_with_potential_trajectory_truncation(self.extract, trajectory, **input_args)
+        return dspy.Prediction(trajectory=trajectory, **extract)
+
+    async def aforward(self, **input_args):
+        trajectory = {}
+        max_iters = input_args.pop("max_iters", self.max_iters)
+        for idx in range(max_iters):
+            try:
+                pred = await self._async_call_with_potential_trajectory_truncation(self.react, trajectory, **input_args)
+            except ValueError as err:
+                logger.warning(f"Ending the trajectory: Agent failed to select valid tool calls: {_fmt_exc(err)}")
+                break
+
+            calls = self._parse_calls(pred.next_tool_calls)
+            if self._record(trajectory, idx, pred, calls, await self._arun_calls(calls)):
+                break
+
+        extract = await self._async_call_with_potential_trajectory_truncation(self.extract, trajectory, **input_args)
+        return dspy.Prediction(trajectory=trajectory, **extract)
+
+    def truncate_trajectory(self, trajectory):
+        """每一步有 thought / tool_calls / observation 三个键，截断时整步删除"""
+        keys = list(trajectory.keys())
+        if len(keys) < 3:
+            raise ValueError(
+                "The trajectory is too long so your prompt exceeded the context window, but the trajectory cannot be "
+                "truncated because it only has one step."
+            )
+        for key in keys[:3]:
+            trajectory.pop(key)
+        return trajectory
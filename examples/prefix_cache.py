@@ -0,0 +1,181 @@
+"""
+前缀缓存友好的提示词布局
+LabeledFewShot / BootstrapFewShot 编译后，每次调用都重复发送同样的指令和示例，只有最后的输入不同。
+DeepSeek、OpenAI 会自动缓存请求中与之前完全相同的前缀（Anthropic 需要显式标记），
+命中的部分按更低的价格计费、首 token 延迟也更低——前提是前缀逐字节相同
+
+PrefixCacheAdapter 固定这样的布局:
+- [系统消息 + 所有示例] 是稳定前缀，只取决于 Signature 和 demos，与本次输入无关
+- ChatAdapter 放在最后一条用户消息末尾的输出格式提醒（Respond with ...）移到系统消息中，
+  输入之后不再有任何内容；对话历史（dspy.History）放在前缀之后、输入之前
+- cache_control=True 时在前缀的最后一条消息上加 Anthropic 的 cache_control 标记
+- 每次调用记录前缀的哈希、估算的前缀 token 数，以及后端返回的 prompt / 命中缓存的 token 数
+  （兼容 OpenAI 的 prompt_tokens_details.cached_tokens、DeepSeek 的 prompt_cache_hit_tokens、
+  Anthropic 的 cache_read_input_tokens）；同一个 Signature 出现多个前缀说明示例在变
+  （例如 knn_fewshot 按输入选示例），这类程序无法命中前缀缓存
+
+注意：服务端缓存有最小长度（OpenAI 1024 tokens，DeepSeek 按 64 tokens 为单位），示例太少时不会命中
+
+用法:
+    adapter = PrefixCacheAdapter()
+    with dspy.context(adapter=adapter):
+        compiled(text="服务态度很好，但价格有点贵。")
+    adapter.records[-1].cached_tokens
+    adapter.summary()
+"""
+
+import contextvars
+import hashlib
+import json
+from collections import deque
+from dataclasses import dataclass
+
+import dspy
+from dspy.adapters.types.base_type import split_message_content_for_custom_types
+from dspy.utils.usage_tracker import UsageTracker
+
+from token_count import estimate_message_tokens
+
+DEFAULT_MAX_RECORDS = 1000
+
+# 本次调用 format() 得到的前缀 (哈希, 估算 token 数)；用 ContextVar 在线程和协程之间隔离
+_current_prefix = contextvars.ContextVar("prefix_cache_current_prefix", default=None)
+
+
+def cached_prompt_tokens(usage):
+    """从后端返回的 usage 中取命中前缀缓存的 token 数；后端没有报告时返回 None"""
+    details = usage.get("prompt_tokens_details") or {}
+    if not isinstance(details, dict):
+        details = dict(details)
+    for value in (
+        details.get("cached_tokens"),
+        usage.get("prompt_cache_hit_tokens"),
+        usage.get("cache_read_input_tokens"),
+    ):
+        if value is not None:
+            return value
+    return None
+
+
+@dataclass
+class PrefixCallRecord:
+    """
+    一次调用的前缀缓存情况
+    prompt_tokens / cached_tokens: 后端报告的值；命中本地响应缓存（没有真正请求）时为 None
+    """
+
+    signature: str
+    prefix_hash: str
+    prefix_tokens: int
+    prompt_tokens: int | None
+    cached_tokens: int | None
+
+
+class PrefixCacheAdapter(dspy.ChatAdapter):
+    """
+    Args:
+        cache_control: 是否在前缀末尾加 Anthropic 的 cache_control 标记（DeepSeek / OpenAI 自动缓存，不需要）
+        max_records: 保留最近多少次调用的记录
+    """
+
+    def __init__(self, cache_control=False, max_records=DEFAULT_MAX_RECORDS, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_control = cache_control
+        self.records = deque(maxlen=max_records)
+
+    def format_task_description(self, signature):
+        requirements = super().user_message_output_requirements(signature)
+        return f"{super().format_task_description(signature)}\n\n{requirements}"
+
+    def user_message_output_requirements(self, signature):
+        # 已放进系统消息（见 format_task_description），输入之后不再追加固定内容
+        return None
+
+    def format(self, signature, demos, inputs):
+        inputs = dict(inputs)
+        system_message = (
+            f"{self.format_field_description(signature)}\n"
+            f"{self.format_field_structure(signature)}\n"
+            f"{self.format_task_description(signature)}"
+        )
+        messages = [{"role": "system", "content": system_message}]
+        messages.extend(self.format_demos(signature, demos))
+        prefix = messages[:]
+
+        history_field_name = self._get_history_field_name(signature)
+        if history_field_name:
+            signature = signature.delete(history_field_name)
+            messages.extend(self.format_conversation_history(signature, history_field_name, inputs))
+        messages.append(
+            {"role": "user", "content": self.format_user_message_content(signature, inputs, main_request=True)}
+        )
+
+        encoded = json.dumps(prefix, sort_keys=True, ensure_ascii=False, default=str)
+        _current_prefix.set((hashlib.sha256(encoded.encode()).hexdigest()[:16], estimate_message_tokens(prefix)))
+
+        if self.cache_control and isinstance(prefix[-1]["content"], str):
+            messages[len(prefix) - 1] = {
+                **prefix[-1],
+                "content": [{"type": "text", "text": prefix[-1]["content"], "cache_control": {"type": "ephemeral"}}],
+            }
+        return split_message_content_for_custom_types(messages)
+
+    def _record(self, signature, tracker, outer):
+        entries = [entry for usage in tracker.usage_data.values() for entry in usage]
+        # 转交给外层的 usage 统计（track_usage / get_lm_usage 仍然有效）
+        if outer is not None:
+            for model, usage in tracker.usage_data.items():
+                for entry in usage:
+                    outer.add_usage(model, entry)
+
+        prefix_hash, prefix_tokens = _current_prefix.get() or ("", 0)
+        cached = [cached_prompt_tokens(entry) for entry in entries]
+        self.records.append(
+            PrefixCallRecord(
+                signature=signature.__name__,
+                prefix_hash=prefix_hash,
+                prefix_tokens=prefix_tokens,
+                prompt_tokens=sum(entry.get("prompt_tokens") or 0 for entry in entries) if entries else None,
+                cached_tokens=sum(c for c in cached if c is not None) if any(c is not None for c in cached) else None,
+            )
+        )
+
+    def __call__(self, lm, lm_kwargs, signature, demos, inputs):
+        # 每次调用用独立的 usage 统计，才能拿到这一次请求的 usage（并发调用互不干扰）
+        tracker, outer = UsageTracker(), dspy.settings.usage_tracker
+        try:
+            with dspy.context(usage_tracker=tracker):
+                return super().__call__(lm, lm_kwargs, signature, demos, inputs)
+        finally:
+            self._record(signature, tracker, outer)
+
+    async def acall(self, lm, lm_kwargs, signature, demos, inputs):
+        tracker, outer = UsageTracker(), dspy.settings.usage_tracker
+        try:
+            with dspy.context(usage_tracker=tracker):
+                return await super().acall(lm, lm_kwargs, signature, demos, inputs)
+        finally:
+            self._record(signature, tracker, outer)
+
+    def summary(self):
+        """
+        汇总最近的调用
+        - reported: 后端返回了 usage 的调用数（命中本地响应缓存的不计）
+        - cache_hit_rate: 命中缓存的 prompt token 占比（后端报告的 prompt token 总数为分母）
+        - prefixes: {Signature 名: 不同前缀的个数}，为 1 才能持续命中
+        """
+        records = list(self.records)
+        reported = [r for r in records if r.prompt_tokens is not None]
+        prompt_tokens = sum(r.prompt_tokens for r in reported)
+        cached_tokens = sum(r.cached_tokens or 0 for r in reported)
+        prefixes = {}
+        for r in records:
+            prefixes.setdefault(r.signature, set()).add(r.prefix_hash)
+        return {
+            "calls": len(records),
+            "reported": len(reported),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "cache_hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            "prefixes": {name: len(hashes) for name, hashes in prefixes.items()},
+        }
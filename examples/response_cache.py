@@ -0,0 +1,292 @@
+"""
+持久化的 LM 响应缓存（SQLite）
+替换 DSPy 默认的 dspy.cache，相同的请求在多次运行、多个进程之间直接复用结果
+
+- 内容寻址：键为请求的哈希（模型、渲染后的 messages、采样参数）
+- 存储在单个 SQLite 文件中（WAL 模式），多个进程可同时读写
+- LRU 淘汰：总大小超过 max_bytes 时，按最近访问时间淘汰
+- TTL：超过 ttl 秒的条目视为过期
+- 命中/未命中计数
+
+lm_factory 会自动安装该缓存，可通过环境变量调整:
+    LM_CACHE=0               关闭缓存
+    LM_CACHE_PATH=...        缓存文件路径（默认 ~/.dspy_learning/responses.sqlite3）
+    LM_CACHE_MAX_BYTES=...   大小上限（默认 512MB）
+    LM_CACHE_TTL=...         过期时间（秒，默认不过期）
+
+查看或清空缓存:
+    python examples/response_cache.py
+    python examples/response_cache.py --clear
+"""
+
+import argparse
+import contextvars
+import copy
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from cachetools import LRUCache
+from dspy.clients.cache import Cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(Path.home(), ".dspy_learning", "responses.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+EVICT_BATCH = 64
+
+# 本次调用的缓存查询结果列表（True 为命中）；为 None 时不记录。由 tracing.Tracer 为每次 LM 调用设置
+cache_lookups = contextvars.ContextVar("response_cache_lookups", default=None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('bytes', 0);
+"""
+
+
+class SQLiteResponseCache(Cache):
+    """
+    与 dspy.clients.cache.Cache 接口一致的 SQLite 缓存
+    进程内仍保留一层小的内存 LRU，磁盘层负责跨进程共享
+
+    用法:
+        dspy.cache = SQLiteResponseCache("responses.sqlite3", max_bytes=64 * 1024 * 1024, ttl=86400)
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, ttl=None, memory_max_entries=10_000):
+        # 只借用父类的 cache_key 逻辑，磁盘层由 SQLite 替代
+        super().__init__(
+            enable_disk_cache=False,
+            enable_memory_cache=memory_max_entries > 0,
+            disk_cache_dir="",
+            memory_max_entries=max(memory_max_entries, 1),
+        )
+        self.enable_disk_cache = True
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        if self.enable_memory_cache:
+            self.memory_cache = LRUCache(maxsize=memory_max_entries)
+        # 内存层条目的写入时间（TTL 用）单独存放，memory_cache 里与父类一样只存响应本身，
+        # save_memory_cache / load_memory_cache 和直接读 memory_cache[key] 的代码都不受影响
+        self._memory_created = LRUCache(maxsize=max(memory_max_entries, 1))
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程共享，每个线程各用一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _memory_get(self, key):
+        """内存层中未过期的响应，没有时返回 None"""
+        if not self.enable_memory_cache:
+            return None
+        with self._lock:
+            value = self.memory_cache.get(key)
+            created = self._memory_created.get(key)
+        if value is None or self.ttl is None:
+            return value
+        if created is None:
+            # 没有记录写入时间（如 load_memory_cache 载入的条目）时以磁盘上的为准；磁盘上也没有则视为未过期
+            row = self._connect().execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return value
+            created = row[0]
+            with self._lock:
+                self._memory_created[key] = created
+        return None if self._expired(created) else value
+
+    def __contains__(self, key):
+        if self._memory_get(key) is not None:
+            return True
+        row = self._connect().execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and not self._expired(row[0])
+
+    def _read(self, key):
+        # 内存层命中不回写访问时间，磁盘上的 LRU 顺序只反映跨进程的读取
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+
+        conn = self._connect()
+        row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1]):
+            with self._transaction() as conn:
+                self._delete(conn, key)
+            return None
+
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        value = pickle.loads(row[0])
+        if self.enable_memory_cache:
+            with self._lock:
+                self.memory_cache[key] = value
+                self._memory_created[key] = row[1]
+        return value
+
+    def get(self, request, ignored_args_for_cache_key=None):
+        try:
+            key = self.cache_key(request, ignored_args_for_cache_key)
+        except Exception:
+            logger.debug(f"Failed to generate cache key for request: {request}")
+            return None
+
+        response = self._read(key)
+        lookups = cache_lookups.get()
+        if lookups is not None:
+            lookups.append(response is not None)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        response = copy.deepcopy(response)
+        if hasattr(response, "usage"):
+            # 命中缓存时没有真正调用 LM，清空 usage
+            response.usage = {}
+            response.cache_hit = True
+        return response
+
+    def put(self, request, value, ignored_args_for_cache_key=None, enable_memory_cache=True):
+        try:
+            key = self.cache_key(request, ignored_args_for_cache_key)
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"Failed to cache value for request: {request}, {e}")
+            return
+
+        now = time.time()
+        if self.enable_memory_cache and enable_memory_cache:
+            with self._lock:
+                self.memory_cache[key] = value
+                self._memory_created[key] = now
+
+        with self._transaction() as conn:
+            row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            delta = len(blob) - (row[0] if row else 0)
+            conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+            self._evict(conn)
+
+    def _delete(self, conn, key):
+        row = conn.execute("DELETE FROM responses WHERE key = ? RETURNING size", (key,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE meta SET value = value - ? WHERE name = 'bytes'", (row[0],))
+
+    def _evict(self, conn):
+        """按最近访问时间淘汰，直到总大小不超过 max_bytes"""
+        total = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+        conn.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (max(total, 0),))
+
+    def reset_memory_cache(self):
+        super().reset_memory_cache()
+        with self._lock:
+            self._memory_created.clear()
+
+    def load_memory_cache(self, filepath):
+        super().load_memory_cache(filepath)
+        # 载入的条目没有写入时间，过期与否按磁盘上的记录判断
+        with self._lock:
+            self._memory_created.clear()
+
+    def clear(self):
+        self.reset_memory_cache()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+
+    def stats(self):
+        """返回本进程的命中统计以及磁盘上的条目数、总大小"""
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        size = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def cache_from_env():
+    """按环境变量创建缓存；LM_CACHE=0 时返回 None"""
+    if os.getenv("LM_CACHE", "1") == "0":
+        return None
+    ttl = os.getenv("LM_CACHE_TTL")
+    return SQLiteResponseCache(
+        path=os.getenv("LM_CACHE_PATH", DEFAULT_PATH),
+        max_bytes=int(os.getenv("LM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        ttl=float(ttl) if ttl else None,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看或清空 LM 响应缓存")
+    parser.add_argument("--path", default=os.getenv("LM_CACHE_PATH", DEFAULT_PATH))
+    parser.add_argument("--clear", action="store_true", help="清空缓存")
+    args = parser.parse_args()
+
+    cache = SQLiteResponseCache(args.path)
+    if args.clear:
+        cache.clear()
+        print(f"已清空 {args.path}")
+    stats = cache.stats()
+    print(f"缓存文件: {args.path}")
+    print(f"条目数: {stats['entries']}")
+    print(f"总大小: {stats['bytes'] / 1024:.1f} KiB / {stats['max_bytes'] / 1024 / 1024:.0f} MiB")
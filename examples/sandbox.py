@@ -0,0 +1,305 @@
+"""
+代码执行沙箱（预启动的进程池）
+模型生成的代码不再在当前进程里 exec，而是交给常驻的子进程执行
+
+- 进程池在创建时启动 size 个工作进程，之后的调用复用这些进程，不再付出启动开销
+- 每次执行都有墙钟超时：超时的工作进程会被杀掉并换上新的进程
+- 工作进程设置 RLIMIT_AS（内存上限）与 RLIMIT_CPU（每次执行的 CPU 时间上限）
+- 代码只能使用受限的内置函数（没有 __import__、open、eval、exec 等）
+- 返回结构化结果 ExecutionResult(value, stdout, error, elapsed)
+- 编译缓存：按源码哈希缓存 compile() 后的代码对象，AST 安全检查只做一次；
+  工作进程也按哈希缓存反序列化后的代码对象，重复的代码片段只传一次字节码
+- 批量模式：map(codes) 把多段代码分发到整个进程池并发执行
+
+工作进程的代码在 sandbox_worker.py 中：只依赖标准库，以 `python -I sandbox_worker.py` 启动，不会导入 dspy，
+模块级也不导入 os / subprocess（被执行的代码即使沿帧链回到该模块，也拿不到创建进程的接口）。
+与父进程之间通过标准输入输出按行交换 JSON。资源限制依赖 POSIX 的 resource 模块。
+
+用法:
+    with SandboxPool(size=2, timeout=2.0) as pool:
+        result = pool.run("result = sum(range(10))")
+        print(result.value, result.error, result.elapsed)
+
+        results = pool.map(["result = 1 + 1", "result = 2 ** 10"])
+"""
+
+import ast
+import base64
+import contextlib
+import hashlib
+import json
+import marshal
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sandbox_worker import CODE_CACHE_SIZE
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+@dataclass
+class ExecutionResult:
+    """一次代码执行的结果"""
+
+    value: str | None = None   # result / answer 变量（或最后一个变量）的字符串形式
+    stdout: str = ""           # 代码中 print 的输出
+    error: str | None = None   # 出错时的错误信息，成功时为 None
+    elapsed: float = 0.0       # 执行耗时（秒）
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        if self.error is not None:
+            return f"执行错误: {self.error}"
+        return self.value if self.value is not None else "代码执行成功，但没有返回结果"
+
+
+# ---------------------------------------------------------------- 编译缓存
+
+
+class UnsafeCodeError(Exception):
+    pass
+
+
+# 生成器、协程、帧和 traceback 的内省属性：沿帧链（f_back）可以拿到执行代码的模块的全局变量
+_FORBIDDEN_ATTRS = frozenset({
+    "gi_frame", "gi_code", "gi_yieldframe", "gi_yieldfrom",
+    "cr_frame", "cr_code", "cr_await",
+    "ag_frame", "ag_code", "ag_await",
+    "f_back", "f_globals", "f_locals", "f_builtins", "f_code",
+    "tb_frame", "tb_next",
+})
+
+
+def check_code(tree):
+    """
+    静态安全检查：禁止 import、global/nonlocal，以及任何以下划线开头的属性或名称
+    （__class__、__subclasses__ 等是逃出受限内置函数的常见途径），
+    并禁止生成器 / 协程 / 帧 / traceback 的内省属性（gi_frame、f_back、f_globals 等）
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            raise UnsafeCodeError("不允许 import")
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            raise UnsafeCodeError("不允许 global / nonlocal")
+        if isinstance(node, ast.Attribute) and (node.attr.startswith("_") or node.attr in _FORBIDDEN_ATTRS):
+            raise UnsafeCodeError(f"不允许访问属性 {node.attr}")
+        if isinstance(node, ast.Name) and node.id.startswith("__"):
+            raise UnsafeCodeError(f"不允许使用名称 {node.id}")
+
+
+@dataclass
+class CompiledCode:
+    key: str
+    bytecode: str | None = None   # base64 编码的 marshal 字节码
+    error: str | None = None      # 语法错误或安全检查失败的原因
+
+
+class CodeCache:
+    """按源码哈希缓存编译结果（包括失败结果），LRU 淘汰，线程安全"""
+
+    def __init__(self, max_entries=CODE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            tree = ast.parse(source, mode="exec")
+            check_code(tree)
+            code = compile(tree, "<generated>", "exec")
+            entry = CompiledCode(key, bytecode=base64.b64encode(marshal.dumps(code)).decode("ascii"))
+        except SyntaxError as e:
+            entry = CompiledCode(key, error=f"SyntaxError: {e.msg}（第 {e.lineno} 行）")
+        except UnsafeCodeError as e:
+            entry = CompiledCode(key, error=f"不安全的代码: {e}")
+
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+# ---------------------------------------------------------------- 进程池
+
+
+class _Worker:
+    def __init__(self, memory_limit_mb):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_PATH, str(memory_limit_mb or 0)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        # 该工作进程已缓存的代码哈希（工作进程会淘汰旧条目，收到 missing 时重发字节码）
+        self.known_keys = set()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def _send(self, payload, deadline):
+        self.process.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+        ready, _, _ = select.select([self.process.stdout], [], [], max(0.0, deadline - time.perf_counter()))
+        if not ready:
+            return None
+        line = self.process.stdout.readline()
+        return json.loads(line) if line else None
+
+    def request(self, compiled, cpu_limit, timeout):
+        """发送一次执行请求；超时或进程异常退出时返回 None"""
+        deadline = time.perf_counter() + timeout
+        payload = {"key": compiled.key, "cpu_limit": cpu_limit}
+        if compiled.key not in self.known_keys:
+            payload["bytecode"] = compiled.bytecode
+        response = self._send(payload, deadline)
+        if response is not None and response.get("missing"):
+            payload["bytecode"] = compiled.bytecode
+            response = self._send(payload, deadline)
+        if response is not None:
+            self.known_keys.add(compiled.key)
+        return response
+
+    def kill(self):
+        with contextlib.suppress(OSError):
+            self.process.kill()
+        self.process.wait()
+
+
+class SandboxPool:
+    """
+    预启动的沙箱进程池，线程安全
+
+    Args:
+        size: 工作进程数（即最大并发执行数）
+        timeout: 每次执行的墙钟超时（秒）
+        cpu_limit: 每次执行的 CPU 时间上限（秒）
+        memory_limit_mb: 每个工作进程可额外使用的内存（MB）
+    """
+
+    def __init__(self, size=2, timeout=2.0, cpu_limit=2, memory_limit_mb=256, code_cache=None):
+        self.size = size
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.code_cache = code_cache or CodeCache()
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(_Worker(memory_limit_mb))
+
+    def run(self, code, timeout=None):
+        """执行一段代码，返回 ExecutionResult"""
+        if self._closed:
+            raise RuntimeError("SandboxPool 已关闭")
+        timeout = timeout or self.timeout
+        compiled = self.code_cache.get(code)
+        if compiled.error is not None:
+            # 语法错误、不安全的代码直接返回，不占用工作进程
+            return ExecutionResult(error=compiled.error)
+
+        worker = self._idle.get()
+        start = time.perf_counter()
+        try:
+            response = None
+            if worker.alive():
+                with contextlib.suppress(OSError, ValueError):
+                    response = worker.request(compiled, self.cpu_limit, timeout)
+            if response is None:
+                # 超时或工作进程崩溃（如触发 CPU 硬限制）：换一个新进程
+                elapsed = time.perf_counter() - start
+                worker.kill()
+                worker = _Worker(self.memory_limit_mb)
+                error = f"执行超时（{timeout}s）" if elapsed >= timeout else "工作进程异常退出"
+                return ExecutionResult(error=error, elapsed=elapsed)
+            return ExecutionResult(**response)
+        finally:
+            self._idle.put(worker)
+
+    def map(self, codes, timeout=None):
+        """批量执行多段代码，按输入顺序返回 ExecutionResult 列表"""
+        codes = list(codes)
+        if not codes:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.size, len(codes))) as executor:
+            return list(executor.map(lambda code: self.run(code, timeout), codes))
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with contextlib.suppress(OSError):
+                worker.process.stdin.close()
+            worker.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    """进程级共享的沙箱进程池（首次使用时创建，进程退出时关闭）"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            import atexit
+
+            _default_pool = SandboxPool()
+            atexit.register(_default_pool.close)
+    return _default_pool
+
+
+if __name__ == "__main__":
+    with SandboxPool(size=2, timeout=1.0) as pool:
+        for snippet in [
+            "result = sum(range(10))",
+            "print('hello')\nanswer = 42",
+            "while True:\n    pass",
+            "x = [0] * (10 ** 9)",
+            "import os",
+            "result = ().__class__.__base__",
+            "result = sum(range(5))",
+        ]:
+            r = pool.run(snippet)
+            print(f"{snippet.splitlines()[0]!r:<32} -> value={r.value!r} stdout={r.stdout!r} error={r.error!r} {r.elapsed * 1000:.1f}ms")
+
+        snippets = [f"result = {i} * {i}" for i in range(8)] * 4
+        start = time.perf_counter()
+        results = pool.map(snippets)
+        print(f"\n批量执行 {len(snippets)} 段代码: {(time.perf_counter() - start) * 1000:.1f}ms，"
+              f"结果 {[r.value for r in results[:8]]}")
+        print(f"编译缓存: 命中 {pool.code_cache.hits}，未命中 {pool.code_cache.misses}")
@@ -0,0 +1,171 @@
+"""
+沙箱工作进程（由 sandbox.SandboxPool 以 `python -I sandbox_worker.py <memory_limit_mb>` 启动）
+从标准输入按行读取执行请求（JSON），执行代码对象后把结果按行写回标准输出
+
+被执行的代码可以沿帧链回到本模块，因此模块级只导入不涉及进程和文件系统的标准库：
+os、subprocess、sys、contextlib（它的属性里有 os）都只在函数内部导入，用完即释放，
+执行代码时调用栈上的各帧都不持有这些模块
+"""
+
+import base64
+import builtins
+import io
+import json
+import marshal
+import time
+from collections import OrderedDict
+
+MAX_STDOUT_CHARS = 10_000
+CODE_CACHE_SIZE = 1024
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs", "all", "any", "bool", "dict", "divmod", "enumerate", "filter", "float", "int",
+        "isinstance", "len", "list", "map", "max", "min", "pow", "print", "range", "reversed",
+        "round", "set", "sorted", "str", "sum", "tuple", "zip",
+        "ArithmeticError", "Exception", "KeyError", "IndexError", "TypeError", "ValueError",
+        "ZeroDivisionError",
+    )
+}
+
+
+class _CPULimitExceeded(Exception):
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise _CPULimitExceeded("超出 CPU 时间限制")
+
+
+def _current_vm_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _install_limits(memory_limit_mb):
+    """注册 SIGXCPU 处理函数，并设置 RLIMIT_AS：在进程当前占用的基础上再允许 memory_limit_mb"""
+    try:
+        import resource
+        import signal
+    except ImportError:  # Windows 上没有 resource，只保留超时控制
+        return
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    if not memory_limit_mb:
+        return
+    limit = _current_vm_bytes() + memory_limit_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _set_cpu_limit(cpu_limit):
+    """RLIMIT_CPU 是进程累计值，每次执行前按已用 CPU 时间重新设定软限制"""
+    if not cpu_limit:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(used + cpu_limit) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def _swap_stdout(stream):
+    """把 sys.stdout 换成 stream，返回原来的对象（sys 只在这里导入，不留在调用方的帧里）"""
+    import sys
+
+    previous, sys.stdout = sys.stdout, stream
+    return previous
+
+
+def _read_stdin():
+    import sys
+
+    return sys.stdin
+
+
+def _memory_limit_from_argv():
+    import sys
+
+    return int(sys.argv[1]) if len(sys.argv) > 1 else 0
+
+
+def extract_value(local_vars):
+    """与原 safe_execute 一致：优先 result，其次 answer，否则取最后一个变量"""
+    for name in ("result", "answer"):
+        if name in local_vars:
+            return local_vars[name]
+    if local_vars:
+        return list(local_vars.values())[-1]
+    return None
+
+
+def execute(code, cpu_limit=None):
+    """在当前进程中以受限的内置函数执行代码（源码或代码对象），返回结果字典"""
+    stdout = io.StringIO()
+    start = time.perf_counter()
+    _set_cpu_limit(cpu_limit)
+    previous = _swap_stdout(stdout)
+    try:
+        local_vars = {}
+        exec(code, {"__builtins__": SAFE_BUILTINS}, local_vars)
+        value = extract_value(local_vars)
+        value = None if value is None else str(value)
+        error = None
+    except _CPULimitExceeded as e:
+        value, error = None, str(e)
+    except MemoryError:
+        value, error = None, "超出内存限制"
+    except BaseException as e:  # SystemExit 等也不能让工作进程退出
+        value, error = None, f"{type(e).__name__}: {e}"
+    finally:
+        _swap_stdout(previous)
+    return {
+        "value": value,
+        "stdout": stdout.getvalue()[:MAX_STDOUT_CHARS],
+        "error": error,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def worker_main(memory_limit_mb):
+    _install_limits(memory_limit_mb)
+
+    # 协议通道使用原始的标准输出，被执行代码的输出在 execute 中另行捕获
+    channel = _swap_stdout(io.StringIO())
+    code_objects = OrderedDict()
+    for line in _read_stdin():
+        request = json.loads(line)
+        key = request["key"]
+        if "bytecode" in request:
+            code_objects[key] = marshal.loads(base64.b64decode(request["bytecode"]))
+            if len(code_objects) > CODE_CACHE_SIZE:
+                code_objects.popitem(last=False)
+        code = code_objects.get(key)
+        if code is None:
+            response = {"missing": True}
+        else:
+            code_objects.move_to_end(key)
+            response = execute(code, request.get("cpu_limit"))
+        channel.write(json.dumps(response, ensure_ascii=False) + "\n")
+        channel.flush()
+
+
+if __name__ == "__main__":
+    worker_main(_memory_limit_from_argv())
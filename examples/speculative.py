@@ -0,0 +1,144 @@
+"""
+投机式约束生成
+带验证的重试循环是严格串行的：每一次长度、格式检查失败都要多付出一次完整的往返。
+这里同时发起多个候选，返回第一个通过验证的，其余候选直接取消
+
+两种模式:
+- concurrent: 并发调用模块 k 次，每个候选使用不同的 rollout_id（绕过请求缓存）和较高的温度；
+  最多同时在途 max_parallel 个，失败一个再补发一个，总数不超过 k
+- n: 在一次请求中用 n=k 采样（只适用于 Predict / ChainOfThought 这类接受 config 的模块），
+  按顺序取第一个通过验证的 completion
+
+max_parallel 限制同时在途的候选数，从而限制 token 开销；
+约束输出的尾延迟约为一次往返，而不是最多 max_retries 次
+
+用法:
+    result = speculate(
+        dspy.ChainOfThought(ShortSummary),
+        validator=lambda pred: len(pred.summary) <= 50,
+        inputs={"text": text},
+        k=3,
+    )
+    if result.passed:
+        print(result.prediction.summary)
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import dspy
+
+from batch_inference import run_sync
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpeculationResult:
+    """
+    prediction: 第一个通过验证的候选；都没有通过时为最后一个完成的候选
+    passed: 是否有候选通过验证
+    launched / completed: 发起、完成的候选数
+    elapsed: 耗时（秒）
+    """
+
+    prediction: Any
+    passed: bool
+    launched: int
+    completed: int
+    elapsed: float
+
+
+async def _call(module, inputs, lm=None, config=None):
+    kwargs = dict(inputs, config=config) if config else dict(inputs)
+    with dspy.context(lm=lm) if lm is not None else dspy.context():
+        if hasattr(module, "aforward"):
+            return await module.acall(**kwargs)
+        return await asyncio.to_thread(module, **kwargs)
+
+
+async def _speculate_concurrent(module, validator, inputs, k, max_parallel, temperature):
+    lm = dspy.settings.lm
+    pending, launched, completed = set(), 0, 0
+    last, last_error = None, None
+
+    def launch():
+        nonlocal launched
+        candidate_lm = lm.copy(rollout_id=launched, temperature=temperature)
+        pending.add(asyncio.ensure_future(_call(module, inputs, lm=candidate_lm)))
+        launched += 1
+
+    while launched < min(max_parallel, k):
+        launch()
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                completed += 1
+                try:
+                    prediction = task.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                last = prediction
+                if validator(prediction):
+                    return prediction, True, launched, completed
+            while launched < k and len(pending) < max_parallel:
+                launch()
+    finally:
+        # 已经有结果（或出错）时，取消仍在途的候选
+        for task in pending:
+            task.cancel()
+
+    if last is None and last_error is not None:
+        raise last_error
+    return last, False, launched, completed
+
+
+async def _speculate_n(module, validator, inputs, k, temperature):
+    prediction = await _call(module, inputs, config={"n": k, "temperature": temperature})
+    completions = getattr(prediction, "completions", None)
+    candidates = [completions[i] for i in range(len(completions))] if completions else [prediction]
+    for candidate in candidates:
+        if validator(candidate):
+            return candidate, True, 1, 1
+    return candidates[-1], False, 1, 1
+
+
+async def aspeculate(module, validator, inputs, k=3, max_parallel=None, temperature=1.0, mode="concurrent"):
+    """
+    返回 SpeculationResult
+
+    Args:
+        module: dspy 模块
+        validator: prediction -> bool
+        inputs: 模块的关键字参数
+        k: 候选总数上限
+        max_parallel: 同时在途的候选数上限（默认等于 k）
+        temperature: 候选的采样温度
+        mode: "concurrent" 或 "n"
+    """
+    start = time.perf_counter()
+    max_parallel = max(1, min(max_parallel or k, k))
+    if mode == "concurrent":
+        prediction, passed, launched, completed = await _speculate_concurrent(
+            module, validator, inputs, k, max_parallel, temperature
+        )
+    elif mode == "n":
+        prediction, passed, launched, completed = await _speculate_n(module, validator, inputs, k, temperature)
+    else:
+        raise ValueError(f"未知的模式: {mode}（可选 concurrent / n）")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"投机生成: 发起 {launched} 个候选，完成 {completed} 个，{'通过' if passed else '全部未通过'}（{elapsed:.2f}s）")
+    return SpeculationResult(prediction, passed, launched, completed, elapsed)
+
+
+def speculate(module, validator, inputs, k=3, max_parallel=None, temperature=1.0, mode="concurrent"):
+    """aspeculate 的同步版本"""
+    return run_sync(aspeculate(module, validator, inputs, k, max_parallel, temperature, mode))
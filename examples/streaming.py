@@ -0,0 +1,160 @@
+"""
+流式输出 + 增量约束检查
+普通的约束检查要等完整回答返回后才能进行：一个超长的摘要要整段生成完才被判定失败。
+这里用 dspy.streamify 逐段接收输出，每收到一段就用约束的 check_partial 检查已生成的前缀，
+一旦确定违反（摘要超过 50 字、答案开头不是「结论:」……）立即中止这次生成并开始重试，
+节省剩余的生成时间和 token
+
+- 直接解析原始的流式片段（ChatAdapter 的 [[ ## 字段 ## ]] 格式），而不是用 StreamListener：
+  StreamListener 为了识别字段结束会缓冲最近 10 个片段，检查会因此滞后
+
+- 约束沿用 constraints.py 中声明在输出字段上的约束
+- 生成完成后仍会做一次完整检查（NumberRange、MinChars 等只能在结束时判断的约束）
+- 重试与修复的逻辑与 Constrained 相同
+- on_chunk(field, text) 回调可用于实时显示输出，on_abort(violation) 在中止一次生成时调用
+
+用法:
+    summarizer = StreamingConstrained(
+        dspy.Predict(ShortSummary),
+        on_chunk=lambda field, text: print(text, end="", flush=True),
+    )
+    result = summarizer(text=long_text)
+    print(summarizer.aborts, summarizer.aborted_chars)
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+
+import dspy
+from litellm import ModelResponseStream
+
+from batch_inference import run_sync
+from constraints import Constrained
+
+logger = logging.getLogger(__name__)
+
+_HEADER_RE = re.compile(r"\[\[ ## (\w+) ## \]\]")
+
+
+class _FieldStream:
+    """增量解析 ChatAdapter 格式的流式输出，给出当前正在生成的字段及其已生成的部分"""
+
+    def __init__(self):
+        self.text = ""
+        self.field = None
+        self._value_start = 0
+
+    def feed(self, chunk):
+        """追加一段输出，返回 (字段, 已生成的值)；还没有进入任何字段时字段为 None"""
+        # 新出现的字段标记一定在上一次文本末尾附近开始
+        search_from = max(self._value_start, len(self.text) - 64, 0)
+        self.text += chunk
+        for header in _HEADER_RE.finditer(self.text, search_from):
+            self.field, self._value_start = header.group(1), header.end()
+        if self.field is None:
+            return None, ""
+        value = self.text[self._value_start:]
+        # 去掉可能是下一个字段标记的开头
+        cut = value.find("[[")
+        value = value[:cut] if cut >= 0 else value.removesuffix("[")
+        return self.field, value.strip()
+
+
+class StreamingConstrained(Constrained):
+    """
+    Args:
+        module: 被包装的模块（需要支持 aforward，如 Predict / ChainOfThought）
+        signature: 声明了约束的 Signature（默认取模块中唯一的 Predict 的 Signature）
+        max_retries: 违反约束后的最大重试次数
+        feedback_field: 重试时把违反说明追加到这个输入字段
+        repair: 重试用完后是否调用约束的修复
+        on_chunk: 每收到一段输出时调用 on_chunk(field, text)
+        on_abort: 因违反约束中止一次生成时调用 on_abort(violation)
+    """
+
+    def __init__(
+        self, module, signature=None, max_retries=2, feedback_field=None, repair=True, on_chunk=None, on_abort=None
+    ):
+        super().__init__(module, signature, max_retries=max_retries, feedback_field=feedback_field, repair=repair)
+        self.on_chunk = on_chunk
+        self.on_abort = on_abort
+        self.aborts = 0
+        self.aborted_chars = 0
+        self.aborted_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    async def _attempt(self, inputs, original_inputs):
+        """
+        流式执行一次生成
+        返回 (prediction, violation)：中途违反约束时 prediction 为 None
+        """
+        program = dspy.streamify(self.module, is_async_program=True)
+        fields = set(self.validator.fields)
+        parser = _FieldStream()
+        partial = {}
+        prediction = violation = None
+        start = time.perf_counter()
+
+        async def consume():
+            nonlocal prediction, violation
+            async for value in program(**inputs):
+                if isinstance(value, ModelResponseStream):
+                    field, text = parser.feed(value.choices[0].delta.content or "")
+                    if field not in fields:
+                        continue
+                    delta = text[len(partial.get(field, "")):] if text.startswith(partial.get(field, "")) else ""
+                    if self.on_chunk and delta:
+                        self.on_chunk(field, delta)
+                    partial[field] = text
+                    violation = self.validator.check_partial(field, text, original_inputs)
+                    if violation is not None:
+                        # 不直接 break：提前关闭 streamify 的生成器会抛出 BaseExceptionGroup；
+                        # 取消当前任务，让取消从生成器内部传播出去，同时取消进行中的 LM 调用
+                        asyncio.current_task().cancel()
+                elif isinstance(value, dspy.Prediction):
+                    prediction = value
+
+        task = asyncio.ensure_future(consume())
+        try:
+            await task
+        except asyncio.CancelledError:
+            if violation is None:
+                raise
+            with self._stats_lock:
+                self.aborts += 1
+                self.aborted_chars += sum(len(text) for text in partial.values())
+                self.aborted_seconds += time.perf_counter() - start
+            if self.on_abort:
+                self.on_abort(violation)
+            return None, violation
+        return prediction, None
+
+    async def aforward(self, **inputs):
+        attempt_inputs = dict(inputs)
+        prediction, violations = None, []
+        for attempt in range(self.max_retries + 1):
+            with dspy.context(lm=self._attempt_lm(attempt)):
+                candidate, violation = await self._attempt(attempt_inputs, inputs)
+            if violation is not None:
+                logger.info(f"第 {attempt + 1} 次生成中途违反约束，已中止: {violation}")
+                violations = [violation]
+            else:
+                prediction = candidate
+                violations = self.validator(prediction, inputs)
+                if not violations:
+                    return prediction
+                logger.info(f"第 {attempt + 1} 次生成违反约束: {'；'.join(map(str, violations))}")
+            attempt_inputs = self._retry_inputs(inputs, violations)
+
+        if prediction is None:
+            # 每一次都被中途中止：最后再完整生成一次，交给约束的修复兜底
+            with dspy.context(lm=self._attempt_lm(self.max_retries + 1)):
+                prediction = await self.module.acall(**attempt_inputs)
+            violations = self.validator(prediction, inputs)
+        return self._finish(prediction, violations, inputs)
+
+    def forward(self, **inputs):
+        return run_sync(self.aforward(**inputs))
@@ -0,0 +1,172 @@
+"""
+本地桩后端 (Stub Backend)
+在本机启动一个兼容 OpenAI Chat Completions 接口的 HTTP 服务，
+用于离线测试 lm_factory 的连接池和 keep-alive 复用效果
+应答内容与 stub_lm.StubLM 相同（基于规则），示例可以完整跑通
+支持 stream=true（SSE 分段输出）；客户端中途断开时停止发送，并计入 stats["aborted"]
+usage 中与 StubLM 一样报告模拟的前缀缓存命中数（prompt_tokens_details.cached_tokens）
+"""
+
+import json
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stub_lm import PromptPrefixCache, rule_based_responder, stream_pieces
+from token_count import estimate_message_tokens, estimate_tokens
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才会保持连接，客户端连接池才有复用的意义
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 头部和正文分两次写出，关闭 Nagle 以免 keep-alive 连接上出现 40ms 的延迟确认
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.backend._count("connections")
+
+    def do_POST(self):
+        backend = self.server.backend
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if backend.latency:
+            time.sleep(backend.latency)
+
+        messages = request.get("messages", [])
+        content = backend.responder(messages)
+        prompt_tokens = estimate_message_tokens(messages)
+        completion_tokens = estimate_tokens(content)
+        cached_tokens = backend.prefix_cache.lookup(messages)
+        if request.get("stream"):
+            self._stream(request, content, prompt_tokens, completion_tokens, cached_tokens)
+            return
+
+        body = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }).encode("utf-8")
+
+        backend._count("requests")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, content, prompt_tokens, completion_tokens, cached_tokens):
+        """以 SSE 分段发送回答（chunked 编码，保持 keep-alive）"""
+        backend = self.server.backend
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def event(choices, **extra):
+            payload = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        events = [
+            event([{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}])
+            for piece in stream_pieces(content)
+        ]
+        events.append(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            }
+            events.append(event([], usage=usage))
+        events.append(b"data: [DONE]\n\n")
+
+        backend._count("requests")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for data in events:
+                if backend.chunk_latency:
+                    time.sleep(backend.chunk_latency)
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            backend._count("aborted")
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        # 关闭默认的访问日志，避免干扰示例输出
+        pass
+
+
+class StubBackend:
+    """
+    本地 OpenAI 兼容桩服务
+
+    用法:
+        with StubBackend(latency=0.01) as backend:
+            lm = dspy.LM("openai/stub", api_base=backend.url, api_key="stub")
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, chunk_latency=0.0, responder=None):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.responder = responder or rule_based_responder
+        self.stats = {"connections": 0, "requests": 0, "aborted": 0}
+        self.prefix_cache = PromptPrefixCache()
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.backend = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
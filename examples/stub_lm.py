@@ -0,0 +1,350 @@
+"""
+离线桩语言模型 (Stub LM)
+一个不访问网络、结果确定的 LM，可直接用于 dspy.configure(lm=...)
+
+- 从 ChatAdapter / JSONAdapter / LabelAdapter 生成的提示中解析输入输出字段
+- 按字段名给出基于规则的回答（情感分类、代码生成、ReAct 工具调用等）
+- 支持注入固定延迟，模拟网络往返
+- 支持流式输出（dspy.streamify）：回答按小段依次发送，可为每一段注入延迟
+- 模拟服务端的前缀缓存：usage 中报告与之前请求相同的最长前缀（prompt_tokens_details.cached_tokens）
+
+用途：在没有 API 密钥的情况下跑通所有示例，并单独测量框架侧的开销
+（提示格式化、输出解析、重试循环等）
+
+用法:
+    LM_BACKEND=stub python examples/01_basic.py
+    LM_BACKEND=stub LM_STUB_LATENCY=0.2 python examples/04_optimization.py
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import dspy
+from dspy.clients.cache import request_cache
+from litellm import ModelResponseStream
+from litellm.types.utils import Delta, StreamingChoices
+
+from token_count import estimate_message_tokens, estimate_tokens
+
+# ChatAdapter 在系统消息中列出输出字段，形如: 1. `answer` (str): 问题的答案
+_OUTPUT_FIELDS_RE = re.compile(r"Your output fields are:\n(.*?)\nAll interactions", re.S)
+_FIELD_RE = re.compile(r"^\d+\. `(\w+)` \((.*?)\)", re.M)
+_INPUT_BLOCK_RE = re.compile(r"\[\[ ## (\w+) ## \]\]\n(.*?)(?=\n\n\[\[ ## |\n\nRespond with|\n\nAnswer with|\Z)", re.S)
+_TOOL_RE = re.compile(r"\(\d+\) (\w+), whose description is <desc>(.*?)</desc>\. It takes arguments (\{.*?\})\.", re.S)
+_EXPRESSION_RE = re.compile(r"[\d.]+(?:\s*[-+*/%]\s*\(?\s*[\d.]+\)?)+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+POSITIVE_WORDS = ["棒", "喜欢", "满意", "好", "不错", "美味", "推荐", "快"]
+NEGATIVE_WORDS = ["差", "失望", "贵", "不值", "坏", "糟糕", "不推荐", "低"]
+
+STREAM_CHUNK_CHARS = 4
+
+TRANSLATIONS = {
+    "Hello, how are you?": "你好，你好吗？",
+    "Good morning!": "早上好！",
+    "Thank you very much.": "非常感谢。",
+}
+
+
+def message_text(message):
+    """消息正文；content 为分段列表（如带 cache_control 标记）时拼接其中的文本"""
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def parse_output_fields(messages):
+    """从系统消息中解析输出字段 [(名称, 类型), ...]"""
+    for msg in messages:
+        if msg.get("role") != "system":
+            continue
+        match = _OUTPUT_FIELDS_RE.search(message_text(msg))
+        if match:
+            return _FIELD_RE.findall(match.group(1))
+    return []
+
+
+def parse_inputs(messages):
+    """解析最后一条用户消息中的输入字段"""
+    for msg in reversed(messages):
+        if msg.get("role") == "user":
+            return {name: value.strip() for name, value in _INPUT_BLOCK_RE.findall(message_text(msg))}
+    return {}
+
+
+def classify_sentiment(text):
+    """基于关键词的情感分类"""
+    # 先看否定词，「不值」「不推荐」里也含有正面关键词
+    negative = sum(word in text for word in NEGATIVE_WORDS)
+    positive = sum(word in text for word in POSITIVE_WORDS) - ("不推荐" in text)
+    if negative > positive:
+        return "消极"
+    if positive > negative:
+        return "积极"
+    return "中性"
+
+
+def _main_text(inputs):
+    """取最主要的输入文本（question/text/problem 等）"""
+    for name in ("question", "text", "review", "problem", "task", "premises", "english", "topic"):
+        if name in inputs:
+            return inputs[name]
+    return next(iter(inputs.values()), "")
+
+
+def _generate_code(inputs):
+    numbers = _NUMBER_RE.findall(_main_text(inputs))
+    values = ", ".join(numbers[:30]) or "0"
+    return f"numbers = [{values}]\nresult = sum(numbers)"
+
+
+def _react_step(messages, inputs):
+    """ReAct: 第一步调用一个合适的工具，拿到观察结果后 finish"""
+    system = message_text(messages[0]) if messages else ""
+    tools = [(name, desc, args) for name, desc, args in _TOOL_RE.findall(system) if name != "finish"]
+    # 轨迹字段会被展开成 thought_0 / observation_0 ... 等块
+    if "observation_0" in inputs or not tools:
+        return "已获得足够信息，可以结束。", "finish", {}
+
+    question = _main_text(inputs)
+    expression = _EXPRESSION_RE.search(question)
+    name, _, args = tools[0]
+    value = question
+    for tool_name, desc, tool_args in tools:
+        is_calculator = "计算" in desc or "calc" in tool_name
+        if expression and is_calculator:
+            name, args, value = tool_name, tool_args, expression.group(0)
+            break
+        if not expression and not is_calculator:
+            name, args, value = tool_name, tool_args, question
+            break
+
+    arg_names = re.findall(r"'(\w+)': \{", args)
+    tool_args = {arg_names[0]: value} if arg_names else {}
+    return f"需要调用 {name} 获取信息。", name, tool_args
+
+
+def _react_parallel_step(messages, inputs):
+    """并行 ReAct: 问题中每个算式、或用「和/与/、」连接的每个主题各发起一个工具调用"""
+    if "observation_0" in inputs:
+        return "已获得足够信息，可以结束。", [{"name": "finish", "args": {}}]
+
+    question = _main_text(inputs)
+    expressions = _EXPRESSION_RE.findall(question)
+    parts = expressions or [part for part in re.split(r"[和与、,，]", question.rstrip("？?。")) if part.strip()]
+    calls = []
+    for part in parts:
+        # 复用单步的选择逻辑，为每个子问题挑选合适的工具
+        _, name, args = _react_step(messages, {"question": part.strip()})
+        calls.append({"name": name, "args": args})
+    return f"同时发起 {len(calls)} 个工具调用。", calls
+
+
+def _field_value(name, type_, inputs):
+    """按字段名/类型生成一个确定的值"""
+    text = _main_text(inputs)
+
+    if type_.startswith("Literal["):
+        options = re.findall(r"'(.*?)'", type_)
+        if name == "sentiment" and classify_sentiment(text) in options:
+            return classify_sentiment(text)
+        return options[0] if options else ""
+    if type_ in ("int", "float"):
+        return "0"
+    if type_ == "bool":
+        return "True"
+
+    if name in ("reasoning", "thinking", "step_by_step", "next_thought", "analysis"):
+        return f"逐步分析：先理解「{text[:20].strip()}」，再得出结论。"
+    if name == "sentiment":
+        return classify_sentiment(text)
+    if name == "confidence":
+        return "85%"
+    if name == "summary":
+        return text.strip().replace("\n", "")[:40]
+    if name == "code":
+        return _generate_code(inputs)
+    if name in ("translation", "chinese"):
+        return TRANSLATIONS.get(text.strip(), f"（译文）{text.strip()}")
+    if name == "email":
+        recipient = inputs.get("recipient", "您")
+        return f"{recipient}，您好：\n\n现将项目最新进展汇报如下：各项任务均按计划推进，预计本月底完成第一阶段交付。\n\n祝好！"
+    if name == "answer" and "结论" in text:
+        return f"结论: 关于「{text.splitlines()[0][:20]}」的回答。"
+    if name == "answer" and "observation_0" in inputs:
+        # ReAct 的 extract 步骤：直接用最后一个工具观察结果作答
+        observations = [value for key, value in inputs.items() if key.startswith("observation_")]
+        return observations[-2] if len(observations) > 1 else observations[-1]
+    return f"关于「{text[:20].strip()}」的{name}"
+
+
+def rule_based_responder(messages):
+    """按 ChatAdapter（或 JSONAdapter）格式给出规则化的回答"""
+    fields = parse_output_fields(messages)
+    inputs = parse_inputs(messages)
+    names = [name for name, _ in fields]
+
+    values = {}
+    if "next_tool_name" in names:
+        thought, tool_name, tool_args = _react_step(messages, inputs)
+        values.update(next_thought=thought, next_tool_name=tool_name, next_tool_args=json.dumps(tool_args, ensure_ascii=False))
+    if "next_tool_calls" in names:
+        thought, calls = _react_parallel_step(messages, inputs)
+        values.update(next_thought=thought, next_tool_calls=json.dumps(calls, ensure_ascii=False))
+    for name, type_ in fields or [("answer", "str")]:
+        values.setdefault(name, _field_value(name, type_, inputs))
+
+    system = message_text(messages[0]) if messages else ""
+    if "Outputs will be a JSON object" in system:
+        return json.dumps(values, ensure_ascii=False)
+    if "Answer with the label only" in system:
+        # classify.LabelAdapter：只回答标签本身
+        return str(next(iter(values.values())))
+
+    blocks = [f"[[ ## {name} ## ]]\n{value}" for name, value in values.items()]
+    blocks.append("[[ ## completed ## ]]")
+    return "\n\n".join(blocks)
+
+
+def stream_pieces(content, size=STREAM_CHUNK_CHARS):
+    """把回答切成流式输出的小段"""
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+class PromptPrefixCache:
+    """
+    模拟 DeepSeek / OpenAI 的自动前缀缓存：按整条消息的粒度，
+    找出与之前的请求相同的最长前缀，返回其 token 数（不模拟最小长度和过期）
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # 模拟的是服务端缓存：LM 的副本（lm.copy() 等）共享同一个
+        return self
+
+    def lookup(self, messages):
+        """返回命中缓存的 prompt token 数，并记下本次请求的所有前缀"""
+        digest = hashlib.sha256()
+        keys = []
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True, ensure_ascii=False, default=str).encode())
+            keys.append(digest.copy().hexdigest())
+        with self._lock:
+            hit = 0
+            for length, key in enumerate(keys, 1):
+                if key in self._seen:
+                    self._seen.move_to_end(key)
+                    hit = length
+                else:
+                    self._seen[key] = None
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return estimate_message_tokens(messages[:hit])
+
+
+class StubLM(dspy.BaseLM):
+    """
+    离线桩 LM
+
+    Args:
+        latency: 每次调用注入的延迟（秒），模拟网络往返
+        chunk_latency: 流式输出时每一段的延迟（秒），模拟逐 token 生成
+        responder: messages -> str 的应答函数，默认为 rule_based_responder
+        cache: 是否经过 dspy.cache（与 dspy.LM 相同的请求缓存），命中时不再注入延迟
+    """
+
+    def __init__(self, model="stub/rule-based", latency=0.0, chunk_latency=0.0, responder=None, cache=False, **kwargs):
+        super().__init__(model=model, cache=cache, **kwargs)
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.responder = responder or rule_based_responder
+        self.prefix_cache = PromptPrefixCache()
+
+    def _request(self, prompt, messages, kwargs):
+        kwargs = dict(kwargs)
+        cache = kwargs.pop("cache", self.cache)
+        messages = messages or [{"role": "user", "content": prompt}]
+        return dict(model=self.model, messages=messages, **{**self.kwargs, **kwargs}), cache
+
+    def _completion(self, request):
+        messages = request["messages"]
+        content = self.responder(messages)
+        n = request.get("n") or 1
+        prompt_tokens = estimate_message_tokens(messages)
+        completion_tokens = estimate_tokens(content)
+        cached_tokens = self.prefix_cache.lookup(messages)
+        return SimpleNamespace(
+            id=f"stub-{uuid.uuid4().hex}",
+            model=self.model,
+            choices=[
+                SimpleNamespace(
+                    index=i,
+                    message=SimpleNamespace(role="assistant", content=content, tool_calls=None),
+                    finish_reason="stop",
+                )
+                for i in range(n)
+            ],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens * n,
+                "total_tokens": prompt_tokens + completion_tokens * n,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        )
+
+    def _complete(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._completion(request)
+
+    async def _acomplete(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._completion(request)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        request, cache = self._request(prompt, messages, kwargs)
+        complete = request_cache(cache_arg_name="request")(self._complete) if cache else self._complete
+        return self._track_usage(complete(request=request))
+
+    def _track_usage(self, response):
+        # 与 dspy.LM 相同：真正发起的请求才计入 track_usage（命中请求缓存时 usage 已被清空）
+        if not getattr(response, "cache_hit", False) and dspy.settings.usage_tracker:
+            dspy.settings.usage_tracker.add_usage(self.model, dict(response.usage))
+        return response
+
+    async def _astream(self, request):
+        """与 dspy.LM 的流式路径一致：逐段发送到 settings.send_stream，最后返回完整的回答"""
+        stream = dspy.settings.send_stream
+        caller_predict = dspy.settings.caller_predict
+        response = await self._acomplete(request)
+        for piece in stream_pieces(response.choices[0].message.content):
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            chunk = ModelResponseStream(
+                model=self.model,
+                choices=[StreamingChoices(index=0, delta=Delta(role="assistant", content=piece))],
+            )
+            if caller_predict is not None:
+                chunk.predict_id = id(caller_predict)
+            await stream.send(chunk)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        request, cache = self._request(prompt, messages, kwargs)
+        if dspy.settings.send_stream is not None:
+            return await self._astream(request)
+        complete = request_cache(cache_arg_name="request")(self._acomplete) if cache else self._acomplete
+        return self._track_usage(await complete(request=request))
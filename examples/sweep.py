@@ -0,0 +1,222 @@
+"""
+优化器超参数扫描
+对一组优化器配置（如 LabeledFewShot 的 k = 0, 2, 5, 8）分别编译，然后在同一个测试集上评估，
+输出「准确率 - token 开销 - 延迟」对照表
+
+- 编译经过 compile_cache，配置不变时直接加载
+- 对只有一个 Predict 的程序，先用适配器渲染出每个 (配置, 输入) 实际发送的提示词，
+  提示词相同的只运行一次（例如 k 超过训练集大小时，几个配置的 demos 完全一样）
+- 去重后的所有调用在有界线程池上并发执行（可限速），LM 请求仍经过响应缓存
+- token 数优先取 LM 返回的 usage；命中缓存时没有 usage，按渲染出的提示词和输出字段估算
+
+用法:
+    report = run_sweep(
+        LabeledFewShot,
+        dspy.Predict(SentimentAnalysis),
+        trainset=labeled_examples,
+        devset=test_set,
+        metric=exact_match,
+        grid=[{"k": 0}, {"k": 2}, {"k": 5}],
+    )
+    print(report.format_table())
+"""
+
+import hashlib
+import json
+import logging
+import statistics
+import time
+from dataclasses import dataclass
+
+import dspy
+
+from compile_cache import cached_compile
+from parallel_eval import RateLimiter, program_key, run_parallel
+from token_count import estimate_message_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SweepRow:
+    """
+    一个配置的汇总
+    accuracy: 平均得分（0-100）
+    prompt_tokens / completion_tokens: 每条样本的平均 token 数
+    latency_ms: 每条样本的平均延迟
+    calls: 去重后由该配置实际发起的调用数（与前面的配置提示词相同的样本不计）
+    """
+
+    name: str
+    config: dict
+    accuracy: float
+    prompt_tokens: float
+    completion_tokens: float
+    latency_ms: float
+    calls: int
+    errors: int
+
+
+class SweepReport(dspy.Prediction):
+    """
+    扫描结果
+    - rows: [SweepRow]，与 grid 顺序一致
+    - results: {配置名: [(example, prediction, 得分)]}
+    - programs: {配置名: 编译后的程序}
+    - pairs / unique_calls: (配置, 输入) 组合数、去重后的实际调用数
+    """
+
+    def __init__(self, rows, results, programs, pairs, unique_calls):
+        super().__init__(rows=rows, results=results, programs=programs, pairs=pairs, unique_calls=unique_calls)
+
+    def __repr__(self):
+        return f"SweepReport(rows=<{len(self.rows)} configs>, pairs={self.pairs}, unique_calls={self.unique_calls})"
+
+    def best(self):
+        """准确率最高的配置；准确率相同时取 token 开销更小的"""
+        return max(self.rows, key=lambda row: (row.accuracy, -(row.prompt_tokens + row.completion_tokens)))
+
+    def format_table(self):
+        width = max([16] + [len(row.name) + 2 for row in self.rows])
+        lines = [f"{'配置':<{width}}{'准确率':>8}{'prompt':>10}{'completion':>12}{'延迟(ms)':>10}{'新调用':>8}"]
+        for row in self.rows:
+            lines.append(
+                f"{row.name:<{width}}{row.accuracy:>7.1f}%{row.prompt_tokens:>10.1f}{row.completion_tokens:>12.1f}"
+                f"{row.latency_ms:>10.1f}{row.calls:>8}"
+            )
+        lines.append(f"\n{self.pairs} 个 (配置, 输入) 组合，去重后实际调用 {self.unique_calls} 次")
+        return "\n".join(lines)
+
+
+def config_name(config):
+    return ", ".join(f"{key}={value}" for key, value in config.items()) or "default"
+
+
+def _prompt_key(program, example):
+    """
+    (程序, 输入) 的去重键
+    只有一个 Predict 的程序按渲染后的提示词计算；其余程序按程序状态 + 输入计算
+    返回 (键, 渲染信息)，渲染信息为 (adapter, signature, messages)，无法渲染时为 None
+    """
+    inputs = example.inputs().toDict()
+    predictors = program.predictors()
+    if len(predictors) != 1:
+        payload = {"program": program_key(program), "inputs": inputs}
+        rendered = None
+    else:
+        predictor = predictors[0]
+        # Classify 等自带适配器的 Predict 用自己的适配器渲染
+        adapter = getattr(predictor, "adapter", None) or dspy.settings.adapter or dspy.ChatAdapter()
+        # 按输入动态选择示例的程序（knn_fewshot.KNNProgram）按本次选中的示例渲染
+        demos = program.select(**inputs) if hasattr(program, "select") else predictor.demos
+        messages = adapter.format(predictor.signature, demos, inputs)
+        payload = {"type": type(program).__qualname__, "messages": messages, "config": predictor.config}
+        rendered = (adapter, predictor.signature, messages)
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest(), rendered
+
+
+def _run_call(job):
+    program, example, rendered = job
+    start = time.perf_counter()
+    with dspy.context(track_usage=True):
+        prediction = program(**example.inputs())
+    latency = time.perf_counter() - start
+
+    usage = prediction.get_lm_usage() or {}
+    prompt_tokens = sum(u.get("prompt_tokens") or 0 for u in usage.values())
+    completion_tokens = sum(u.get("completion_tokens") or 0 for u in usage.values())
+    if not prompt_tokens and rendered is not None:
+        # 命中响应缓存：没有 usage，按渲染出的提示词和回答估算
+        adapter, signature, messages = rendered
+        prompt_tokens = estimate_message_tokens(messages)
+        completion_tokens = estimate_tokens(adapter.format_assistant_message_content(signature, prediction))
+    return prediction, prompt_tokens, completion_tokens, latency
+
+
+def run_sweep(
+    optimizer_factory,
+    student,
+    trainset,
+    devset,
+    metric,
+    grid,
+    num_threads=8,
+    requests_per_second=None,
+    max_retries=3,
+    display_progress=False,
+):
+    """
+    返回 SweepReport
+
+    Args:
+        optimizer_factory: optimizer_factory(**config) 创建优化器，如 LabeledFewShot
+        student: 待编译的学生模块
+        trainset / devset: 训练集、测试集
+        metric: metric(example, prediction) -> 得分
+        grid: 优化器配置列表，如 [{"k": 0}, {"k": 2}]
+        num_threads / requests_per_second / max_retries: 并发、限速与限流重试
+    """
+    programs = {}
+    for config in grid:
+        programs[config_name(config)] = cached_compile(optimizer_factory(**config), student, trainset=trainset)
+
+    # 渲染所有 (配置, 输入) 的提示词，相同的只保留第一次出现的
+    jobs, owners, keys = {}, {}, {}
+    for name, program in programs.items():
+        for index, example in enumerate(devset):
+            key, rendered = _prompt_key(program, example)
+            keys[name, index] = key
+            if key not in jobs:
+                jobs[key] = (program, example, rendered)
+                owners[key] = name
+
+    rate_limiter = RateLimiter(requests_per_second) if requests_per_second else None
+    outcomes = run_parallel(
+        _run_call,
+        list(jobs.values()),
+        num_threads=num_threads,
+        rate_limiter=rate_limiter,
+        max_retries=max_retries,
+        display_progress=display_progress,
+    )
+    outcomes = dict(zip(jobs, outcomes))
+
+    rows, results = [], {}
+    for config in grid:
+        name = config_name(config)
+        results[name] = []
+        prompt_tokens, completion_tokens, latencies, scores = [], [], [], []
+        errors = 0
+        for index, example in enumerate(devset):
+            outcome, error = outcomes[keys[name, index]]
+            if error is not None:
+                errors += 1
+                logger.error(f"[{name}] 样本运行失败: {example}: {error}")
+                results[name].append((example, dspy.Prediction(), 0.0))
+                scores.append(0.0)
+                continue
+            prediction, prompt, completion, latency = outcome
+            score = float(metric(example, prediction))
+            results[name].append((example, prediction, score))
+            scores.append(score)
+            prompt_tokens.append(prompt)
+            completion_tokens.append(completion)
+            latencies.append(latency)
+
+        rows.append(
+            SweepRow(
+                name=name,
+                config=config,
+                accuracy=round(100 * statistics.fmean(scores), 2) if scores else 0.0,
+                prompt_tokens=statistics.fmean(prompt_tokens) if prompt_tokens else 0.0,
+                completion_tokens=statistics.fmean(completion_tokens) if completion_tokens else 0.0,
+                latency_ms=1000 * statistics.fmean(latencies) if latencies else 0.0,
+                calls=sum(1 for owner in owners.values() if owner == name),
+                errors=errors,
+            )
+        )
+
+    pairs = len(grid) * len(devset)
+    logger.info(f"超参数扫描: {pairs} 个组合，去重后调用 {len(jobs)} 次")
+    return SweepReport(rows=rows, results=results, programs=programs, pairs=pairs, unique_calls=len(jobs))
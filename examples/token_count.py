@@ -0,0 +1,31 @@
+"""
+本地 token 数估算
+不依赖具体模型的分词器，用于桩 LM 的 usage 统计和提示长度预算
+
+估算规则:
+- 每个中日韩字符约 1 个 token
+- 连续的字母/数字约每 4 个字符 1 个 token
+- 其余标点符号每个 1 个 token（空白不计）
+"""
+
+import re
+
+_TOKEN_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+def estimate_tokens(text):
+    """估算一段文本的 token 数"""
+    if not text:
+        return 0
+    total = 0
+    for piece in _TOKEN_RE.findall(text):
+        if len(piece) > 4:
+            total += (len(piece) + 3) // 4
+        else:
+            total += 1
+    return total
+
+
+def estimate_message_tokens(messages):
+    """估算一组 chat 消息的 token 数（每条消息额外计 4 个 token 的格式开销）"""
+    return sum(estimate_tokens(str(m.get("content", ""))) + 4 for m in messages)
@@ -0,0 +1,149 @@
+"""
+工具调用结果缓存
+智能体经常在不同步骤、不同问题之间用相同参数重复调用同一个工具；
+对纯函数工具（calculate、search_info 等）直接复用上一次的结果
+
+- 按工具声明纯度：pure=True 的结果永久有效（直到被 LRU 淘汰）；
+  非纯工具只有设置了 ttl 才缓存，超过 ttl 秒后重新调用；两者都没有则不缓存
+- 所有工具共享一个有上限的 LRU（ToolCache），键为 (工具名, 规范化后的参数)
+- 抛出异常的调用不缓存
+- 每个工具单独统计命中/未命中次数和命中率
+
+用法:
+    cache = ToolCache(max_entries=1024)
+    tools = [
+        memoize_tool(dspy.Tool(calculate), pure=True, cache=cache),
+        memoize_tool(dspy.Tool(get_weather), ttl=600, cache=cache),
+    ]
+    agent = dspy.ReAct(Question, tools=tools)
+    print(cache.stats())
+"""
+
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import dspy
+
+_MISSING = object()
+
+
+def call_key(name, kwargs):
+    """(工具名, 参数) 的规范化键：参数顺序无关，非 JSON 类型按 str 处理"""
+    return name, json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ToolCache:
+    """线程安全的工具结果 LRU 缓存，带按工具的命中统计"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _counter(self, name):
+        return self._stats.setdefault(name, {"hits": 0, "misses": 0})
+
+    def get(self, key, ttl=None):
+        """返回缓存的结果；不存在或已过期时返回 _MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (ttl is None or time.monotonic() - entry[1] <= ttl):
+                self._entries.move_to_end(key)
+                self._counter(key[0])["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._counter(key[0])["misses"] += 1
+            return _MISSING
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def hits(self):
+        return sum(s["hits"] for s in self._stats.values())
+
+    @property
+    def misses(self):
+        return sum(s["misses"] for s in self._stats.values())
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """{工具名: {"hits", "misses", "hit_rate"}}"""
+        with self._lock:
+            return {
+                name: {**s, "hit_rate": s["hits"] / (s["hits"] + s["misses"]) if s["hits"] + s["misses"] else 0.0}
+                for name, s in self._stats.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def memoize_tool(tool, pure=False, ttl=None, cache=None):
+    """
+    返回带缓存的 dspy.Tool（名称、描述、参数 schema 与原工具一致）
+
+    Args:
+        tool: dspy.Tool 或普通函数
+        pure: 声明为纯函数：相同参数总是返回相同结果
+        ttl: 非纯工具的结果有效期（秒）
+        cache: 共享的 ToolCache；不传则为该工具单独创建一个
+    """
+    if not isinstance(tool, dspy.Tool):
+        tool = dspy.Tool(tool)
+    if not pure and ttl is None:
+        return tool
+
+    cache = cache if cache is not None else ToolCache()
+    ttl = None if pure else ttl
+    func = tool.func
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def memoized(**kwargs):
+            key = call_key(tool.name, kwargs)
+            result = cache.get(key, ttl)
+            if result is _MISSING:
+                result = await func(**kwargs)
+                cache.put(key, result)
+            return result
+
+    else:
+
+        @functools.wraps(func)
+        def memoized(**kwargs):
+            key = call_key(tool.name, kwargs)
+            result = cache.get(key, ttl)
+            if result is _MISSING:
+                result = func(**kwargs)
+                cache.put(key, result)
+            return result
+
+    return dspy.Tool(
+        memoized,
+        name=tool.name,
+        desc=tool.desc,
+        args=tool.args,
+        arg_types=tool.arg_types,
+        arg_desc=tool.arg_desc,
+    )
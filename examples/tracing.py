@@ -0,0 +1,338 @@
+"""
+结构化调用追踪
+示例里只能手动翻 lm.history[-1]["messages"] 看发送了什么，看不出哪个模块、哪一步花了多少时间和 token。
+Tracer 通过 DSPy 回调（与 benchmarks/bench_overhead.py 的 PhaseTimer 相同的方式）为每次
+模块 forward、LM 调用、工具调用记录一个 span:
+
+- 墙钟时间；父 span（按调用嵌套关系，跨 run_parallel / batch 的工作线程同样有效）
+- 排队时间：在 run_parallel 线程池、abatch 信号量和限速器中等待的时间（记在任务的第一个 span 上）
+- LM span: prompt / completion token 数、命中前缀缓存的 token 数、是否命中本地响应缓存
+  （命中时没有发起请求，token 数为 None）。是否命中取自 response_cache 对这次调用的查询结果；
+  没有经过 SQLiteResponseCache 时只能从 usage 判断：有 usage 为 False，否则为 None（未知，
+  例如没有开启 track_usage 的流式调用不返回 usage）
+- 异常信息
+
+导出:
+- to_jsonl(path): 每行一个 span
+- to_chrome_trace(path): Chrome trace-event 格式，用 chrome://tracing 或 https://ui.perfetto.dev 打开看火焰图
+
+开销（benchmarks/bench_tracing.py 实测）：只要注册了任何回调，DSPy 就会对每个被装饰的调用
+执行 inspect.getcallargs 并分发回调，这部分与 Tracer 本身无关；Tracer 自己的工作是每个 span
+一次 perf_counter_ns、一次对象创建和几次 ContextVar 读写。两者合计让零延迟桩 LM 上的调用
+（以及命中本地响应缓存的调用）慢了约 5%-55%（相对实测的不追踪耗时），其中大部分是 DSPy 的回调分发。
+局限：「开销低于 1%」只对真正发往后端、往返延迟在数十毫秒以上的调用成立；
+以缓存命中为主的运行（例如重复运行的示例）不满足，这类场景按需开启追踪
+
+用法:
+    with trace() as tracer:
+        optimized_model(text="这家餐厅的食物很美味")
+    print(tracer.format_table())
+    tracer.to_chrome_trace("trace.json")
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import dspy
+from dspy.dsp.utils.settings import thread_local_overrides
+from dspy.utils.callback import ACTIVE_CALL_ID, BaseCallback
+from dspy.utils.usage_tracker import UsageTracker
+
+from prefix_cache import cached_prompt_tokens
+from response_cache import cache_lookups
+
+DEFAULT_MAX_SPANS = 100_000
+
+# 任务进入队列的时间（perf_counter_ns），由 run_parallel / abatch 设置，被任务的第一个 span 取走
+_queued_at = contextvars.ContextVar("tracing_queued_at", default=None)
+
+
+def mark_queued(at=None):
+    """记录当前任务开始排队的时间；之后的第一个 span 把到它开始为止的时间记为排队时间"""
+    _queued_at.set(time.perf_counter_ns() if at is None else at)
+
+
+@dataclass(slots=True)
+class Span:
+    """
+    一次调用
+    kind: module / lm / tool
+    时间单位为纳秒（perf_counter_ns）；prompt_tokens 等为 None 表示没有数据
+    """
+
+    span_id: str
+    parent_id: str | None
+    kind: str
+    name: str
+    thread_id: int
+    start_ns: int
+    end_ns: int = 0
+    queue_ns: int = 0
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    cached_tokens: int | None = None
+    cache_hit: bool | None = None
+    error: str | None = None
+
+    @property
+    def wall_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    @property
+    def queue_ms(self):
+        return self.queue_ns / 1e6
+
+
+# (模块类型, Signature) -> span 名称；Signature 的字段描述每次重新生成代价较高
+_module_names = {}
+
+
+def _module_name(instance):
+    signature = getattr(instance, "signature", None)
+    key = (type(instance), signature)
+    name = _module_names.get(key)
+    if name is None:
+        name = type(instance).__name__
+        if isinstance(signature, type):
+            # with_updated_fields 等生成的 Signature 没有自己的类名，用字段描述代替
+            label = signature.__name__ if signature.__name__ != "StringSignature" else signature.signature
+            name = f"{name}({label})"
+        _module_names[key] = name
+    return name
+
+
+class Tracer(BaseCallback):
+    """
+    Args:
+        max_spans: 最多保留的 span 数（超出后丢弃最早的）
+    """
+
+    def __init__(self, max_spans=DEFAULT_MAX_SPANS):
+        self.spans = deque(maxlen=max_spans)
+        self._open = {}
+        self._usage = {}
+
+    def clear(self):
+        self.spans.clear()
+
+    def _start(self, call_id, kind, name):
+        now = time.perf_counter_ns()
+        queue_ns = 0
+        queued_at = _queued_at.get()
+        if queued_at is not None:
+            queue_ns = max(0, now - queued_at)
+            _queued_at.set(None)
+        span = Span(call_id, ACTIVE_CALL_ID.get(), kind, name, threading.get_ident(), now, queue_ns=queue_ns)
+        self._open[call_id] = span
+        return span
+
+    def _end(self, call_id, exception):
+        span = self._open.pop(call_id, None)
+        if span is None:
+            return None
+        span.end_ns = time.perf_counter_ns()
+        if exception is not None:
+            span.error = f"{type(exception).__name__}: {exception}"
+        self.spans.append(span)
+        return span
+
+    def _start_lm(self, call_id, instance):
+        self._start(call_id, "lm", instance.model)
+        # 每次调用单独的 usage 统计和缓存查询记录，并发调用互不干扰（与 prefix_cache.PrefixCacheAdapter 相同）；
+        # 直接设置 DSPy 的 ContextVar，省去 dspy.context() 的开销
+        tracker, lookups = UsageTracker(), []
+        outer = dspy.settings.usage_tracker
+        overrides = thread_local_overrides.get()
+        tokens = (thread_local_overrides.set({**overrides, "usage_tracker": tracker}), cache_lookups.set(lookups))
+        self._usage[call_id] = (tracker, lookups, outer, tokens)
+
+    def _end_lm(self, call_id, exception):
+        tracker, lookups, outer, (overrides_token, lookups_token) = self._usage.pop(call_id)
+        cache_lookups.reset(lookups_token)
+        thread_local_overrides.reset(overrides_token)
+        span = self._end(call_id, exception)
+        entries = []
+        for model, usage in tracker.usage_data.items():
+            for entry in usage:
+                entries.append(entry)
+                # 转交给外层的 usage 统计（track_usage / get_lm_usage 仍然有效）
+                if outer is not None:
+                    outer.add_usage(model, entry)
+        if span is None or exception is not None:
+            return
+        if lookups:
+            span.cache_hit = any(lookups)
+        elif entries:
+            span.cache_hit = False
+        if entries:
+            span.prompt_tokens = sum(entry.get("prompt_tokens") or 0 for entry in entries)
+            span.completion_tokens = sum(entry.get("completion_tokens") or 0 for entry in entries)
+            cached = [c for c in map(cached_prompt_tokens, entries) if c is not None]
+            span.cached_tokens = sum(cached) if cached else None
+
+    def on_module_start(self, call_id, instance, inputs):
+        # 只有 dspy.LM 会触发 on_lm_*，其他 BaseLM 子类（如 StubLM）按模块回调处理
+        if isinstance(instance, dspy.BaseLM):
+            self._start_lm(call_id, instance)
+        else:
+            self._start(call_id, "module", _module_name(instance))
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        if call_id in self._usage:
+            self._end_lm(call_id, exception)
+        else:
+            self._end(call_id, exception)
+
+    def on_lm_start(self, call_id, instance, inputs):
+        self._start_lm(call_id, instance)
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        self._end_lm(call_id, exception)
+
+    def on_tool_start(self, call_id, instance, inputs):
+        self._start(call_id, "tool", instance.name)
+
+    def on_tool_end(self, call_id, outputs, exception=None):
+        self._end(call_id, exception)
+
+    def summary(self):
+        """
+        按 (kind, name) 汇总，按总耗时降序
+        - self_ms 为扣除子 span 之后的耗时（子 span 并发执行时按 0 截断）
+        - 模块的 token 数包含其下所有 LM 调用
+        """
+        spans = list(self.spans)
+        by_id = {span.span_id: span for span in spans}
+        child_ns = {}
+        tokens = {}
+        for span in spans:
+            if span.parent_id is not None:
+                child_ns[span.parent_id] = child_ns.get(span.parent_id, 0) + span.end_ns - span.start_ns
+            if span.prompt_tokens is None:
+                continue
+            counts = (span.prompt_tokens, span.completion_tokens or 0, span.cached_tokens or 0)
+            span_id = span.span_id
+            while span_id in by_id:
+                total = tokens.get(span_id, (0, 0, 0))
+                tokens[span_id] = tuple(a + b for a, b in zip(total, counts))
+                span_id = by_id[span_id].parent_id
+
+        rows = {}
+        for span in spans:
+            row = rows.setdefault(
+                (span.kind, span.name),
+                {
+                    "kind": span.kind,
+                    "name": span.name,
+                    "calls": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "self_ms": 0.0,
+                    "queue_ms": 0.0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cached_tokens": 0,
+                    "cache_hits": 0,
+                },
+            )
+            wall_ns = span.end_ns - span.start_ns
+            row["calls"] += 1
+            row["errors"] += span.error is not None
+            row["total_ms"] += wall_ns / 1e6
+            row["self_ms"] += max(0, wall_ns - child_ns.get(span.span_id, 0)) / 1e6
+            row["queue_ms"] += span.queue_ms
+            prompt_tokens, completion_tokens, cached_tokens = tokens.get(span.span_id, (0, 0, 0))
+            row["prompt_tokens"] += prompt_tokens
+            row["completion_tokens"] += completion_tokens
+            row["cached_tokens"] += cached_tokens
+            row["cache_hits"] += bool(span.cache_hit)
+        return sorted(rows.values(), key=lambda row: -row["total_ms"])
+
+    def format_table(self):
+        rows = self.summary()
+        width = max([16] + [len(row["name"]) + 2 for row in rows])
+        lines = [
+            f"{'类型':<8}{'名称':<{width}}{'次数':>6}{'总耗时(ms)':>12}{'自身(ms)':>10}{'排队(ms)':>10}"
+            f"{'prompt':>8}{'completion':>12}{'缓存命中':>8}"
+        ]
+        for row in rows:
+            lines.append(
+                f"{row['kind']:<8}{row['name']:<{width}}{row['calls']:>6}{row['total_ms']:>12.2f}"
+                f"{row['self_ms']:>10.2f}{row['queue_ms']:>10.2f}{row['prompt_tokens']:>8}"
+                f"{row['completion_tokens']:>12}{row['cache_hits']:>8}"
+            )
+        return "\n".join(lines)
+
+    def to_jsonl(self, path):
+        """每行一个 span（时间换算为毫秒，start_ms 相对第一个 span）"""
+        spans = list(self.spans)
+        origin = min((span.start_ns - span.queue_ns for span in spans), default=0)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for span in spans:
+                record = asdict(span)
+                start_ns, end_ns, queue_ns = record.pop("start_ns"), record.pop("end_ns"), record.pop("queue_ns")
+                record.update(
+                    start_ms=(start_ns - origin) / 1e6, wall_ms=(end_ns - start_ns) / 1e6, queue_ms=queue_ns / 1e6
+                )
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return path
+
+    def to_chrome_trace(self, path):
+        """Chrome trace-event 格式（完整事件 ph="X"，排队时间单独记为 queue 事件）"""
+        spans = list(self.spans)
+        origin = min((span.start_ns - span.queue_ns for span in spans), default=0)
+        pid = os.getpid()
+        events = []
+        for span in spans:
+            if span.queue_ns:
+                events.append({
+                    "name": f"queue {span.name}",
+                    "cat": "queue",
+                    "ph": "X",
+                    "ts": (span.start_ns - span.queue_ns - origin) / 1e3,
+                    "dur": span.queue_ns / 1e3,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                })
+            args = {
+                key: value
+                for key, value in (
+                    ("prompt_tokens", span.prompt_tokens),
+                    ("completion_tokens", span.completion_tokens),
+                    ("cached_tokens", span.cached_tokens),
+                    ("cache_hit", span.cache_hit),
+                    ("error", span.error),
+                )
+                if value is not None
+            }
+            events.append({
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": (span.start_ns - origin) / 1e3,
+                "dur": (span.end_ns - span.start_ns) / 1e3,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": args,
+            })
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False), encoding="utf-8")
+        return path
+
+
+@contextmanager
+def trace(tracer=None):
+    """在 with 块内启用追踪（追加到现有回调之后），返回 Tracer"""
+    tracer = tracer or Tracer()
+    with dspy.context(callbacks=[*dspy.settings.callbacks, tracer]):
+        yield tracer
@@ -0,0 +1,215 @@
+"""
+本地向量检索
+一个完全离线的小型向量库，代替把整个知识库拼进提示词
+
+- HashingEmbedder: 字符 n-gram + 哈希技巧生成稠密向量，无需模型、无需网络，结果确定
+- VectorStore: 向量存放在一个 NumPy 矩阵中
+    - 暴力检索：一次矩阵乘法算出全部余弦相似度，再取 top-k
+    - 近似检索（IVF）：先用 k-means 把向量分到 nlist 个簇，查询时只扫描最近的 nprobe 个簇
+    - save / load：保存为单个 .npz 文件
+- VectorRetriever: 与 dspy.Retrieve 兼容的检索器（dspy.configure(rm=...)）
+
+用法:
+    store = VectorStore()
+    store.add(knowledge_base)
+    dspy.configure(rm=VectorRetriever(store))
+
+    retrieve = dspy.Retrieve(k=3)
+    passages = retrieve("Python 主要用于哪些领域？").passages
+"""
+
+import json
+import math
+import zlib
+from collections import Counter
+
+import dspy
+import numpy as np
+from dspy.dsp.utils import dotdict
+
+ASSIGN_BATCH = 16384  # k-means 分配时每批计算相似度的向量数
+
+
+class HashingEmbedder:
+    """
+    字符 n-gram 哈希向量
+    中文按字切分就是天然的 n-gram，英文单词也会被切成字符片段，不依赖分词器
+
+    Args:
+        dim: 向量维度（哈希桶数）
+        ngram_range: 使用的 n-gram 长度范围
+    """
+
+    def __init__(self, dim=1024, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+
+    def config(self):
+        return {"dim": self.dim, "ngram_range": list(self.ngram_range)}
+
+    def _ngrams(self, text):
+        text = "".join(text.lower().split())
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i:i + n]
+
+    def __call__(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for gram, count in Counter(self._ngrams(text)).items():
+                # crc32 在不同进程间结果一致（内置 hash 对字符串是随机化的），保存的索引才能复用
+                h = zlib.crc32(gram.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dim] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    """返回得分最高的 k 个下标（降序）"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def _assign(vectors, centroids):
+    """每个向量最相似的中心下标；分批计算，不一次性生成 N x nlist 的相似度矩阵"""
+    assignments = np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        batch = vectors[start:start + ASSIGN_BATCH]
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+def _kmeans(vectors, nlist, iterations=10, seed=0):
+    """球面 k-means：向量已归一化，用内积作为相似度"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        # 按簇累加，内存只有 nlist x dim（one-hot 矩阵在百万级向量时要占几 GB）
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # 空簇保留原来的中心
+        centroids = np.where((counts > 0)[:, None], sums / np.maximum(norms, 1e-12), centroids)
+    return centroids, _assign(vectors, centroids)
+
+
+class VectorStore:
+    """
+    基于 NumPy 矩阵的向量库
+
+    Args:
+        embedder: texts -> 归一化向量矩阵 的函数，默认 HashingEmbedder
+        nlist: IVF 簇数，默认约为 sqrt(文档数)
+        nprobe: 近似检索时扫描的簇数
+        brute_force_threshold: 文档数少于该值时总是暴力检索
+    """
+
+    def __init__(self, embedder=None, nlist=None, nprobe=4, brute_force_threshold=5000):
+        self.embedder = embedder or HashingEmbedder()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.brute_force_threshold = brute_force_threshold
+        self.texts = []
+        self.vectors = None
+        self._centroids = None
+        self._lists = None
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, texts):
+        """添加文档，返回新文档的下标"""
+        texts = list(texts)
+        if not texts:
+            return []
+        start = len(self.texts)
+        vectors = self.embedder(texts)
+        self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+        self.texts.extend(texts)
+        # 文档变化后 IVF 需要重建，下次近似检索时懒加载
+        self._centroids = None
+        self._lists = None
+        return list(range(start, len(self.texts)))
+
+    def build_ivf(self):
+        nlist = self.nlist or max(1, int(math.sqrt(len(self.texts))))
+        nlist = min(nlist, len(self.texts))
+        self._centroids, assignments = _kmeans(self.vectors, nlist)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+
+    def _search_brute_force(self, query_vector, k):
+        scores = self.vectors @ query_vector
+        ids = _top_k(scores, k)
+        return ids, scores[ids]
+
+    def _search_ivf(self, query_vector, k):
+        if self._centroids is None:
+            self.build_ivf()
+        probes = _top_k(self._centroids @ query_vector, self.nprobe)
+        candidates = np.concatenate([self._lists[i] for i in probes])
+        scores = self.vectors[candidates] @ query_vector
+        top = _top_k(scores, k)
+        return candidates[top], scores[top]
+
+    def search(self, query, k=3, approximate=None):
+        """
+        返回 [(下标, 相似度), ...]，按相似度降序
+        approximate 为 None 时，文档数达到 brute_force_threshold 才使用 IVF
+        """
+        if not self.texts:
+            return []
+        if approximate is None:
+            approximate = len(self.texts) >= self.brute_force_threshold
+        query_vector = self.embedder([query])[0]
+        search = self._search_ivf if approximate else self._search_brute_force
+        ids, scores = search(query_vector, k)
+        return [(int(i), float(s)) for i, s in zip(ids, scores)]
+
+    def save(self, path):
+        """保存为 .npz（文本、向量、嵌入器配置）"""
+        config = {"embedder": self.embedder.config(), "nlist": self.nlist, "nprobe": self.nprobe}
+        np.savez(
+            path,
+            vectors=self.vectors if self.vectors is not None else np.zeros((0, 0), dtype=np.float32),
+            texts=np.array(self.texts, dtype=str),
+            config=np.array(json.dumps(config)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            config = json.loads(str(data["config"]))
+            store = cls(HashingEmbedder(**config["embedder"]), nlist=config["nlist"], nprobe=config["nprobe"])
+            store.texts = data["texts"].tolist()
+            store.vectors = data["vectors"] if store.texts else None
+        return store
+
+
+class VectorRetriever:
+    """
+    与 dspy.Retrieve 兼容的检索器
+    dspy.Retrieve 会以 rm(query, k=k) 调用，并读取每个结果的 long_text
+    """
+
+    def __init__(self, store, k=3, approximate=None):
+        self.store = store
+        self.k = k
+        self.approximate = approximate
+
+    def __call__(self, query, k=None, **kwargs):
+        hits = self.store.search(query, k=k or self.k, approximate=self.approximate)
+        return [dotdict(long_text=self.store.texts[i], score=score, pid=i) for i, score in hits]
+
+    def forward(self, query, k=None):
+        """直接当作模块使用时返回 dspy.Prediction(passages=...)"""
+        return dspy.Prediction(passages=[passage.long_text for passage in self(query, k)])
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 示例模块是平铺在 examples/ 下的脚本，直接导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "examples"))
@@ -0,0 +1,48 @@
+import pytest
+
+from bm25 import BM25Index
+
+# 与 05_react_agent.py 中 search_info 的知识库和检索参数一致
+KNOWLEDGE = [
+    "Python是一种高级编程语言，由Guido van Rossum创建于1991年",
+    "DSPy是斯坦福大学开发的语言模型编程框架，用于优化提示词",
+    "ReAct是一种结合推理(Reasoning)和行动(Acting)的AI范式",
+]
+
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    for doc in KNOWLEDGE:
+        index.add(doc)
+    return index
+
+
+def search_info(index, query):
+    return index.search(query, k=1, min_term_len=2, min_relevance=0.7)
+
+
+def test_min_term_len_ignores_single_character_matches(index):
+    assert index.search("北京的人口", k=1)
+    assert index.search("北京的人口", k=1, min_term_len=2) == []
+    assert index.search("Python 和 Java 分别是什么", k=1, min_term_len=2)[0][0] == 0
+
+
+@pytest.mark.parametrize(
+    "query, doc_id",
+    [
+        ("Tell me about python", 0),
+        ("dspy framework", 1),
+        ("Python 3 是什么", 0),
+        ("Python 和 DSPy 分别是什么", 0),
+        ("推理和行动", 2),
+    ],
+)
+def test_english_and_mixed_queries_find_their_document(index, query, doc_id):
+    hits = search_info(index, query)
+    assert hits and hits[0][0] == doc_id
+
+
+@pytest.mark.parametrize("query", ["北京的人口", "Rust语言", "Java是什么"])
+def test_unrelated_queries_fall_below_min_relevance(index, query):
+    assert search_info(index, query) == []
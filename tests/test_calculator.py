@@ -0,0 +1,19 @@
+import time
+
+import pytest
+
+from calculator import MAX_DIGITS, CalculationError, evaluate
+
+
+@pytest.mark.parametrize("expression", ["round(7, -3000000)", f"round(7, {MAX_DIGITS + 1})", "round(7, 1.5)"])
+def test_round_rejects_unbounded_ndigits(expression):
+    start = time.perf_counter()
+    with pytest.raises(CalculationError):
+        evaluate(expression)
+    assert time.perf_counter() - start < 0.1
+
+
+def test_round_within_limits():
+    assert evaluate("round(3.14159, 2)") == 3.14
+    assert evaluate("round(1234, -2)") == 1200
+    assert evaluate("round(2.5)") == 2
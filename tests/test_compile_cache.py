@@ -0,0 +1,22 @@
+from compile_cache import CompileCache
+
+KEY = "0123456789abcdef" * 4
+
+
+def test_clear_only_removes_cache_entries(tmp_path):
+    cache = CompileCache(tmp_path)
+    entries = [tmp_path / f"{KEY}.json", tmp_path / f"{KEY}.npz"]
+    others = [
+        tmp_path / "notes.txt",
+        tmp_path / "program.json",
+        tmp_path / "index.npz",
+        tmp_path / f"{KEY.upper()}.json",
+        tmp_path / f"{KEY}.json.bak",
+    ]
+    for path in entries + others:
+        path.write_text("{}", encoding="utf-8")
+
+    cache.clear()
+
+    assert not any(path.exists() for path in entries)
+    assert all(path.exists() for path in others)
@@ -0,0 +1,16 @@
+import pytest
+
+from context_packing import ContextPacker
+
+
+def test_scores_follow_passages_when_empty_passages_are_dropped():
+    packed = ContextPacker(budget_tokens=8)(
+        ["", "THE BEST passage here", "low relevance filler words"],
+        scores=[0.0, 0.9, 0.1],
+    )
+    assert packed.passages == ["THE BEST passage here"]
+
+
+def test_scores_length_mismatch_raises():
+    with pytest.raises(ValueError):
+        ContextPacker()(["a passage", "another passage"], scores=[0.5])
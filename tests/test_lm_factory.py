@@ -0,0 +1,26 @@
+import asyncio
+
+import httpx
+import litellm
+
+from lm_factory import reset_lm
+
+
+def test_reset_lm_closes_async_client():
+    client = httpx.AsyncClient()
+    litellm.aclient_session = client
+    reset_lm()
+    assert client.is_closed
+    assert litellm.aclient_session is None
+
+
+def test_reset_lm_inside_event_loop_closes_async_client():
+    client = httpx.AsyncClient()
+
+    async def main():
+        litellm.aclient_session = client
+        reset_lm()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert client.is_closed
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+from parallel_react import ParallelReAct
+
+
+def slow(x: str) -> str:
+    """slow"""
+    time.sleep(1.0)
+    return "slow"
+
+
+def fast(x: str) -> str:
+    """fast"""
+    return "fast"
+
+
+def test_timed_out_call_does_not_block_next_step():
+    agent = ParallelReAct("question -> answer", tools=[slow, fast], max_parallel_calls=1, default_timeout=0.2)
+    assert agent._run_calls([("slow", {"x": "1"})]) == ["Execution error in slow: 超时（0.2s）"]
+    assert agent._run_calls([("fast", {"x": "1"})]) == ["fast"]
+
+
+def test_async_path_runs_sync_tools_concurrently_and_times_them_out():
+    def sleepy(x: str) -> str:
+        """sleepy"""
+        time.sleep(0.5)
+        return x
+
+    agent = ParallelReAct("question -> answer", tools=[sleepy, slow], default_timeout=0.8)
+    start = time.perf_counter()
+    observations = asyncio.run(
+        agent._arun_calls([("sleepy", {"x": "a"}), ("sleepy", {"x": "b"}), ("slow", {"x": "1"})])
+    )
+    elapsed = time.perf_counter() - start
+    assert observations == ["a", "b", "Execution error in slow: 超时（0.8s）"]
+    assert elapsed < 0.95
+
+
+def test_non_dict_args_become_error_observations():
+    agent = ParallelReAct("question -> answer", tools=[fast])
+    calls = agent._parse_calls([{"name": "fast", "args": "paris"}, {"name": "fast", "args": {"x": "1"}}])
+    expected = ["Execution error in fast: args 必须是 JSON 对象，收到的是 str: 'paris'", "fast"]
+    assert agent._run_calls(calls) == expected
+    assert asyncio.run(agent._arun_calls(calls)) == expected
+
+
+def test_instructions_are_rewritten_for_multiple_calls():
+    instructions = ParallelReAct("question -> answer", tools=[fast]).react.signature.instructions
+    assert "next_tool_calls" in instructions
+    assert "next_tool_name" not in instructions
+
+
+def test_missing_instruction_text_raises(monkeypatch):
+    import parallel_react
+
+    monkeypatch.setattr(parallel_react, "_INSTRUCTION_REWRITES", [("text that is not there", "x")])
+    with pytest.raises(RuntimeError):
+        ParallelReAct("question -> answer", tools=[fast])
@@ -0,0 +1,27 @@
+import time
+
+from response_cache import SQLiteResponseCache
+
+REQUEST = {"model": "stub", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def test_memory_cache_stores_bare_values_and_round_trips(tmp_path):
+    cache = SQLiteResponseCache(tmp_path / "responses.sqlite3")
+    cache.put(REQUEST, {"answer": 42})
+    key = cache.cache_key(REQUEST)
+    assert cache.memory_cache[key] == {"answer": 42}
+
+    cache.save_memory_cache(str(tmp_path / "memory.pkl"))
+    other = SQLiteResponseCache(tmp_path / "other.sqlite3")
+    other.load_memory_cache(str(tmp_path / "memory.pkl"))
+    assert other.get(REQUEST) == {"answer": 42}
+    assert key in other
+
+
+def test_ttl_applies_to_memory_layer(tmp_path):
+    cache = SQLiteResponseCache(tmp_path / "responses.sqlite3", ttl=0.05)
+    cache.put(REQUEST, {"answer": 42})
+    assert cache.get(REQUEST) == {"answer": 42}
+    time.sleep(0.1)
+    assert cache.get(REQUEST) is None
+    assert cache.cache_key(REQUEST) not in cache
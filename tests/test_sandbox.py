@@ -0,0 +1,63 @@
+import base64
+import marshal
+
+import pytest
+
+from sandbox import CompiledCode, SandboxPool, _Worker
+
+FRAME_ESCAPE = """
+def g(box):
+    yield box[0].gi_frame.f_back
+box = []
+gen = g(box)
+box.append(gen)
+for fr in gen:
+    result = fr.f_back.f_globals['subprocess'].check_output(['id'])
+"""
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with SandboxPool(size=1, timeout=2.0) as pool:
+        yield pool
+
+
+def test_frame_walking_escape_is_rejected(pool):
+    result = pool.run(FRAME_ESCAPE)
+    assert result.value is None
+    assert result.error.startswith("不安全的代码")
+
+
+def test_plain_code_still_runs(pool):
+    assert pool.run("result = sum(range(10))").value == "45"
+
+
+FRAME_SCAN = """
+def g(box):
+    yield box[0].gi_frame.f_back
+box = []
+gen = g(box)
+box.append(gen)
+found = []
+for fr in gen:
+    while fr is not None:
+        for scope in (fr.f_globals, fr.f_locals):
+            for name in ("os", "subprocess", "sys", "contextlib"):
+                if name in scope:
+                    found.append(name)
+        fr = fr.f_back
+result = sorted(set(found))
+"""
+
+
+def test_worker_frames_do_not_hold_process_modules():
+    # 绕过 check_code，直接把代码对象交给工作进程：即使安全检查被绕过，帧链上也拿不到 os / subprocess
+    code = compile(FRAME_SCAN, "<generated>", "exec")
+    compiled = CompiledCode("frame-scan", bytecode=base64.b64encode(marshal.dumps(code)).decode("ascii"))
+    worker = _Worker(memory_limit_mb=0)
+    try:
+        response = worker.request(compiled, cpu_limit=None, timeout=5.0)
+    finally:
+        worker.kill()
+    assert response["error"] is None
+    assert response["value"] == "[]"